@@ -4,6 +4,9 @@ from sqlalchemy import create_engine, text, inspect, types
 from sqlalchemy.exc import ProgrammingError
 from tqdm import tqdm
 
+from src.preprocessing.common.partitions import default_partition, month_range_sql, partition_month, partitions_sql
+from src.preprocessing.common.pgcopy import LOCAL_TIMEZONE
+
 DB_PARAMS = {
     "host": "dtim.essi.upc.edu",
     "port": 5432,
@@ -47,6 +50,29 @@ def table_is_empty(engine, table_name):
         print(f"Error checking if {table_name} is empty: {e}")
         return False
 
+def list_partitions(engine, table_name):
+    """Partitions of *table_name*; empty if it is not partitioned"""
+    return pd.read_sql(partitions_sql(table_name), engine)["relname"].tolist()
+
+def status_months(engine, table_name="bicycle_station_status_clean"):
+    """
+    (year, month) pairs of *table_name* in Barcelona time, from its month
+    partitions. Only the default partition (or an unpartitioned table) is
+    scanned for the months of its rows.
+    """
+    partitions = list_partitions(engine, table_name)
+    months = {partition_month(p) for p in partitions} - {None}
+    if partitions and default_partition(table_name) not in partitions:
+        return sorted(months)
+    scanned = default_partition(table_name) if partitions else table_name
+    months_df = pd.read_sql(f"""
+        SELECT DISTINCT EXTRACT(YEAR FROM month)::INT AS year, EXTRACT(MONTH FROM month)::INT AS month
+        FROM (SELECT date_trunc('month', last_updated AT TIME ZONE '{LOCAL_TIMEZONE}') AS month
+              FROM {scanned} WHERE last_updated IS NOT NULL) months
+        """, engine)
+    months.update((int(year), int(month)) for year, month in zip(months_df["year"], months_df["month"]))
+    return sorted(months)
+
 def drop_tables_if_exist(engine):
     """Drop bicycle station tables if they exist"""
     tables = [
@@ -434,23 +460,18 @@ def create_fact_station_status(engine):
         execute_sql(engine, "ANALYZE dim_ten_minute")
         execute_sql(engine, "ANALYZE dim_station")
         
-        # Get list of unique months to process in larger batches
-        print("Getting distinct months to process in batches...")
-        months_query = """
-        SELECT DISTINCT TO_CHAR(last_updated, 'YYYY-MM') as month_year 
-        FROM bicycle_station_status_clean 
-        ORDER BY month_year
-        """
-        months_df = pd.read_sql(months_query, engine)
-        total_months = len(months_df)
+        # Months to process in larger batches, from the partitions of the clean table
+        print("Getting months to process in batches...")
+        months = status_months(engine)
+        total_months = len(months)
         print(f"Found {total_months} distinct months to process")
         
         total_processed = 0
         
-        # Using a more efficient loading approach with month-based batches
-        for row in tqdm(months_df.iterrows(), total=total_months, desc="Processing by month"):
-            _, month_row = row
-            month_year = month_row['month_year']
+        # Using a more efficient loading approach with month-based batches.
+        # Months are selected as ranges of last_updated with the partition
+        # bounds, so each batch only scans its own partition
+        for month in tqdm(months, total=total_months, desc="Processing by month"):
             
             # Use a more direct approach for loading - prepare staging table first
             # This eliminates the need for repeated row_number calculations
@@ -471,8 +492,12 @@ def create_fact_station_status(engine):
                 FROM 
                     bicycle_station_status_clean s
                 WHERE
-                    TO_CHAR(s.last_updated, 'YYYY-MM') = '{month_year}'
+                    {month_range_sql('s.last_updated', month, LOCAL_TIMEZONE)}
             )
+            -- Kept even for presorted samples: 03_sample keeps a station's first row
+            -- per wall-clock bucket of the raw timestamp, while this picks the latest
+            -- row per bucket of the cleaned timestamp, and files that were not
+            -- presorted (or were sampled in shards) can still repeat a bucket
             SELECT DISTINCT ON (station_id, ten_min_datetime)
                 station_id,
                 ten_min_datetime,
@@ -527,7 +552,7 @@ def create_fact_station_status(engine):
             # Get count of processed rows for this batch
             batch_count_query = f"""
             SELECT COUNT(*) FROM fact_station_status 
-            WHERE TO_CHAR(last_updated, 'YYYY-MM') = '{month_year}'
+            WHERE {month_range_sql('last_updated', month, LOCAL_TIMEZONE)}
             """
             batch_count_df = pd.read_sql(batch_count_query, engine)
             batch_processed = batch_count_df.iloc[0, 0]
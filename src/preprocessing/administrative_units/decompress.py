@@ -1,30 +1,12 @@
-import zipfile
 from pathlib import Path
 
-import py7zr
 from tqdm import tqdm
 
+from src.preprocessing.common.archives import extract_atomic
+
 RAW_ROOT  = Path("data/administrative_units/raw")
 TARGET_ZIP = "BCN_UNITATS_ADM_shp.zip"     
 
-# ─────────────────────────────────────────────────────────────────────────────
-# Helpers
-# ─────────────────────────────────────────────────────────────────────────────
-
-def decompress_archive(archive: Path, dest_dir: Path) -> None:
-    """Extract *archive* into *dest_dir* (creates the folder if missing)."""
-    dest_dir.mkdir(parents=True, exist_ok=True)
-
-    if archive.suffix == ".zip":
-        with zipfile.ZipFile(archive, "r") as zf:
-            zf.extractall(dest_dir)
-    elif archive.suffix == ".7z":
-        with py7zr.SevenZipFile(archive, mode="r") as zf:
-            zf.extractall(path=dest_dir)
-    else:
-        raise ValueError(f"Unsupported archive type: {archive.suffix}")
-
-
 # ─────────────────────────────────────────────────────────────────────────────
 # Main routine
 # ─────────────────────────────────────────────────────────────────────────────
@@ -51,7 +33,7 @@ def decompress_bcn_units(raw_root: Path = RAW_ROOT, target_name: str = TARGET_ZI
 
         try:
             tqdm.write(f"[EXTRACT] {rel}")
-            decompress_archive(archive, out_dir)
+            extract_atomic(archive, out_dir)
             tqdm.write(f"[ OK ] → {out_dir}")
         except Exception as exc:
             tqdm.write(f"[FAIL] {rel} — {exc}")
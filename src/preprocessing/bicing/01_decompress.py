@@ -1,40 +1,69 @@
-import zipfile
-import py7zr
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterable, Optional
 from tqdm import tqdm
 
+from src.preprocessing.common.archive_index import ArchiveIndex, MonthRange
+from src.preprocessing.common.archives import extract_atomic, extract_members_atomic
 
-def decompress_archive(file_path: Path, dest_dir: Path):
-    dest_dir.mkdir(parents=True, exist_ok=True)
+# LZMA decompression is CPU bound: one archive per core by default
+WORKERS = os.cpu_count()
 
-    if file_path.suffix == ".zip":
-        with zipfile.ZipFile(file_path, "r") as zip_ref:
-            zip_ref.extractall(dest_dir)
 
-    elif file_path.suffix == ".7z":
-        with py7zr.SevenZipFile(file_path, mode='r') as archive:
-            archive.extractall(path=dest_dir)
+def decompress_all(
+    raw_root: Path,
+    workers: Optional[int] = WORKERS,
+    filter_years: Optional[Iterable[int]] = None,
+    month_range: Optional[MonthRange] = None,
+):
+    """
+    Extract the archives under *raw_root* into the sibling decompressed/ folder.
+    The archive index decides which members fall in *filter_years* /
+    *month_range*; members already on disk are not extracted again.
+    """
+    index = ArchiveIndex(raw_root).refresh()
+    selected = index.select(filter_years, month_range, suffix="")
 
-    else:
-        raise ValueError(f"Unsupported file type: {file_path.suffix}")
-
-
-def decompress_all(raw_root: Path):
-    files_to_decompress = [f for f in raw_root.rglob("*") if f.suffix in [".zip", ".7z"]]
-    for raw_file in tqdm(files_to_decompress, desc=f"Decompressing files in {raw_root}", unit="file"):
+    pending = []
+    for raw_file, members in selected.items():
         relative = raw_file.relative_to(raw_root)
         out_folder = raw_root.parent / "decompressed" / relative.with_suffix("")
 
-        if out_folder.exists() and any(out_folder.iterdir()):
+        missing = [m["name"] for m in members if not (out_folder / m["name"]).exists()]
+        if not missing:
             tqdm.write(f"[SKIP] Already decompressed: {relative}")
             continue
+        whole = not out_folder.exists() and len(missing) == len(index.archives[relative.as_posix()]["members"])
+        pending.append((raw_file, out_folder, None if whole else missing))
+
+    if not pending:
+        return
+
+    # Largest archives first so a big one never starts last on an idle pool
+    pending.sort(key=lambda item: item[0].stat().st_size, reverse=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for raw_file, out_folder, members in pending:
+            out_folder.parent.mkdir(parents=True, exist_ok=True)
+            if members is None:
+                future = pool.submit(extract_atomic, raw_file, out_folder)
+            else:
+                future = pool.submit(extract_members_atomic, raw_file, out_folder, members)
+            futures[future] = (raw_file, out_folder, members)
 
-        try:
-            tqdm.write(f"[DECOMPRESSING] {relative}")
-            decompress_archive(raw_file, out_folder)
-            tqdm.write(f"[SUCCESS] Extracted to: {out_folder}")
-        except Exception as e:
-            tqdm.write(f"[ERROR] Failed to decompress {relative} -> {e}")
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           desc=f"Decompressing files in {raw_root}", unit="file"):
+            raw_file, out_folder, members = futures[future]
+            relative = raw_file.relative_to(raw_root)
+            detail = "" if members is None else f", {len(members)} members"
+            try:
+                seconds = future.result()
+                size_mb = raw_file.stat().st_size / 1024 ** 2
+                tqdm.write(f"[SUCCESS] {relative} ({size_mb:.1f} MB in {seconds:.1f}s{detail}) extracted to: {out_folder}")
+            except Exception as e:
+                tqdm.write(f"[ERROR] Failed to decompress {relative} -> {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+import importlib
+import logging
+from functools import partial
+from typing import Iterable, Optional
+
+from src.preprocessing.common.archive_index import MonthRange
+from src.preprocessing.common.columnar import DEFAULT_STAGE_FORMAT
+from src.preprocessing.common.runner import WORKERS
+
+project = importlib.import_module("src.preprocessing.bicing.02_project")
+sample = importlib.import_module("src.preprocessing.bicing.03_sample")
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def project_and_sample(data_type: str, from_archives: Optional[bool] = None,
+                       filter_years: Optional[Iterable[int]] = None,
+                       month_range: Optional[MonthRange] = None,
+                       fmt: str = DEFAULT_STAGE_FORMAT,
+                       workers: Optional[int] = WORKERS,
+                       policy: str = "first",
+                       aggregates: Iterable[str] = (),
+                       bucket_seconds: Optional[int] = None):
+    """
+    Fused 02 + 03: each decompressed CSV (or archive member) is read once,
+    its ``NEEDED_COLUMNS`` parsed in record batches and every batch sampled
+    before it is written, straight to sampled/. Nothing is written to
+    projected/; the output is the same as running both stages.
+    *policy*, *aggregates* and *bucket_seconds* as in ``03_sample.sample_directory``.
+    """
+    project.process_directory(
+        data_type,
+        from_archives=from_archives,
+        filter_years=filter_years,
+        month_range=month_range,
+        fmt=fmt,
+        workers=workers,
+        stage="sampled",
+        make_filter=partial(sample.batch_filter, data_type, policy=policy, aggregates=tuple(aggregates),
+                            bucket_seconds=bucket_seconds),
+    )
+
+
+if __name__ == "__main__":
+    data_types = ["information", "status"]
+
+    for data_type in data_types:
+        print(f"\n=== Projecting and sampling {data_type} data ===")
+        log.info(f"Starting fused projection and sampling of bicycle station {data_type} data")
+        project_and_sample(data_type)
+        log.info(f"Projection and sampling of {data_type} data completed")
@@ -1,7 +1,20 @@
 import csv
 import logging
+from functools import partial
 from pathlib import Path
-from tqdm import tqdm
+from typing import BinaryIO, Callable, Iterable, Optional, TextIO
+import pyarrow as pa
+
+from src.preprocessing.common.archive_index import (ArchiveIndex, MonthRange, member_period, partition_dir,
+                                                    path_period, select_stage_files)
+from src.preprocessing.common.archives import iter_csv_members, list_csv_members
+from src.preprocessing.common.checkpoint import (CHECKPOINT_BYTES, Checkpoint, atomic_output, discard,
+                                                 run_checkpointed, source_key)
+from src.preprocessing.common.columnar import DEFAULT_STAGE_FORMAT, STAGE_SUFFIX, project_csv, write_batches
+from src.preprocessing.common.runner import WORKERS, invoke, run_sharded
+from src.preprocessing.common.scanner import CsvScanner
+from src.preprocessing.common.splitting import (RANGE_BYTES, byte_ranges, concat_parts, iter_record_ranges,
+                                                open_range, part_path)
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -13,19 +26,202 @@ NEEDED_COLUMNS = {
                "status", "last_updated"]
 }
 
+# Parquet column types; a file whose values do not convert is stored as text
+COLUMN_TYPES = {
+    "station_id": pa.int64(),
+    "lat": pa.float64(),
+    "lon": pa.float64(),
+    "altitude": pa.float64(),
+    "capacity": pa.int64(),
+    "num_bikes_available": pa.int64(),
+    "num_bikes_available_types.mechanical": pa.int64(),
+    "num_bikes_available_types.ebike": pa.int64(),
+    "num_docks_available": pa.int64(),
+    "last_reported": pa.int64(),
+    "last_updated": pa.int64(),
+}
+
 BASE_PATH = Path("data")
 
 
-def ensure_output_dir(file_path: Path, input_dir: Path, output_dir: Path) -> Path:
-    """Create output directory structure mirroring the input structure."""
-    rel_path = file_path.relative_to(input_dir)
-    target_dir = output_dir / rel_path.parent
-    target_dir.mkdir(parents=True, exist_ok=True)
-    return target_dir / file_path.name
+def output_path(output_dir: Path, rel_path: Path, period: tuple, fmt: str) -> Path:
+    """
+    Output file for the CSV at *rel_path* (relative to the input tree): the
+    same relative path for CSV, ``year=/month=/<name>.parquet`` for Parquet.
+    """
+    if fmt == "csv":
+        target = output_dir / rel_path
+    else:
+        target = partition_dir(output_dir, *period) / (rel_path.stem + STAGE_SUFFIX[fmt])
+    target.parent.mkdir(parents=True, exist_ok=True)
+    return target
+
+
+def member_targets(archive: Path, raw_dir: Path, output_dir: Path, members: list[str], fmt: str) -> dict[str, Path]:
+    """Output file of each of the CSV *members* of *archive*, where the decompressed/ tree would put it."""
+    rel_root = archive.relative_to(raw_dir).with_suffix("")
+    return {name: output_path(output_dir, rel_root / name, member_period(archive, name), fmt) for name in members}
+
+
+def colliding_sources(targets: Iterable[tuple[str, Path]]) -> set[str]:
+    """
+    Sources (files or ``archive:member``) among *targets*, (source, output)
+    pairs, that share their output with another one. A Parquet output is
+    named after the CSV alone, so two archives of a month holding a member
+    of the same name (e.g. a re-issued dump) would write the same file, and
+    the second would be skipped as already processed. They are logged as
+    errors and left for the user to resolve.
+    """
+    by_target = {}
+    for source, target in targets:
+        by_target.setdefault(target, []).append(source)
+    colliding = set()
+    for target, sources in by_target.items():
+        if len(sources) > 1:
+            log.error(f"Not processing {', '.join(sources)}: they would all be written to {target}. "
+                      f"Remove all but one of them")
+            colliding.update(sources)
+    return colliding
+
+
+def projection_modes(fmt: str) -> list[str]:
+    """Attempts in order: each one handles the files the previous rejected."""
+    return ["typed", "text", "row-wise"] if fmt == "parquet" else ["text", "row-wise"]
 
 
-def process_csv_file(input_file: Path, input_dir: Path, output_dir: Path, columns_to_keep: list):
-    output_file = ensure_output_dir(input_file, input_dir, output_dir)
+def project_stream(infile: TextIO, output_file: Path, columns_to_keep: list, source_name: str) -> int:
+    """
+    Row-wise projection with the ``csv`` module: write the *columns_to_keep*
+    of the CSV text stream *infile* to *output_file*. Kept as the benchmark
+    baseline; the row-wise mode uses ``project_rows``.
+    """
+    # Read the header first to determine column indices
+    reader = csv.reader(infile)
+    header = next(reader)
+    
+    # Find indices of columns we want to keep
+    column_indices = {}
+    for i, col_name in enumerate(header):
+        if col_name in columns_to_keep:
+            column_indices[i] = columns_to_keep.index(col_name)
+    
+    # Check if we found all needed columns
+    found_columns = set(col_name for i, col_name in enumerate(header) if i in column_indices)
+    missing_columns = set(columns_to_keep) - found_columns
+    if missing_columns:
+        log.warning(f"Missing columns in {source_name}: {missing_columns}")
+    
+    # Create a new header with only the columns we need (in the original order)
+    new_header = [None] * len(columns_to_keep)
+    for idx, new_idx in column_indices.items():
+        new_header[new_idx] = header[idx]
+    
+    # Filter out None values (for columns that weren't found)
+    new_header = [h for h in new_header if h is not None]
+    
+    # Write the new CSV with only the needed columns
+    with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(new_header)
+        
+        # Process rows in chunks to avoid loading entire file
+        rows_processed = 0
+        for row in reader:
+            new_row = [None] * len(new_header)
+            for idx, new_idx in column_indices.items():
+                if idx < len(row):  # Ensure index is valid
+                    col_position = new_idx
+                    if col_position < len(new_header):
+                        new_row[col_position] = row[idx]
+            
+            # Filter out None values (for columns that weren't found)
+            new_row = [val for i, val in enumerate(new_row) if i < len(new_header)]
+            writer.writerow(new_row)
+            
+            rows_processed += 1
+            if rows_processed % 1000000 == 0:
+                log.info(f"Processed {rows_processed} rows of {source_name}")
+    
+    return rows_processed
+
+
+def project_rows(scanner: CsvScanner, output_file: Path, columns_to_keep: list, source_name: str,
+                 fmt: str, filter_batch: Optional[Callable] = None, final: bool = True) -> int:
+    """
+    Row-wise projection for files the columnar reader rejects (rows with a
+    missing or extra field): *scanner* locates the fields of each block and
+    only the *columns_to_keep* are copied out, as strings; fields a short
+    row lacks are empty. *filter_batch* and *final* as in ``project_csv``.
+    """
+    schema, batches = scanner.record_batches(columns_to_keep)
+    missing_columns = set(columns_to_keep) - set(schema.names)
+    if missing_columns:
+        log.warning(f"Missing columns in {source_name}: {missing_columns}")
+    return write_batches(batches, schema, output_file, source_name, fmt, filter_batch, final)
+
+
+def project_source(source: BinaryIO, output_file: Path, columns_to_keep: list, source_name: str,
+                   mode: str, fmt: str, filter_batch: Optional[Callable] = None, final: bool = True) -> int:
+    """
+    One projection attempt of a binary CSV stream (see ``projection_modes``);
+    *filter_batch* and *final* as in ``project_csv``.
+    """
+    if mode == "typed":
+        return project_csv(source, output_file, columns_to_keep, source_name, COLUMN_TYPES, fmt, filter_batch, final)
+    if mode == "text":
+        return project_csv(source, output_file, columns_to_keep, source_name, fmt=fmt, filter_batch=filter_batch,
+                           final=final)
+    return project_rows(CsvScanner(source), output_file, columns_to_keep, source_name, fmt, filter_batch, final)
+
+
+def completed_message(name: str, rows_processed: int, filter_batch: Optional[Callable]) -> str:
+    message = f"Completed: {name} - Processed {rows_processed} rows"
+    if filter_batch is not None:
+        message += f", kept {filter_batch.rows_kept} rows"
+    return message
+
+
+def projection_key(input_file: Path, mode: str, fmt: str) -> tuple:
+    """Checkpoint identity of a projection of *input_file* in *mode* (see ``run_checkpointed``)."""
+    return source_key(input_file, mode, fmt)
+
+
+def project_file(input_file: Path, output_file: Path, columns_to_keep: list, mode: str, fmt: str,
+                 make_filter: Optional[Callable] = None) -> tuple[int, Optional[Callable]]:
+    """
+    Project *input_file* in one mode, in segments of about ``CHECKPOINT_BYTES``
+    that each end on a record boundary (``iter_record_ranges``, found as the
+    projection reaches them). The batch filter is carried from segment to segment
+    and checkpointed with the progress, so an interrupted run resumes at the
+    last checkpoint (see ``run_checkpointed``).
+    Returns (rows processed, batch filter).
+    """
+    source_name = str(input_file)
+    
+    def project_segment(segment: tuple, segment_file: Path, filter_batch: Optional[Callable], last: bool) -> int:
+        start, end, _ = segment
+        if mode == "row-wise":
+            with CsvScanner(input_file, start, end) as scanner:
+                return project_rows(scanner, segment_file, columns_to_keep, source_name, fmt, filter_batch, last)
+        with open_range(input_file, start, end) as source:
+            return project_source(source, segment_file, columns_to_keep, source_name, mode, fmt, filter_batch, last)
+    
+    return run_checkpointed(output_file, partial(iter_record_ranges, input_file, CHECKPOINT_BYTES), project_segment,
+                            make_filter(source_name) if make_filter else None, projection_key(input_file, mode, fmt))
+
+
+def process_csv_file(input_file: Path, input_dir: Path, output_dir: Path, columns_to_keep: list,
+                     fmt: str = DEFAULT_STAGE_FORMAT, make_filter: Optional[Callable] = None):
+    """
+    Project one CSV file. *make_filter*, if given, is called with the source
+    name for every attempt and returns a batch filter with a ``rows_kept``
+    count (the fused stage passes ``03_sample.BatchSampler``). The output is
+    published only once complete; see ``project_file`` for resuming. A
+    rerun starts at the mode whose checkpoint an interrupted run left, so
+    the modes that already failed are not tried (and their failure does
+    not discard that progress) again.
+    """
+    output_file = output_path(output_dir, input_file.relative_to(input_dir), path_period(input_file), fmt)
     
     if output_file.exists():
         log.info(f"[SKIP] Already processed: {input_file}")
@@ -35,55 +231,24 @@ def process_csv_file(input_file: Path, input_dir: Path, output_dir: Path, column
     log.info(f"Output to: {output_file}")
     
     try:
-        with open(input_file, 'r', newline='', encoding='utf-8') as infile:
-            # Read the header first to determine column indices
-            reader = csv.reader(infile)
-            header = next(reader)
-            
-            # Find indices of columns we want to keep
-            column_indices = {}
-            for i, col_name in enumerate(header):
-                if col_name in columns_to_keep:
-                    column_indices[i] = columns_to_keep.index(col_name)
-            
-            # Check if we found all needed columns
-            found_columns = set(col_name for i, col_name in enumerate(header) if i in column_indices)
-            missing_columns = set(columns_to_keep) - found_columns
-            if missing_columns:
-                log.warning(f"Missing columns in {input_file}: {missing_columns}")
-            
-            # Create a new header with only the columns we need (in the original order)
-            new_header = [None] * len(columns_to_keep)
-            for idx, new_idx in column_indices.items():
-                new_header[new_idx] = header[idx]
-            
-            # Filter out None values (for columns that weren't found)
-            new_header = [h for h in new_header if h is not None]
-            
-            # Write the new CSV with only the needed columns
-            with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-                writer = csv.writer(outfile)
-                writer.writerow(new_header)
-                
-                # Process rows in chunks to avoid loading entire file
-                rows_processed = 0
-                for row in reader:
-                    new_row = [None] * len(new_header)
-                    for idx, new_idx in column_indices.items():
-                        if idx < len(row):  # Ensure index is valid
-                            col_position = new_idx
-                            if col_position < len(new_header):
-                                new_row[col_position] = row[idx]
-                    
-                    # Filter out None values (for columns that weren't found)
-                    new_row = [val for i, val in enumerate(new_row) if i < len(new_header)]
-                    writer.writerow(new_row)
-                    
-                    rows_processed += 1
-                    if rows_processed % 1000000 == 0:
-                        log.info(f"Processed {rows_processed} rows of {input_file.name}")
+        modes = projection_modes(fmt)
+        keys = {mode: projection_key(input_file, mode, fmt) for mode in modes}
+        saved = Checkpoint(output_file, ()).saved_key()
+        first = next((i for i, mode in enumerate(modes) if keys[mode] == saved), 0)
+        if first:
+            log.info(f"Resuming {input_file} in {modes[first]} projection")
+        for i, mode in enumerate(modes[first:], start=first):
+            try:
+                rows_processed, filter_batch = project_file(input_file, output_file, columns_to_keep, mode, fmt,
+                                                            make_filter)
+                break
+            except pa.ArrowInvalid as e:
+                discard(output_file, keys[mode])
+                if mode == modes[-1]:
+                    raise
+                log.warning(f"Retrying {input_file} with {modes[i + 1]} projection: {e}")
         
-        log.info(f"Completed: {input_file.name} - Processed {rows_processed} rows")
+        log.info(completed_message(input_file.name, rows_processed, filter_batch))
         return True
     
     except Exception as e:
@@ -91,24 +256,244 @@ def process_csv_file(input_file: Path, input_dir: Path, output_dir: Path, column
         return False
 
 
-def process_directory(data_type: str):
-    """Process all CSV files in a directory based on data type."""
+def project_range(input_file: Path, start: int, end: int, part_file: Path, columns_to_keep: list,
+                  modes: list[str], fmt: str) -> tuple[str, int]:
+    """
+    Project bytes [start, end) of a split CSV file to *part_file*, trying the
+    columnar *modes* in order. Returns (mode used, rows projected). A shard
+    finished by an interrupted run is not projected again.
+    """
+    source_name = f"{input_file}[{start}:{end}]"
+    checkpoint = Checkpoint(part_file, source_key(input_file, start, end, tuple(modes), fmt))
+    if part_file.exists() and checkpoint.load():
+        log.info(f"[SKIP] Shard already projected: {source_name}")
+        return checkpoint.state
+    for i, mode in enumerate(modes):
+        try:
+            with open_range(input_file, start, end) as source, atomic_output(part_file) as temp:
+                result = mode, project_source(source, temp, columns_to_keep, source_name, mode, fmt)
+            checkpoint.save(1, result[1], result)
+            return result
+        except pa.ArrowInvalid as e:
+            if mode == modes[-1]:
+                raise
+            log.warning(f"Retrying {source_name} with {modes[i + 1]} projection: {e}")
+
+
+def project_split_files(splits: dict, shards: dict, input_dir: Path, output_dir: Path, columns_to_keep: list,
+                        fmt: str, workers: Optional[int]) -> int:
+    """
+    Finish the files projected in shards. Shards that fell back to a looser
+    mode than their siblings are redone in that mode so all parts share one
+    schema; a file with a failed shard (e.g. ragged rows, which need the
+    row-wise mode) is projected whole. Returns the number of files written.
+    """
+    modes = projection_modes(fmt)
+    tasks = []
+    sizes = []
+    for file, (output_file, parts, ranges) in list(splits.items()):
+        results = [shards.get(part) for part in parts]
+        if not all(isinstance(r, tuple) for r in results):
+            log.warning(f"Projecting {file} as a whole")
+            for part in parts:
+                part.unlink(missing_ok=True)
+                discard(part)
+            del splits[file]
+            tasks.append((process_csv_file, file, input_dir, output_dir, columns_to_keep, fmt))
+            sizes.append(file.stat().st_size)
+            continue
+        loosest = max((mode for mode, _ in results), key=modes.index)
+        for (start, end, size), part, (mode, _) in zip(ranges, parts, results):
+            if mode != loosest:
+                tasks.append((project_range, file, start, end, part, columns_to_keep, [loosest], fmt))
+                sizes.append(size)
+    
+    success_count = 0
+    if tasks:
+        for task, result in run_sharded(invoke, tasks, sizes, workers, desc="Re-projecting shards"):
+            if isinstance(result, Exception):
+                log.error(f"Error processing {task[1]}: {result}")
+            if task[0] is project_range:
+                shards[task[4]] = result
+            elif result is True:
+                success_count += 1
+    
+    for file, (output_file, parts, _) in splits.items():
+        try:
+            results = [shards.get(part) for part in parts]
+            if not all(isinstance(r, tuple) for r in results):
+                raise RuntimeError("a re-projected shard failed")
+            with atomic_output(output_file) as temp:
+                concat_parts(parts, temp, fmt=fmt)
+            log.info(f"Completed: {file.name} ({len(parts)} shards) - Processed {sum(rows for _, rows in results)} rows")
+            success_count += 1
+        except Exception as e:
+            log.error(f"Error processing {file}: {e}")
+        finally:
+            for part in parts:
+                part.unlink(missing_ok=True)
+                discard(part)
+    
+    return success_count
+
+
+def process_archive(archive: Path, raw_dir: Path, output_dir: Path, columns_to_keep: list,
+                    members: Optional[list[str]] = None, fmt: str = DEFAULT_STAGE_FORMAT,
+                    make_filter: Optional[Callable] = None) -> tuple[int, int]:
+    """
+    Project the CSVs inside *archive* (all, or only *members*) straight from
+    the compressed file. Outputs land where the decompressed/ tree would have
+    put them; *make_filter* as in ``process_csv_file``. Returns (successful
+    members, total members).
+    """
+    if members is None:
+        members = list_csv_members(archive)
+    targets = member_targets(archive, raw_dir, output_dir, members, fmt)
+    
+    pending = []
+    for name in members:
+        if targets[name].exists():
+            log.info(f"[SKIP] Already processed: {archive.name}:{name}")
+        else:
+            pending.append(name)
+    
+    success_count = len(members) - len(pending)
+    modes = projection_modes(fmt)
+    try:
+        for i, mode in enumerate(modes):
+            retry = []
+            # Members rejected by the previous mode are streamed again
+            for name, stream in iter_csv_members(archive, pending):
+                source_name = f"{archive.name}:{name}"
+                if i == 0:
+                    log.info(f"Processing: {archive}:{name}")
+                    log.info(f"Output to: {targets[name]}")
+                try:
+                    filter_batch = make_filter(source_name) if make_filter else None
+                    # Archive members are streamed, so they are redone whole rather than resumed
+                    with atomic_output(targets[name]) as temp:
+                        rows_processed = project_source(stream.buffer, temp, columns_to_keep, source_name, mode, fmt,
+                                                        filter_batch)
+                    log.info(completed_message(name, rows_processed, filter_batch))
+                    success_count += 1
+                except pa.ArrowInvalid as e:
+                    if mode == modes[-1]:
+                        log.error(f"Error processing {archive}:{name}: {e}")
+                    else:
+                        log.warning(f"Retrying {source_name} with {modes[i + 1]} projection: {e}")
+                        retry.append(name)
+                except Exception as e:
+                    log.error(f"Error processing {archive}:{name}: {e}")
+            pending = retry
+    except Exception as e:
+        log.error(f"Error reading archive {archive}: {e}")
+    
+    return success_count, len(members)
+
+
+def process_directory(data_type: str, from_archives: Optional[bool] = None,
+                      filter_years: Optional[Iterable[int]] = None,
+                      month_range: Optional[MonthRange] = None,
+                      fmt: str = DEFAULT_STAGE_FORMAT,
+                      workers: Optional[int] = WORKERS,
+                      range_bytes: Optional[int] = RANGE_BYTES,
+                      stage: str = "projected",
+                      make_filter: Optional[Callable] = None):
+    """
+    Process the CSV files of a data type, optionally only those of
+    *filter_years* / *month_range*. Reads the decompressed/ tree, or streams
+    the CSVs out of the raw/ archives when *from_archives* is set (default:
+    only when decompressed/ does not exist). *fmt* is "parquet" (typed,
+    zstd, partitioned by year/month) or "csv". Files (or archives) are
+    spread over *workers* processes, largest first; with more than one
+    worker, decompressed files larger than *range_bytes* are split on line
+    boundaries into shards projected in parallel (None disables splitting).
+    
+    The fused project+sample stage writes to *stage* "sampled" and passes a
+    *make_filter*; its files are not split, as the sampler is stateful.
+    """
     input_dir = BASE_PATH / f"bicycle_stations/{data_type}/decompressed"
-    output_dir = BASE_PATH / f"bicycle_stations/{data_type}/projected"
+    raw_dir = BASE_PATH / f"bicycle_stations/{data_type}/raw"
+    output_dir = BASE_PATH / f"bicycle_stations/{data_type}/{stage}"
+    
+    if from_archives is None:
+        from_archives = not input_dir.exists()
     
     # Ensure base output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Get all CSV files recursively
-    all_files = list(input_dir.glob("**/*.csv"))
+    if from_archives:
+        selected = ArchiveIndex(raw_dir).refresh().select(filter_years, month_range)
+        log.info(f"Streaming CSV members of {len(selected)} archives for {data_type}")
+        
+        colliding = colliding_sources(
+            (f"{archive.name}:{name}", target) for archive, members in selected.items()
+            for name, target in member_targets(archive, raw_dir, output_dir, [m["name"] for m in members], fmt).items())
+        selected = {archive: [m for m in members if f"{archive.name}:{m['name']}" not in colliding]
+                    for archive, members in selected.items()}
+        tasks = [(archive, raw_dir, output_dir, NEEDED_COLUMNS[data_type], [m["name"] for m in members], fmt, make_filter)
+                 for archive, members in selected.items() if members]
+        sizes = [sum(m["size"] for m in members) for members in selected.values() if members]
+        
+        success_count, total_count = 0, len(colliding)
+        for task, result in run_sharded(process_archive, tasks, sizes, workers,
+                                        desc=f"Processing {data_type} archives"):
+            if isinstance(result, Exception):
+                log.error(f"Error processing archive {task[0]}: {result}")
+                total_count += len(task[4])
+                continue
+            succeeded, total = result
+            success_count += succeeded
+            total_count += total
+        
+        log.info(f"Processing complete for {data_type}. Successfully processed {success_count} of {total_count} files.")
+        return
+    
+    # Get the CSV files of the requested period
+    all_files = select_stage_files(input_dir, filter_years, month_range)
     log.info(f"Found {len(all_files)} CSV files to process for {data_type}")
     
-    # Process each file
+    # Whole files and shards of the large ones, processed in parallel, largest first
+    columns_to_keep = NEEDED_COLUMNS[data_type]
+    range_modes = [mode for mode in projection_modes(fmt) if mode != "row-wise"]
+    targets = {file: output_path(output_dir, file.relative_to(input_dir), path_period(file), fmt) for file in all_files}
+    colliding = colliding_sources((str(file), target) for file, target in targets.items())
+    tasks = []
+    sizes = []
+    splits = {}    # input file -> (output file, shard outputs, byte ranges)
+    for file in all_files:
+        if str(file) in colliding:
+            continue
+        output_file = targets[file]
+        split = range_bytes and workers != 1 and make_filter is None and not output_file.exists()
+        ranges = byte_ranges(file, range_bytes) if split else []
+        if len(ranges) > 1:
+            parts = [part_path(output_file, i) for i in range(len(ranges))]
+            splits[file] = (output_file, parts, ranges)
+            for (start, end, size), part in zip(ranges, parts):
+                tasks.append((project_range, file, start, end, part, columns_to_keep, range_modes, fmt))
+                sizes.append(size)
+        else:
+            tasks.append((process_csv_file, file, input_dir, output_dir, columns_to_keep, fmt, make_filter))
+            sizes.append(file.stat().st_size)
+    
     success_count = 0
-    for file in tqdm(all_files, desc=f"Processing {data_type} files"):
-        if process_csv_file(file, input_dir, output_dir, NEEDED_COLUMNS[data_type]):
+    shards = {}    # shard output -> result
+    for task, result in run_sharded(invoke, tasks, sizes, workers,
+                                    desc=f"Processing {data_type} files"):
+        func, file = task[0], task[1]
+        if func is project_range:
+            if isinstance(result, Exception):
+                log.warning(f"Shard {task[4].name} failed: {result}")
+            shards[task[4]] = result
+        elif isinstance(result, Exception):
+            log.error(f"Error processing {file}: {result}")
+        elif result:
             success_count += 1
     
+    if splits:
+        success_count += project_split_files(splits, shards, input_dir, output_dir, columns_to_keep, fmt, workers)
+    
     log.info(f"Processing complete for {data_type}. Successfully processed {success_count} of {len(all_files)} files.")
 
 
@@ -0,0 +1,119 @@
+import importlib
+import logging
+from pathlib import Path
+from typing import Iterable, Optional
+
+from psycopg2.pool import ThreadedConnectionPool
+from sqlalchemy import create_engine
+from tqdm import tqdm
+
+from src.preprocessing.common.archive_index import MonthRange, select_stage_files
+from src.preprocessing.common.columnar import DEFAULT_STAGE_FORMAT, STAGE_SUFFIX
+from src.preprocessing.common.load_manifest import PendingFile, begin_file, plan_loads, record_file
+from src.preprocessing.common.partitions import file_months, set_load_month
+from src.preprocessing.common.pipe import PIPE_READ_BYTES, BoundedPipe
+from src.preprocessing.common.schema_discovery import discover_columns
+
+sample = importlib.import_module("src.preprocessing.bicing.03_sample")
+load_raw = importlib.import_module("src.preprocessing.bicing.04_load_raw")
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def load_sampled_file(pool: ThreadedConnectionPool, table_name: str, file: Path, pending: PendingFile,
+                      data_type: str, policy: str = "first", aggregates: Iterable[str] = (),
+                      bucket_seconds: Optional[int] = None) -> "load_raw.LoadResult":
+    """
+    Sample one projected file straight into *table_name*: a producer thread
+    runs the sampler and writes the kept rows into a ``BoundedPipe`` that
+    ``copy_expert`` reads on a pooled connection, so sampling and COPY
+    overlap and no sampled file is written. One transaction per file; if
+    either side fails the other is stopped and the COPY rolled back. The
+    rows are tagged, replaced and recorded in the load manifest as in
+    ``04_load_raw.load_file``.
+    """
+    conn = pool.getconn()
+    pipe = BoundedPipe()
+    try:
+        columns, chunks = sample.sampled_chunks(file, data_type, str(file), policy, aggregates, bucket_seconds)
+        copy_sql = f"COPY {table_name}(" + ", ".join(f"\"{col}\"" for col in columns) + ") FROM STDIN WITH CSV"
+        producer = pipe.feed(chunks)
+        try:
+            with conn.cursor() as cursor:
+                begin_file(cursor.execute, table_name, pending)
+                set_load_month(cursor.execute, file)
+                cursor.copy_expert(copy_sql, pipe, size=PIPE_READ_BYTES)
+                rows = cursor.rowcount
+                record_file(cursor.execute, table_name, pending, rows)
+            conn.commit()
+        finally:
+            pipe.cancel()
+            producer.join()
+        return load_raw.LoadResult(file, "copy", rows, pipe.bytes_read)
+    except Exception as e:
+        if not conn.closed:
+            conn.rollback()
+        tqdm.write(f"[ERROR] Sampling {file} into {table_name} failed: {e}")
+        return load_raw.LoadResult(file, "error", error=str(e))
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def sample_and_load(data_type: str, table_name: str, engine,
+                    filter_years: Optional[Iterable[int]] = None,
+                    month_range: Optional[MonthRange] = None,
+                    fmt: str = DEFAULT_STAGE_FORMAT,
+                    workers: int = load_raw.LOAD_WORKERS,
+                    db_params: dict = load_raw.DB_PARAMS,
+                    policy: str = "first",
+                    aggregates: Iterable[str] = (),
+                    bucket_seconds: Optional[int] = None,
+                    reload: bool = False,
+                    partition_by_month: bool = False):
+    """
+    Fused 03 + 04: the projected files are sampled and their kept rows
+    streamed into the TEXT table *table_name*, up to *workers* files at
+    once. Nothing is written to sampled/; the table holds the same rows as
+    sampling then loading. The table, its month partitions and the
+    incremental load are those of ``04_load_raw.load_csv_to_postgres_optimized``
+    (*reload*, *partition_by_month*); the manifest records the projected
+    files together with the sampling settings, so changing those reloads.
+    *policy*, *aggregates* and *bucket_seconds* as in ``03_sample.sample_directory``.
+    """
+    aggregates = tuple(aggregates)
+    input_dir = load_raw.BASE_PATH / f"bicycle_stations/{data_type}/projected"
+    files = select_stage_files(input_dir, filter_years, month_range, suffix=STAGE_SUFFIX[fmt])
+    tqdm.write(f"Sampling and loading {len(files)} files matching filter criteria")
+
+    # Sampling keeps the projected columns and appends the aggregate ones
+    file_columns = discover_columns(files, input_dir)
+    all_columns = set().union(*file_columns.values())
+    all_columns = sorted(all_columns | {sample.AGGREGATE_COLUMNS[name] for name in aggregates})
+    months = file_months(file_columns) if partition_by_month else None
+    created = load_raw.ensure_raw_table(engine, table_name, all_columns, reload, months)
+    variant = f"sampled:{policy}:{'+'.join(aggregates)}:{bucket_seconds or ''}"
+    pending, skipped = plan_loads(engine, table_name, input_dir, file_columns, variant)
+    pending = {item.file: item for item in pending}
+    tqdm.write(f"{skipped} files already loaded, {len(pending)} new or changed")
+
+    results = [load_raw.LoadResult(file, "error", error="unreadable header")
+               for file in files if file not in file_columns]
+    load = lambda pool, file: load_sampled_file(pool, table_name, file, pending[file], data_type, policy,
+                                                aggregates, bucket_seconds)
+    results += load_raw.run_loads(pending, load, workers, db_params, f"Sampling {data_type} into {table_name}")
+
+    load_raw.finish_raw_table(engine, table_name, created)
+    return results
+
+
+if __name__ == "__main__":
+    engine = create_engine(load_raw.get_connection_string())
+    filter_years = range(2019, 2022)
+
+    for data_type in ["information", "status"]:
+        print(f"\n=== Sampling and loading {data_type} data ===")
+        log.info(f"Starting fused sampling and loading of bicycle station {data_type} data")
+        sample_and_load(data_type, f"bicycle_station_{data_type}_raw", engine, filter_years=filter_years,
+                        partition_by_month=data_type == "status")
+        log.info(f"Sampling and loading of {data_type} data completed")
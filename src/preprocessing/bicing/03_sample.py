@@ -1,13 +1,34 @@
+import contextlib
 import csv
+import io
 import logging
+import tempfile
+from functools import partial
 from pathlib import Path
-from tqdm import tqdm
-from datetime import datetime
+from typing import Iterable, Iterator, Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.preprocessing.common.archive_index import MonthRange, select_stage_files
+from src.preprocessing.common.columnar import (DEFAULT_STAGE_FORMAT, PARQUET_COMPRESSION, STAGE_SUFFIX,
+                                               open_csv_reader, open_sink, project_csv, read_header, write_batch)
+from src.preprocessing.common.checkpoint import (CHECKPOINT_BYTES, Checkpoint, atomic_output, discard,
+                                                 run_checkpointed, source_key)
+from src.preprocessing.common.external_sort import external_sort
+from src.preprocessing.common.runner import WORKERS, invoke, run_sharded
+from src.preprocessing.common.scanner import CsvScanner
+from src.preprocessing.common.splitting import (RANGE_BYTES, concat_parts, iter_record_ranges, open_range, part_path,
+                                                row_group_ranges, shard_ranges)
+from src.preprocessing.common.timestamps import TimestampParser
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
 BASE_PATH = Path("data")
+PARQUET_BATCH_ROWS = 1_000_000
 
 
 def ensure_output_dir(file_path: Path, input_dir: Path, output_dir: Path) -> Path:
@@ -20,40 +41,658 @@ def ensure_output_dir(file_path: Path, input_dir: Path, output_dir: Path) -> Pat
     return target_dir / file_path.name
 
 
-def parse_timestamp(timestamp_str, row_num):
-    """Parse timestamp from string in various formats."""
-    # First try to parse as Unix timestamp (seconds since 1970-01-01)
-    try:
-        unix_timestamp = int(timestamp_str)
-        return datetime.fromtimestamp(unix_timestamp)
-    except ValueError:
-        pass
-    
-    # Try other common formats
-    formats_to_try = [
-        "%Y-%m-%dT%H:%M:%S.%fZ",  # ISO format with microseconds
-        "%Y-%m-%dT%H:%M:%SZ",     # ISO format without microseconds
-        "%Y-%m-%d %H:%M:%S",      # Standard format
-        "%Y-%m-%d %H:%M:%S.%f",   # Standard format with microseconds
-        "%d/%m/%Y %H:%M"          # European format dd/mm/yyyy HH:MM
-    ]
-    
-    for fmt in formats_to_try:
-        try:
-            return datetime.strptime(timestamp_str, fmt)
-        except ValueError:
+# Sampling interval per data type; other data types are not sampled
+BUCKET_SECONDS = {"status": 600, "information": 3600}
+NO_BUCKET = np.iinfo(np.int64).min
+
+# Sort keys of the optional presort; rows without a timestamp sort last
+SORT_STATION = "__station"
+SORT_SECONDS = "__seconds"
+UNTIMED = np.iinfo(np.int64).max
+
+# Bucket policies: which row represents a station's bucket, and extra columns
+POLICIES = ("first", "last", "min", "max")
+VALUE_COLUMN = "num_bikes_available"
+AGGREGATE_COLUMNS = {"mean": "num_bikes_available_mean", "minutes_at_zero": "minutes_at_zero"}
+
+
+class StationSampler:
+    """
+    Per-station sampling state: keeps the first row of each station per
+    10-minute interval (status) or per hour (information). Intervals are
+    integer buckets, wall-clock seconds floored to the interval length.
+    Stations get a dense index on first sight and the last bucket of each
+    is kept in an int64 array, so whole chunks are decided with NumPy.
+
+    For a shard of a split file, ``openings`` records each station's first
+    interval and the output index of its row: the only decisions that depend
+    on the rows before the shard (see ``merge_boundaries``).
+    """
+
+    def __init__(self, data_type: str, source_name: str = "", bucket_seconds: Optional[int] = None):
+        self.data_type = data_type
+        self.bucket_seconds = bucket_seconds or BUCKET_SECONDS.get(data_type)
+        self.timestamps = TimestampParser(source_name)
+        self.station_index = {}                                 # station_id -> dense index
+        self.station_ids = []                                   # dense index -> station_id
+        self.last_bucket = np.full(1024, NO_BUCKET, dtype=np.int64)
+        self.openings = {}                                      # station_id -> (bucket, output row index)
+        self.rows_kept = 0
+
+    def station(self, station_id: str) -> int:
+        """Dense index of *station_id*."""
+        index = self.station_index.get(station_id)
+        if index is None:
+            index = self.station_index[station_id] = len(self.station_ids)
+            self.station_ids.append(station_id)
+            if index == len(self.last_bucket):
+                self.last_bucket = np.concatenate([self.last_bucket, np.full(index, NO_BUCKET, dtype=np.int64)])
+        return index
+
+    def column_stations(self, column: pa.Array) -> np.ndarray:
+        """Dense station index of every row; station IDs compare as strings, missing ones as ""."""
+        encoded = column.dictionary_encode()
+        lookup = [self.station(str(value)) for value in encoded.dictionary.to_pylist()]
+        lookup.append(self.station(""))
+        codes = pc.fill_null(encoded.indices, len(lookup) - 1)
+        return np.array(lookup, dtype=np.int64)[codes.to_numpy(zero_copy_only=False)]
+
+    def state(self) -> dict:
+        """Last interval seen per station."""
+        seen = np.flatnonzero(self.last_bucket[:len(self.station_ids)] != NO_BUCKET)
+        return {self.station_ids[i]: int(self.last_bucket[i]) for i in seen}
+
+    def keep_chunk(self, stations: np.ndarray, seconds: np.ndarray, parsed: np.ndarray) -> np.ndarray:
+        """
+        Keep mask of a chunk of consecutive rows, given their dense station
+        indices and timestamps (wall-clock seconds where *parsed*). Rows with
+        unparseable timestamps are always kept and leave the state alone.
+        """
+        keep = np.ones(len(stations), dtype=bool)
+        rows = np.flatnonzero(parsed)
+        if self.bucket_seconds and len(rows):
+            # Group the timed rows by station, in row order within a station
+            order = rows[np.argsort(stations[rows], kind="stable")]
+            station = stations[order]
+            bucket = seconds[order] // self.bucket_seconds
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = station[1:] != station[:-1]
+            last = np.ones(len(order), dtype=bool)
+            last[:-1] = first[1:]
+
+            # A row is skipped if the station's previous row was in the same bucket
+            previous = np.empty_like(bucket)
+            previous[1:] = bucket[:-1]
+            previous[first] = self.last_bucket[station[first]]
+            keep[order] = bucket != previous
+
+            opening = first & (previous == NO_BUCKET)
+            if opening.any():
+                output_index = self.rows_kept + np.cumsum(keep) - 1
+                for i in np.flatnonzero(opening):
+                    self.openings[self.station_ids[station[i]]] = (int(bucket[i]), int(output_index[order[i]]))
+            self.last_bucket[station[last]] = bucket[last]
+
+        self.rows_kept += int(keep.sum())
+        return keep
+
+
+def merge_boundaries(shards: list[tuple[dict, dict]]) -> list[set[int]]:
+    """
+    Reconcile the samplers of consecutive shards, given as (openings, state)
+    pairs. A station's opening row is skipped if the shards before it left the
+    station in the same interval; returns the output rows to drop per shard.
+    """
+    carried = {}
+    drops = []
+    for openings, state in shards:
+        drops.append({index for station_id, (key, index) in openings.items() if carried.get(station_id) == key})
+        carried.update(state)
+    return drops
+
+
+def find_columns(header: list, source_name: str, data_type: str) -> tuple[Optional[int], Optional[int]]:
+    """Indices of the timestamp and station_id columns (None when absent)."""
+    timestamp_col_idx = None
+    station_id_idx = None
+
+    for i, col_name in enumerate(header):
+        if col_name.lower() == "last_updated" or col_name.lower() == "last_reported":
+            timestamp_col_idx = i
+            log.info(f"Found timestamp column: {col_name} at index {i}")
+        if col_name.lower() == "station_id":
+            station_id_idx = i
+            log.info(f"Found station_id column at index {i}")
+
+    if timestamp_col_idx is None:
+        log.warning(f"No timestamp column found in {source_name}. Will not sample by time.")
+
+    if station_id_idx is None and data_type == "information":
+        log.warning(f"No station_id column found in {source_name}. Will use row number as station ID.")
+
+    return timestamp_col_idx, station_id_idx
+
+
+def sampled_blocks(scanner: CsvScanner, data_type: str, source_name: str, sampler: StationSampler,
+                   first_row: int = 0) -> Iterator[tuple[int, int, bytes]]:
+    """
+    Sample the CSV records of *scanner* block by block: yields the rows read,
+    the rows kept and their text as it is in the input (only the station
+    and timestamp fields are copied out of each block).
+    Rows are numbered from *first_row* + 1 (the station ID of files without one).
+    """
+    header = scanner.header
+    log.info(f"Header: {header}")
+
+    # Find important column indices
+    timestamp_col_idx, station_id_idx = find_columns(header, source_name, data_type)
+
+    rows_processed = 0
+    for block in scanner.blocks():
+        # Skip timestamp handling if no timestamp column
+        if timestamp_col_idx is None:
+            rows_processed += block.num_rows
+            yield block.num_rows, block.num_rows, block.raw_rows()
             continue
+
+        # Get station IDs, defaulting to the row number
+        if station_id_idx is not None:
+            stations = sampler.column_stations(block.column(station_id_idx))
+            numbered = np.flatnonzero(block.field_counts <= station_id_idx)
+        else:
+            stations = np.empty(block.num_rows, dtype=np.int64)
+            numbered = np.arange(block.num_rows)
+        for i in numbered:
+            stations[i] = sampler.station(str(first_row + rows_processed + i + 1))
+
+        # Short rows have no timestamp and are kept
+        seconds = np.zeros(block.num_rows, dtype=np.int64)
+        parsed = np.zeros(block.num_rows, dtype=bool)
+        timed_rows = np.flatnonzero(block.field_counts > timestamp_col_idx)
+        timestamps = block.column(timestamp_col_idx)
+        if len(timed_rows) < block.num_rows:
+            timestamps = timestamps.take(pa.array(timed_rows))
+        seconds[timed_rows], parsed[timed_rows] = sampler.timestamps.parse(timestamps)
+
+        keep = sampler.keep_chunk(stations, seconds, parsed)
+        rows_processed += block.num_rows
+        yield block.num_rows, int(keep.sum()), block.raw_rows(keep)
+
+
+def sample_stream(scanner: CsvScanner, output_file: Path, data_type: str, source_name: str,
+                  sampler: Optional[StationSampler] = None, first_row: int = 0,
+                  final: bool = True) -> tuple[int, int, int]:
+    """Sample the CSV records of *scanner* into *output_file* (see ``sampled_blocks``).
+    Kept rows are written as they are in the input.
+    Rows are numbered from *first_row* + 1 (the station ID of files without
+    one); unless *final*, the unparseable timestamps are not reported yet.
+    Returns (rows_processed, rows_kept, rows_skipped).
+    """
+    rows_processed = 0
+    rows_kept = 0
+    rows_skipped = 0
+    sampler = sampler or StationSampler(data_type, source_name)
+
+    # Open output file and write header
+    with open(output_file, 'wb') as outfile:
+        header_line = io.StringIO()
+        csv.writer(header_line).writerow(scanner.header)
+        outfile.write(header_line.getvalue().encode("utf-8"))
+
+        for block_rows, block_kept, text in sampled_blocks(scanner, data_type, source_name, sampler, first_row):
+            outfile.write(text)
+
+            # Progress reporting
+            before = rows_processed
+            rows_processed += block_rows
+            rows_kept += block_kept
+            rows_skipped = rows_processed - rows_kept
+            if rows_processed // 1000000 > before // 1000000:
+                log.info(f"Processed {rows_processed} rows, kept {rows_kept} rows, skipped {rows_skipped} rows")
     
-    # If we got here, none of the formats matched
-    if row_num <= 10 or row_num % 1000000 == 0:
-        log.warning(f"Could not parse timestamp: '{timestamp_str}' at row {row_num}")
-    return None
+    if final:
+        sampler.timestamps.report()
+    return rows_processed, rows_kept, rows_processed - rows_kept
+
+
+class BatchSampler:
+    """
+    Sampling of consecutive record batches: returns the kept rows of each
+    batch. Stations are dictionary-encoded, so only distinct station IDs
+    become Python values. Used for Parquet inputs and by the fused
+    project+sample stage.
+    """
+
+    def __init__(self, data_type: str, source_name: str, sampler: Optional[StationSampler] = None,
+                 bucket_seconds: Optional[int] = None):
+        self.data_type = data_type
+        self.source_name = source_name
+        self.sampler = sampler or StationSampler(data_type, source_name, bucket_seconds)
+        self.columns = None
+        self.rows_processed = 0
+        self.rows_kept = 0
+
+    def __call__(self, batch: pa.RecordBatch, times: Optional[tuple] = None) -> pa.RecordBatch:
+        """Kept rows of *batch*; *times* are its already parsed timestamps (see ``with_sort_keys``)."""
+        if self.columns is None:
+            self.columns = find_columns(batch.schema.names, self.source_name, self.data_type)
+        timestamp_col_idx, station_id_idx = self.columns
+
+        if timestamp_col_idx is None:
+            self.rows_processed += batch.num_rows
+            self.rows_kept += batch.num_rows
+            return batch
+
+        if station_id_idx is None:
+            # Row numbers as station IDs: every row is a new station
+            self.rows_processed += batch.num_rows
+            self.rows_kept += batch.num_rows
+            return batch
+
+        seconds, parsed = times or self.sampler.timestamps.parse(batch.column(timestamp_col_idx))
+        keep = self.sampler.keep_chunk(self.sampler.column_stations(batch.column(station_id_idx)), seconds, parsed)
+        self.rows_processed += batch.num_rows
+        mask = pa.array(keep)
+
+        kept = batch.filter(mask)
+        self.rows_kept += kept.num_rows
+        return kept
+
+    def output_schema(self, schema: pa.Schema) -> pa.Schema:
+        return schema
+
+    def flush(self) -> None:
+        """Rows held back until the end of the input (none: rows are decided as they come)."""
+        return None
+
+
+class BucketAggregator:
+    """
+    Bucket policies beyond "first": one row per station and bucket, picked
+    by *policy* (the first or last row, or the row with the lowest or highest
+    ``num_bikes_available``), plus the *aggregates* columns. A bucket is
+    written once it closes, when its station moves to another bucket or at
+    the end of the input (``flush``); the open buckets are carried between
+    batches as one representative row and running sums per station.
+    """
+
+    def __init__(self, data_type: str, source_name: str, policy: str = "first",
+                 aggregates: Iterable[str] = (), bucket_seconds: Optional[int] = None):
+        self.aggregates = list(aggregates)
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown bucket policy {policy!r}, expected one of {POLICIES}")
+        unknown = set(self.aggregates) - set(AGGREGATE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown aggregates {unknown}, expected some of {tuple(AGGREGATE_COLUMNS)}")
+        self.data_type = data_type
+        self.source_name = source_name
+        self.policy = policy
+        self.sampler = StationSampler(data_type, source_name, bucket_seconds)
+        if not self.sampler.bucket_seconds:
+            raise ValueError(f"No bucket width for {data_type} data")
+        self.columns = None
+        self.rows_processed = 0
+        self.rows_kept = 0
+        self.carry = None           # representative rows of the open buckets
+        self.carry_stats = None     # per carried row: station, bucket, count, total, zeros, value
+
+    def output_schema(self, schema: pa.Schema) -> pa.Schema:
+        for name in self.aggregates:
+            schema = schema.append(pa.field(AGGREGATE_COLUMNS[name], pa.float64()))
+        return schema
+
+    def _find_columns(self, names: list) -> tuple[int, int, Optional[int]]:
+        timestamp_col_idx, station_id_idx = find_columns(names, self.source_name, self.data_type)
+        value_idx = names.index(VALUE_COLUMN) if VALUE_COLUMN in names else None
+        if timestamp_col_idx is None or station_id_idx is None:
+            raise ValueError(f"Bucket aggregation needs timestamp and station_id columns in {self.source_name}")
+        if value_idx is None and (self.policy in ("min", "max") or self.aggregates):
+            raise ValueError(f"Policy {self.policy!r} / {self.aggregates} needs {VALUE_COLUMN} in {self.source_name}")
+        return timestamp_col_idx, station_id_idx, value_idx
+
+    def _values(self, column: Optional[pa.Array], n: int) -> np.ndarray:
+        if column is None:
+            return np.full(n, np.nan)
+        if not pa.types.is_floating(column.type) and not pa.types.is_integer(column.type):
+            return pd.to_numeric(column.to_numpy(zero_copy_only=False), errors="coerce").astype(np.float64)
+        return pc.fill_null(column.cast(pa.float64()), np.nan).to_numpy(zero_copy_only=False)
+
+    def _emit(self, table: pa.Table, stats: dict) -> pa.Table:
+        count = stats["count"]
+        has_values = count > 0
+        bucket_minutes = self.sampler.bucket_seconds / 60
+        for name in self.aggregates:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if name == "mean":
+                    values = stats["total"] / count
+                else:
+                    values = bucket_minutes * stats["zeros"] / count
+            table = table.append_column(AGGREGATE_COLUMNS[name], pa.array(values, mask=~has_values))
+        return table
+
+    def __call__(self, batch: pa.RecordBatch, times: Optional[tuple] = None) -> pa.Table:
+        """Closed buckets of *batch* and before; *times* as in ``BatchSampler.__call__``."""
+        if self.columns is None:
+            self.columns = self._find_columns(batch.schema.names)
+        timestamp_col_idx, station_id_idx, value_idx = self.columns
+        self.rows_processed += batch.num_rows
+
+        seconds, parsed = times or self.sampler.timestamps.parse(batch.column(timestamp_col_idx))
+        stations = self.sampler.column_stations(batch.column(station_id_idx))
+        values = self._values(batch.column(value_idx) if value_idx is not None else None, batch.num_rows)
+        timed = np.flatnonzero(parsed)
+        untimed = np.flatnonzero(~parsed)
+
+        # Open buckets first, then this batch's timed rows
+        rows = pa.Table.from_batches([batch])
+        table = rows.take(timed)
+        stats = {
+            "station": stations[timed],
+            "bucket": seconds[timed] // self.sampler.bucket_seconds,
+            "count": (~np.isnan(values[timed])).astype(np.int64),
+            "total": np.nan_to_num(values[timed]),
+            "zeros": (values[timed] == 0).astype(np.int64),
+            "value": values[timed],
+            "position": timed,
+        }
+        if self.carry is not None:
+            table = pa.concat_tables([self.carry, table])
+            self.carry_stats["position"] = np.arange(-len(self.carry), 0)
+            stats = {key: np.concatenate([self.carry_stats[key], stats[key]]) for key in stats}
+
+        # Runs of consecutive rows of a station in the same bucket
+        order = np.argsort(stats["station"], kind="stable")
+        station = stats["station"][order]
+        bucket = stats["bucket"][order]
+        start = np.ones(len(order), dtype=bool)
+        start[1:] = (station[1:] != station[:-1]) | (bucket[1:] != bucket[:-1])
+        starts = np.flatnonzero(start)
+        run = np.cumsum(start) - 1
+
+        if self.policy == "first":
+            representative = order[starts]
+        elif self.policy == "last":
+            representative = order[np.append(starts[1:], len(order)) - 1]
+        else:
+            # Lowest (highest) value per run, the earliest row on ties
+            value = stats["value"][order]
+            value = np.where(np.isnan(value), np.inf, value if self.policy == "min" else -value)
+            ranked = np.lexsort((np.arange(len(order)), value, run))
+            representative = order[ranked[starts]]
+
+        run_stats = {key: np.add.reduceat(stats[key][order], starts) if len(starts) else stats[key][:0]
+                     for key in ("count", "total", "zeros")}
+        run_station = station[starts]
+        is_open = np.ones(len(starts), dtype=bool)
+        is_open[:-1] = run_station[1:] != run_station[:-1]
+
+        # The last run of every station stays open
+        self.carry = table.take(representative[is_open])
+        self.carry_stats = {"station": run_station[is_open], "bucket": bucket[starts][is_open],
+                            "value": stats["value"][representative[is_open]],
+                            **{key: column[is_open] for key, column in run_stats.items()}}
 
+        closed = ~is_open
+        out = self._emit(table.take(representative[closed]), {key: column[closed] for key, column in run_stats.items()})
+        positions = stats["position"][order[starts]][closed]
+        if len(untimed):
+            # Rows without a timestamp are kept as they are
+            none = np.zeros(len(untimed), dtype=np.int64)
+            out = pa.concat_tables([out, self._emit(rows.take(untimed), {"count": none, "total": none, "zeros": none})])
+            positions = np.concatenate([positions, untimed])
+        out = out.take(np.argsort(positions, kind="stable"))
+        self.rows_kept += out.num_rows
+        return out
 
-def sample_csv_file(input_file: Path, input_dir: Path, output_dir: Path, data_type: str):
-    """Sample a CSV file based on timestamps.
+    def flush(self) -> Optional[pa.Table]:
+        """The buckets still open at the end of the input."""
+        if self.carry is None:
+            return None
+        out = self._emit(self.carry, self.carry_stats)
+        self.carry = self.carry_stats = None
+        self.rows_kept += out.num_rows
+        return out
+
+
+def batch_filter(data_type: str, source_name: str, policy: str = "first", aggregates: Iterable[str] = (),
+                 bucket_seconds: Optional[int] = None):
+    """Batch sampler for a bucket *policy*: rows are decided as they come for "first" without aggregates."""
+    if policy == "first" and not aggregates:
+        return BatchSampler(data_type, source_name, bucket_seconds=bucket_seconds)
+    return BucketAggregator(data_type, source_name, policy, aggregates, bucket_seconds)
+
+
+def sample_parquet(input_file: Path, output_file: Path, data_type: str, source_name: str,
+                   sampler: Optional[StationSampler] = None,
+                   row_groups: Optional[range] = None,
+                   batch_sampler=None, final: bool = True) -> tuple[int, int, int]:
+    """
+    Parquet counterpart of ``sample_stream``: kept rows are written as
+    filtered record batches. Reads all row groups, or only *row_groups*.
+    *batch_sampler* (see ``batch_filter``) defaults to the "first" policy;
+    unless *final*, the rows it holds back stay held for the next row groups.
+    Returns (rows_processed, rows_kept, rows_skipped) so far.
+    """
+    batch_sampler = batch_sampler or BatchSampler(data_type, source_name, sampler)
+
+    parquet_file = pq.ParquetFile(input_file)
+    schema = parquet_file.schema_arrow
+    log.info(f"Header: {schema.names}")
+
+    with pq.ParquetWriter(output_file, batch_sampler.output_schema(schema), compression=PARQUET_COMPRESSION) as writer:
+        groups = list(row_groups) if row_groups is not None else None
+        for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, row_groups=groups):
+            writer.write(batch_sampler(batch))
+            rows_processed, rows_kept = batch_sampler.rows_processed, batch_sampler.rows_kept
+            log.info(f"Processed {rows_processed} rows, kept {rows_kept} rows, skipped {rows_processed - rows_kept} rows")
+        if final:
+            tail = batch_sampler.flush()
+            if tail is not None:
+                writer.write(tail)
+
+    if final:
+        batch_sampler.sampler.timestamps.report()
+    rows_processed, rows_kept = batch_sampler.rows_processed, batch_sampler.rows_kept
+    return rows_processed, rows_kept, rows_processed - rows_kept
+
+
+def with_sort_keys(batch: pa.RecordBatch, timestamps: TimestampParser, timestamp_col_idx: int,
+                   station_id_idx: int) -> pa.RecordBatch:
+    """*batch* with the presort keys appended: station ID as a string and wall-clock seconds."""
+    seconds, parsed = timestamps.parse(batch.column(timestamp_col_idx))
+    station = pc.fill_null(batch.column(station_id_idx).cast(pa.string()), "")
+    batch = batch.append_column(SORT_STATION, station)
+    return batch.append_column(SORT_SECONDS, pa.array(np.where(parsed, seconds, UNTIMED)))
+
+
+def _sorted_batches(tables: Iterator[pa.Table], names: list) -> Iterator[tuple[pa.RecordBatch, tuple]]:
+    """Sorted batches of the *names* columns, each with the (seconds, parsed) its sort key already holds."""
+    for table in tables:
+        table = table.combine_chunks()
+        seconds = table.column(SORT_SECONDS).to_numpy()
+        offset = 0
+        for batch in table.select(names).to_batches():
+            key = seconds[offset:offset + batch.num_rows]
+            offset += batch.num_rows
+            yield batch, (key, key != UNTIMED)
+
+
+def sample_sorted(input_file: Path, output_file: Path, data_type: str, source_name: str,
+                  batch_sampler) -> tuple[int, int, int]:
+    """
+    Sample a projected file after sorting its rows by (station_id, timestamp)
+    with a bounded-memory external sort, spilling to a temporary directory
+    next to *output_file*. Rows out of time order then still fall into their
+    station's bucket, so every (station, bucket) is kept at most once. The
+    output is in sorted order. Files without a timestamp or station_id column
+    are sampled as they are.
+    Returns (rows_processed, rows_kept, rows_skipped).
+    """
+    fmt = "parquet" if input_file.suffix == ".parquet" else "csv"
+    with contextlib.ExitStack() as stack:
+        if fmt == "parquet":
+            parquet_file = pq.ParquetFile(input_file)
+            schema = parquet_file.schema_arrow
+            batches = parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS)
+        else:
+            infile = stack.enter_context(open(input_file, 'rb'))
+            header = read_header(infile)
+            infile.seek(0)
+            reader = open_csv_reader(infile, header, source_name)
+            schema, batches = reader.schema, reader
+        log.info(f"Header: {schema.names}")
+
+        timestamp_col_idx, station_id_idx = find_columns(schema.names, source_name, data_type)
+        if timestamp_col_idx is not None and station_id_idx is not None:
+            # Timestamps are parsed once, by the sampler's parser, for the
+            # sort key; the sampler then reuses the key instead of parsing again
+            timestamps = batch_sampler.sampler.timestamps
+            keyed = (with_sort_keys(batch, timestamps, timestamp_col_idx, station_id_idx) for batch in batches)
+            spill_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(dir=output_file.parent, prefix=".sort-")))
+            batches = _sorted_batches(external_sort(keyed, [SORT_STATION, SORT_SECONDS], spill_dir), schema.names)
+        else:
+            log.warning(f"Not sorting {source_name}: no timestamp or station_id column")
+            batches = ((batch, None) for batch in batches)
+
+        sink = open_sink(fmt, output_file, batch_sampler.output_schema(schema))
+        try:
+            for batch, times in batches:
+                sink.write(batch_sampler(batch, times))
+                rows_processed, rows_kept = batch_sampler.rows_processed, batch_sampler.rows_kept
+                log.info(f"Processed {rows_processed} rows, kept {rows_kept} rows, skipped {rows_processed - rows_kept} rows")
+            tail = batch_sampler.flush()
+            if tail is not None:
+                sink.write(tail)
+        finally:
+            sink.close()
+
+    batch_sampler.sampler.timestamps.report()
+    rows_processed, rows_kept = batch_sampler.rows_processed, batch_sampler.rows_kept
+    return rows_processed, rows_kept, rows_processed - rows_kept
+
+
+def sample_file(input_file: Path, output_file: Path, data_type: str, source_name: str,
+                policy: str = "first", aggregates: Iterable[str] = (),
+                bucket_seconds: Optional[int] = None) -> tuple[int, int]:
+    """
+    Sample a projected file in segments of about ``CHECKPOINT_BYTES``: byte
+    ranges ending on a record boundary for CSV, row group ranges for Parquet.
+    The sampler is carried from segment to segment and checkpointed with the
+    progress, so an interrupted run resumes at the last checkpoint with the
+    sampler state it had there (see ``run_checkpointed``).
+    Returns (rows_processed, rows_kept).
+    """
+    aggregates = tuple(aggregates)
+    key = source_key(input_file, policy, aggregates, bucket_seconds)
+    
+    if input_file.suffix == ".parquet":
+        def sample_segment(segment: tuple, segment_file: Path, batch_sampler, last: bool) -> int:
+            start, end, _ = segment
+            before = batch_sampler.rows_processed
+            sample_parquet(input_file, segment_file, data_type, source_name, row_groups=range(start, end),
+                           batch_sampler=batch_sampler, final=last)
+            return batch_sampler.rows_processed - before
+        
+        ranges = row_group_ranges(input_file, CHECKPOINT_BYTES) or [(0, 0, 0)]
+        
+        def segments(start: Optional[int]) -> list:
+            return [r for r in ranges if start is None or r[0] >= start]
+        
+        rows_processed, batch_sampler = run_checkpointed(
+            output_file, segments, sample_segment,
+            batch_filter(data_type, source_name, policy, aggregates, bucket_seconds), key)
+        return rows_processed, batch_sampler.rows_kept
+    
+    segments = partial(iter_record_ranges, input_file, CHECKPOINT_BYTES)
+    if policy == "first" and not aggregates:
+        def sample_segment(segment: tuple, segment_file: Path, state: dict, last: bool) -> int:
+            start, end, _ = segment
+            with CsvScanner(input_file, start, end) as scanner:
+                rows_processed, rows_kept, _ = sample_stream(scanner, segment_file, data_type, source_name,
+                                                             state["sampler"], state["rows_processed"], last)
+            state["rows_processed"] += rows_processed
+            state["rows_kept"] += rows_kept
+            return rows_processed
+        
+        state = {"sampler": StationSampler(data_type, source_name, bucket_seconds), "rows_processed": 0, "rows_kept": 0}
+        rows_processed, state = run_checkpointed(output_file, segments, sample_segment, state, key)
+        return rows_processed, state["rows_kept"]
+    
+    # Buckets are aggregated on record batches, read as text
+    with open(input_file, 'rb') as infile:
+        header = read_header(infile)
+    
+    def aggregate_segment(segment: tuple, segment_file: Path, aggregator: BucketAggregator, last: bool) -> int:
+        start, end, _ = segment
+        with open_range(input_file, start, end) as source:
+            return project_csv(source, segment_file, header, source_name, filter_batch=aggregator, final=last)
+    
+    aggregator = BucketAggregator(data_type, source_name, policy, aggregates, bucket_seconds)
+    rows_processed, aggregator = run_checkpointed(output_file, segments, aggregate_segment, aggregator, key)
+    aggregator.sampler.timestamps.report()
+    return rows_processed, aggregator.rows_kept
+
+
+def sampled_chunks(input_file: Path, data_type: str, source_name: str, policy: str = "first",
+                   aggregates: Iterable[str] = (),
+                   bucket_seconds: Optional[int] = None) -> tuple[list, Iterator[bytes]]:
+    """
+    The sampled rows of a projected file as CSV text without a header,
+    produced lazily chunk by chunk instead of written to sampled/, for
+    stages that load them straight away (``03_04_sample_load.py``): kept
+    rows as they are in the input for CSV with the "first" policy, filtered
+    record batches rendered as CSV otherwise. Returns the column names and
+    the chunk iterator; the file is only read as the chunks are consumed.
+    """
+    if input_file.suffix == ".parquet":
+        schema = pq.read_schema(input_file)
+    else:
+        with open(input_file, 'rb') as infile:
+            schema = pa.schema([(name, pa.string()) for name in read_header(infile)])
+    
+    if input_file.suffix != ".parquet" and policy == "first" and not aggregates:
+        def chunks() -> Iterator[bytes]:
+            sampler = StationSampler(data_type, source_name, bucket_seconds)
+            with CsvScanner(input_file) as scanner:
+                for _, _, text in sampled_blocks(scanner, data_type, source_name, sampler):
+                    yield text
+            sampler.timestamps.report()
+        
+        return schema.names, chunks()
+    
+    batch_sampler = batch_filter(data_type, source_name, policy, aggregates, bucket_seconds)
+    
+    def render(batch: pa.RecordBatch) -> bytes:
+        buffer = io.BytesIO()
+        write_batch(batch, buffer)
+        return buffer.getvalue()
+    
+    def chunks() -> Iterator[bytes]:
+        with contextlib.ExitStack() as stack:
+            if input_file.suffix == ".parquet":
+                batches = pq.ParquetFile(input_file).iter_batches(batch_size=PARQUET_BATCH_ROWS)
+            else:
+                infile = stack.enter_context(open(input_file, 'rb'))
+                batches = open_csv_reader(infile, schema.names, source_name)
+            for batch in batches:
+                yield render(batch_sampler(batch))
+            tail = batch_sampler.flush()
+            if tail is not None:
+                yield render(tail)
+        batch_sampler.sampler.timestamps.report()
+    
+    return batch_sampler.output_schema(schema).names, chunks()
+
+
+def sample_csv_file(input_file: Path, input_dir: Path, output_dir: Path, data_type: str,
+                    policy: str = "first", aggregates: Iterable[str] = (),
+                    bucket_seconds: Optional[int] = None, presort: bool = False):
+    """Sample a projected file (CSV or Parquet) based on timestamps.
     Information data: one per hour
     Status data: one per 10 minutes
+    (or one per *bucket_seconds*, picked by *policy*, see ``BucketAggregator``)
+    With *presort* the rows are first sorted by station and time (see ``sample_sorted``).
+    The output is published only once complete; see ``sample_file`` for resuming.
     """
     # Skip if output file already exists
     output_file = ensure_output_dir(input_file, input_dir, output_dir)
@@ -65,125 +704,16 @@ def sample_csv_file(input_file: Path, input_dir: Path, output_dir: Path, data_ty
     log.info(f"Output to: {output_file}")
     
     try:
-        # Initialize tracking variables
-        rows_processed = 0
-        rows_kept = 0
-        rows_skipped = 0
-        last_hour_seen = {}        # station_id -> (hour, day, month, year)
-        last_ten_min_seen = {}     # station_id -> (ten_min_interval, hour, day, month, year)
-        first_rows = []            # Store first 10 rows for debugging
-        
-        # Open input file and read header
-        with open(input_file, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            log.info(f"Header: {header}")
-            
-            # Find important column indices
-            timestamp_col_idx = None
-            station_id_idx = None
-            
-            for i, col_name in enumerate(header):
-                if col_name.lower() == "last_updated" or col_name.lower() == "last_reported":
-                    timestamp_col_idx = i
-                    log.info(f"Found timestamp column: {col_name} at index {i}")
-                if col_name.lower() == "station_id":
-                    station_id_idx = i
-                    log.info(f"Found station_id column at index {i}")
-            
-            if timestamp_col_idx is None:
-                log.warning(f"No timestamp column found in {input_file}. Will not sample by time.")
-            
-            if station_id_idx is None and data_type == "information":
-                log.warning(f"No station_id column found in {input_file}. Will use row number as station ID.")
-            
-            # Open output file and write header
-            with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-                writer = csv.writer(outfile)
-                writer.writerow(header)
-                
-                # Process rows
-                for row in reader:
-                    rows_processed += 1
-                    
-                    # Collect sample rows for debugging
-                    if rows_processed <= 10:
-                        first_rows.append(row)
-                    
-                    # Default to keeping row
-                    keep_row = True
-                    
-                    # Get station ID
-                    station_id = str(rows_processed)  # Default to row number
-                    if station_id_idx is not None and station_id_idx < len(row):
-                        station_id = row[station_id_idx]
-                    
-                    # Skip timestamp handling if no timestamp column
-                    if timestamp_col_idx is None or timestamp_col_idx >= len(row):
-                        writer.writerow(row)
-                        rows_kept += 1
-                        continue
-                    
-                    # Get timestamp value
-                    timestamp_str = row[timestamp_col_idx]
-                    
-                    # Parse timestamp
-                    try:
-                        timestamp = parse_timestamp(timestamp_str, rows_processed)
-                        
-                        # If timestamp is invalid, keep the row
-                        if timestamp is None:
-                            writer.writerow(row)
-                            rows_kept += 1
-                            continue
-                        
-                        # Extract time components
-                        hour = timestamp.hour
-                        day = timestamp.day
-                        month = timestamp.month
-                        year = timestamp.year
-                        minute = timestamp.minute
-                        
-                        # Apply sampling logic based on data type
-                        if data_type == "status":
-                            # For status data: one per 10 minutes
-                            ten_min_interval = minute // 10
-                            interval_key = (ten_min_interval, hour, day, month, year)
-                            
-                            if station_id in last_ten_min_seen and last_ten_min_seen[station_id] == interval_key:
-                                # Skip this row - we already have data for this station in this interval
-                                keep_row = False
-                                rows_skipped += 1
-                            else:
-                                # Keep this row and update tracking
-                                last_ten_min_seen[station_id] = interval_key
-                                
-                        elif data_type == "information":
-                            # For information data: one per hour
-                            hour_key = (hour, day, month, year)
-                            
-                            if station_id in last_hour_seen and last_hour_seen[station_id] == hour_key:
-                                # Skip this row - we already have data for this station in this hour
-                                keep_row = False
-                                rows_skipped += 1
-                            else:
-                                # Keep this row and update tracking
-                                last_hour_seen[station_id] = hour_key
-                    
-                    except Exception as e:
-                        # If there's an error processing the timestamp, keep the row
-                        if rows_processed <= 10 or rows_processed % 1000000 == 0:
-                            log.warning(f"Error processing timestamp in row {rows_processed}: {e}")
-                        keep_row = True
-                    
-                    # Write row if we're keeping it
-                    if keep_row:
-                        writer.writerow(row)
-                        rows_kept += 1
-                    
-                    # Progress reporting
-                    if rows_processed % 1000000 == 0:
-                        log.info(f"Processed {rows_processed} rows, kept {rows_kept} rows, skipped {rows_skipped} rows")
+        source_name = str(input_file)
+        if presort:
+            batch_sampler = batch_filter(data_type, source_name, policy, aggregates, bucket_seconds)
+            with atomic_output(output_file) as temp:
+                rows_processed, rows_kept, rows_skipped = sample_sorted(input_file, temp, data_type, source_name,
+                                                                        batch_sampler)
+        else:
+            rows_processed, rows_kept = sample_file(input_file, output_file, data_type, source_name, policy,
+                                                    aggregates, bucket_seconds)
+            rows_skipped = rows_processed - rows_kept
         
         # Report final statistics
         reduction = 100 - (rows_kept / rows_processed * 100) if rows_processed > 0 else 0
@@ -195,22 +725,139 @@ def sample_csv_file(input_file: Path, input_dir: Path, output_dir: Path, data_ty
         return False
 
 
-def sample_directory(data_type: str):
-    """Sample all CSV files in a directory based on data type."""
+def sample_range(input_file: Path, start: int, end: int, part_file: Path, data_type: str,
+                 bucket_seconds: Optional[int] = None) -> tuple[int, int, dict, dict]:
+    """
+    Sample one shard of a split file with a fresh sampler: bytes [start, end)
+    of a CSV or row groups [start, end) of a Parquet file. Returns
+    (rows_processed, rows_kept, openings, state) for ``merge_boundaries``.
+    A shard finished by an interrupted run is not sampled again.
+    """
+    source_name = f"{input_file}[{start}:{end}]"
+    checkpoint = Checkpoint(part_file, source_key(input_file, start, end, bucket_seconds))
+    if part_file.exists() and checkpoint.load():
+        log.info(f"[SKIP] Shard already sampled: {source_name}")
+        return checkpoint.state
+    
+    sampler = StationSampler(data_type, source_name, bucket_seconds)
+    with atomic_output(part_file) as temp:
+        if input_file.suffix == ".parquet":
+            header = pq.read_schema(input_file).names
+            rows_processed, rows_kept, _ = sample_parquet(input_file, temp, data_type, source_name,
+                                                          sampler, range(start, end))
+        else:
+            with open(input_file, 'rb') as f:
+                header = read_header(f)
+            with CsvScanner(input_file, start, end) as scanner:
+                rows_processed, rows_kept, _ = sample_stream(scanner, temp, data_type, source_name, sampler)
+
+    # Without a station_id column rows are keyed by their (per shard) number,
+    # so every row is a distinct station and nothing crosses the boundary
+    if not any(col_name.lower() == "station_id" for col_name in header):
+        result = rows_processed, rows_kept, {}, {}
+    else:
+        result = rows_processed, rows_kept, sampler.openings, sampler.state()
+    checkpoint.save(1, rows_processed, result)
+    return result
+
+
+def merge_shards(input_file: Path, output_file: Path, parts: list[Path], results: list) -> bool:
+    """Concatenate the sampled shards of *input_file*, dropping the rows their boundaries duplicate."""
+    try:
+        failed = [r for r in results if not isinstance(r, tuple)]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(parts)} shards failed")
+        drops = merge_boundaries([(openings, state) for _, _, openings, state in results])
+        with atomic_output(output_file) as temp:
+            concat_parts(parts, temp, drops, fmt=output_file.suffix.lstrip("."))
+
+        rows_processed = sum(r[0] for r in results)
+        rows_kept = sum(r[1] for r in results) - sum(len(d) for d in drops)
+        rows_skipped = rows_processed - rows_kept
+        reduction = 100 - (rows_kept / rows_processed * 100) if rows_processed > 0 else 0
+        log.info(f"Completed: {input_file.name} ({len(parts)} shards) - Processed {rows_processed} rows, kept {rows_kept} rows, skipped {rows_skipped} rows ({reduction:.1f}% reduction)")
+        return True
+
+    except Exception as e:
+        log.error(f"Error sampling {input_file}: {e}")
+        return False
+    finally:
+        for part in parts:
+            part.unlink(missing_ok=True)
+            discard(part)
+
+
+def sample_directory(data_type: str, fmt: str = DEFAULT_STAGE_FORMAT,
+                     filter_years: Optional[Iterable[int]] = None,
+                     month_range: Optional[MonthRange] = None,
+                     workers: Optional[int] = WORKERS,
+                     range_bytes: Optional[int] = RANGE_BYTES,
+                     policy: str = "first",
+                     aggregates: Iterable[str] = (),
+                     bucket_seconds: Optional[int] = None,
+                     presort: bool = False):
+    """
+    Sample the projected files of a data type (*fmt* "parquet" or "csv"),
+    optionally only the year/month partitions in *filter_years* / *month_range*.
+    The sampled/ tree has the same layout as projected/. Files are spread
+    over *workers* processes, largest first; with more than one worker, files
+    larger than *range_bytes* are split into shards sampled in parallel and
+    merged in order (None disables splitting).
+    
+    Each station keeps one row per *bucket_seconds* (default 10 minutes for
+    status, 1 hour for information), picked by *policy* ("first", "last",
+    "min", "max"), with optional *aggregates* columns ("mean",
+    "minutes_at_zero"). Only the default "first" without aggregates is split.
+
+    With *presort* every file is first sorted by (station_id, timestamp) in
+    bounded memory, so rows out of time order cannot open a bucket twice;
+    presorted files are not split.
+    """
+    aggregates = tuple(aggregates)
     input_dir = BASE_PATH / f"bicycle_stations/{data_type}/projected"
     output_dir = BASE_PATH / f"bicycle_stations/{data_type}/sampled"
     
     # Ensure base output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Get all CSV files recursively
-    all_files = list(input_dir.glob("**/*.csv"))
-    log.info(f"Found {len(all_files)} CSV files to sample for {data_type}")
+    # Get the projected files of the requested period
+    all_files = select_stage_files(input_dir, filter_years, month_range, suffix=STAGE_SUFFIX[fmt])
+    log.info(f"Found {len(all_files)} {fmt} files to sample for {data_type}")
+    
+    # Whole files and shards of the large ones, sampled in parallel, largest first
+    tasks = []
+    sizes = []
+    splits = {}    # input file -> (output file, shard outputs)
+    for file in all_files:
+        output_file = ensure_output_dir(file, input_dir, output_dir)
+        split = (range_bytes and workers != 1 and policy == "first" and not aggregates and not presort
+                 and not output_file.exists())
+        ranges = shard_ranges(file, range_bytes) if split else []
+        if len(ranges) > 1:
+            parts = [part_path(output_file, i) for i in range(len(ranges))]
+            splits[file] = (output_file, parts)
+            for (start, end, size), part in zip(ranges, parts):
+                tasks.append((sample_range, file, start, end, part, data_type, bucket_seconds))
+                sizes.append(size)
+        else:
+            tasks.append((sample_csv_file, file, input_dir, output_dir, data_type, policy, aggregates,
+                          bucket_seconds, presort))
+            sizes.append(file.stat().st_size)
     
-    # Process each file
     success_count = 0
-    for file in tqdm(all_files, desc=f"Sampling {data_type} files"):
-        if sample_csv_file(file, input_dir, output_dir, data_type):
+    shards = {}    # shard output -> result
+    for task, result in run_sharded(invoke, tasks, sizes, workers,
+                                    desc=f"Sampling {data_type} files"):
+        func, file = task[0], task[1]
+        if isinstance(result, Exception):
+            log.error(f"Error sampling {file}: {result}")
+        if func is sample_range:
+            shards[task[4]] = result
+        elif result is True:
+            success_count += 1
+    
+    for file, (output_file, parts) in splits.items():
+        if merge_shards(file, output_file, parts, [shards.get(part) for part in parts]):
             success_count += 1
     
     log.info(f"Sampling complete for {data_type}. Successfully sampled {success_count} of {len(all_files)} files.")
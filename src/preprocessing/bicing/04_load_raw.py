@@ -1,11 +1,31 @@
+import io
 import logging
-import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from pathlib import Path
 from tqdm import tqdm
 from sqlalchemy import create_engine, text
-from typing import Optional
-import psycopg2
+from typing import Callable, Iterable, Iterator, Optional
+from psycopg2.pool import ThreadedConnectionPool
+
+from src.preprocessing.common.archive_index import MonthRange, select_stage_files
+from src.preprocessing.common.columnar import DEFAULT_STAGE_FORMAT, STAGE_SUFFIX, write_batch
+from src.preprocessing.common.load_manifest import (SOURCE_COLUMN, SOURCE_COLUMN_SQL, PendingFile, begin_file,
+                                                    plan_loads, prepare_table, record_file)
+from src.preprocessing.common.partitions import (MONTH_COLUMN, MONTH_COLUMN_SQL, create_month_partitions,
+                                                 default_partition, file_months, is_partitioned_sql,
+                                                 partitioned_table_sql, partitions_sql, set_load_month)
+from src.preprocessing.common.pgcopy import (DIGITS, LOCAL_TIMEZONE, SIGNED_INTEGER, SQL_TYPES, encode_rows,
+                                             epoch_values, integer_values, text_values)
+from src.preprocessing.common.scanner import CsvScanner
+from src.preprocessing.common.schema_discovery import discover_columns
+from src.preprocessing.common.timestamps import TimestampParser
 
 
 logging.basicConfig(level=logging.INFO)
@@ -21,13 +41,46 @@ DB_PARAMS = {
 }
 BASE_PATH = Path("data")
 CHUNKSIZE = 50_000
+COPY_BATCH_ROWS = 500_000          # Parquet rows rendered per COPY
+LOAD_WORKERS = 4                   # files COPYed concurrently, one pooled connection each
+
+# Typed status load: (clean column, binary COPY type, stage column). The
+# table is the one 05_clean.py would build from the TEXT raw table
+STATUS_TYPED_TABLE = "bicycle_station_status_typed"
+STATUS_TYPED_COLUMNS = [
+    ("station_id", "int4", "station_id"),
+    ("num_bikes_available", "int2", "num_bikes_available"),
+    ("mechanical_bikes", "int2", "num_bikes_available_types.mechanical"),
+    ("ebikes", "int2", "num_bikes_available_types.ebike"),
+    ("num_docks_available", "int2", "num_docks_available"),
+    ("last_reported", "timestamptz", "last_reported"),
+    ("status", "text", "status"),
+    ("last_updated", "timestamptz", "last_updated"),
+]
+TYPED_STATUS_LOAD = True           # load status straight into STATUS_TYPED_TABLE, no _raw table
+
+
+@dataclass
+class LoadResult:
+    file: Path
+    status: str                    # "copy" | "fallback" | "error"
+    rows: int = 0
+    bytes: int = 0
+    error: Optional[str] = None
 
 
-def get_connection_string():
-    return f"postgresql+psycopg2://{DB_PARAMS['user']}:{DB_PARAMS['password']}@{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}"
+def get_connection_string(db_params: dict = DB_PARAMS):
+    return f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
 
 
-def load_geospatial_lanes(folder: Path, table_name: str, engine, filter_years: Optional[range] = None):
+def load_geospatial_lanes(folder: Path, table_name: str, engine, filter_years: Optional[range] = None,
+                          reload: bool = False):
+    """
+    Load the lane files of *folder* into *table_name* incrementally: files
+    already in the load manifest with the same content are skipped, changed
+    ones have their rows (by ``_source_file``) replaced. *reload* starts
+    from an empty table.
+    """
     files = list(folder.glob("**/*.geojson")) + list(folder.glob("**/*.shp"))
     
     # Apply year filter if provided
@@ -46,48 +99,162 @@ def load_geospatial_lanes(folder: Path, table_name: str, engine, filter_years: O
     log.debug(f"Loading from {len(files)} files:")
     log.debug("\n".join([str(file) for file in files]))
     
-    # Drop existing table to start fresh
-    with engine.connect() as conn:
-        conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
-        conn.commit()
+    # Only new and changed files are loaded into the existing table
+    exists = prepare_table(engine, table_name, reload)
+    pending, skipped = plan_loads(engine, table_name, folder, files)
+    log.info(f"{skipped} files already loaded, {len(pending)} new or changed")
 
-    for file in tqdm(files, desc=f"Loading lanes to {table_name}"):
+    for item in tqdm(pending, desc=f"Loading lanes to {table_name}"):
         try:
-            gdf: gpd.GeoDataFrame = gpd.read_file(file)
+            gdf: gpd.GeoDataFrame = gpd.read_file(item.file)
             gdf = gdf.to_crs(epsg=4326)
             gdf.rename(columns={gdf.geometry.name: 'geometry'}, inplace=True)
             gdf.rename(columns=lambda x: x.lower(), inplace=True)
             gdf.rename(columns={'any': '_any'}, inplace=True)
-            gdf.to_postgis(table_name, engine, if_exists='append', index=False)
+            gdf[SOURCE_COLUMN] = item.source
+            # The old rows, the new ones and the manifest entry change together
+            with engine.begin() as conn:
+                if exists:
+                    begin_file(conn.exec_driver_sql, table_name, item)
+                gdf.to_postgis(table_name, conn, if_exists='append', index=False)
+                record_file(conn.exec_driver_sql, table_name, item, len(gdf))
+            exists = True
         except Exception as e:
-            tqdm.write(f"[ERROR] {file}: {e}")
+            tqdm.write(f"[ERROR] {item.file}: {e}")
 
 
-def load_csv_to_postgres_optimized(folder: Path, table_name: str, engine, filter_years: Optional[range] = None):
-    files = list(folder.glob("**/*.csv"))
-    if filter_years:
-        filtered_files = []
-        for file in files:
-            if any(str(year) in file.name for year in filter_years):
-                filtered_files.append(file)
-        files = filtered_files
-    
-    tqdm.write(f"Loading {len(files)} files matching filter criteria")
+def copy_file(cursor, copy_sql: str, file: Path) -> tuple[int, int]:
+    """
+    Stream a stage file into a ``COPY ... FROM STDIN WITH CSV`` statement.
+    Returns the rows and bytes sent.
+    """
+    if file.suffix == ".parquet":
+        rows = sent = 0
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=COPY_BATCH_ROWS):
+            buffer = io.BytesIO()
+            write_batch(batch, buffer)
+            sent += buffer.tell()
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            rows += batch.num_rows
+        return rows, sent
     
-    # Create a union schema by sampling all files
-    all_columns = set()
-    for file in tqdm(files, desc="Building unified schema"):
+    with open(file, 'r', encoding='utf-8') as f:
+        # Skip header
+        header = next(f)
+        cursor.copy_expert(copy_sql, f)
+    return cursor.rowcount, file.stat().st_size - len(header.encode('utf-8'))
+
+
+def load_file(pool: ThreadedConnectionPool, table_name: str, all_columns: list, file: Path,
+              file_columns: list, pending: PendingFile) -> LoadResult:
+    """
+    Load one stage file on a pooled connection, in its own transaction:
+    a direct COPY of its *file_columns* (from schema discovery), else a COPY
+    into a temporary table mapped onto *all_columns*. A failed attempt is
+    rolled back, so a file is either loaded completely or not at all.
+    Concurrent COPYs into the same table only take ROW EXCLUSIVE locks and
+    do not block each other. The rows are tagged with the file's source and
+    replace those of an earlier version (see ``load_manifest.begin_file``);
+    the manifest entry commits with them. In a month-partitioned table they
+    land in the partition of the file's month (``partitions.MONTH_COLUMN``).
+    """
+    conn = pool.getconn()
+    try:
         try:
-            sample = pd.read_csv(file, nrows=5)
-            # Add all columns from this file to our set of all columns
-            all_columns.update(sample.columns)
+            # Check if all file columns are in our schema
+            missing_columns = [col for col in file_columns if col not in all_columns]
+            if missing_columns:
+                raise ValueError(f"File has columns not in schema: {missing_columns}")
+            
+            # Generate COPY command with columns
+            copy_sql = f"COPY {table_name}("
+            copy_sql += ", ".join([f"\"{col}\"" for col in file_columns])
+            copy_sql += ") FROM STDIN WITH CSV"
+            
+            with conn.cursor() as cursor:
+                begin_file(cursor.execute, table_name, pending)
+                set_load_month(cursor.execute, file)
+                rows, sent = copy_file(cursor, copy_sql, file)
+                record_file(cursor.execute, table_name, pending, rows)
+            conn.commit()
+            return LoadResult(file, "copy", rows, sent)
+        
         except Exception as e:
-            tqdm.write(f"[WARNING] Could not read schema from {file}: {e}")
-    
-    # Convert to sorted list for consistent column order
-    all_columns = sorted(list(all_columns))
-    tqdm.write(f"Created unified schema with {len(all_columns)} columns")
-    
+            if not conn.closed:
+                conn.rollback()
+            tqdm.write(f"[WARNING] Direct COPY failed for {file}: {e}")
+            tqdm.write(f"Falling back to temp table approach...")
+        
+        try:
+            # Fall back to temp table approach
+            with conn.cursor() as cursor:
+                begin_file(cursor.execute, table_name, pending)
+                set_load_month(cursor.execute, file)
+                
+                # Create a temporary table matching this file's schema
+                # (temporary tables are per connection, so workers do not collide)
+                temp_table = f"temp_{table_name}"
+                cursor.execute(f"DROP TABLE IF EXISTS {temp_table}")
+                
+                temp_table_sql = f"CREATE TEMPORARY TABLE {temp_table} ("
+                temp_table_sql += ", ".join([f"\"{col}\" TEXT" for col in file_columns])
+                temp_table_sql += ")"
+                cursor.execute(temp_table_sql)
+                
+                # Load data into temporary table
+                rows, sent = copy_file(cursor, f"COPY {temp_table} FROM STDIN WITH CSV", file)
+                
+                # Insert from temp table to main table with column mapping
+                insert_sql = f"INSERT INTO {table_name} ("
+                insert_sql += ", ".join([f"\"{col}\"" for col in all_columns])
+                insert_sql += ") SELECT "
+                
+                # For each target column, either select from temp table or NULL
+                select_parts = []
+                for col in all_columns:
+                    if col in file_columns:
+                        select_parts.append(f"\"{col}\"")
+                    else:
+                        select_parts.append("NULL")
+                
+                insert_sql += ", ".join(select_parts)
+                insert_sql += f" FROM {temp_table}"
+                
+                cursor.execute(insert_sql)
+                cursor.execute(f"DROP TABLE {temp_table}")
+                record_file(cursor.execute, table_name, pending, rows)
+            conn.commit()
+            return LoadResult(file, "fallback", rows, sent)
+        
+        except Exception as e2:
+            if not conn.closed:
+                conn.rollback()
+            tqdm.write(f"[ERROR] Both methods failed for {file}. Final error: {e2}")
+            return LoadResult(file, "error", error=str(e2))
+    finally:
+        # A broken connection is replaced rather than handed to the next file
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def _format_rate(num_bytes: int, rows: int, seconds: float) -> str:
+    mb = num_bytes / (1024 ** 2)
+    per_second = lambda value: value / seconds if seconds > 0 else 0
+    return f"{rows} rows, {mb:.1f} MB in {seconds:.1f}s, {per_second(rows):,.0f} rows/s, {per_second(mb):.1f} MB/s"
+
+
+def report_load(results: list[LoadResult], elapsed: float) -> None:
+    """Print the aggregate summary of a load."""
+    counts = {status: sum(r.status == status for r in results) for status in ("copy", "fallback", "error")}
+    loaded = [r for r in results if r.status != "error"]
+    tqdm.write(
+        f"Loaded {len(loaded)} files ({counts['fallback']} via temp table), failed {counts['error']} "
+        f"- {_format_rate(sum(r.bytes for r in loaded), sum(r.rows for r in loaded), elapsed)}"
+    )
+
+
+def create_raw_table(engine, table_name: str, all_columns: list) -> None:
+    """(Re)create *table_name* as an UNLOGGED table of TEXT *all_columns*, ready for COPY."""
     # Create table with all text columns to avoid type issues
     with engine.connect() as conn:
         conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
@@ -101,99 +268,293 @@ def load_csv_to_postgres_optimized(folder: Path, table_name: str, engine, filter
         # Set unlogged for faster inserts
         conn.execute(text(f"ALTER TABLE {table_name} SET UNLOGGED"))
         conn.commit()
+
+
+def ensure_raw_table(engine, table_name: str, all_columns: list, reload: bool = False,
+                     months: Optional[list] = None) -> bool:
+    """
+    Make *table_name* ready for an incremental load of *all_columns*: an
+    existing table only gains the columns it lacks (no rewrite), otherwise
+    it is created UNLOGGED with the ``_source_file`` column. With *months*
+    the table is range-partitioned on ``MONTH_COLUMN`` (an unpartitioned
+    one is rebuilt) and gets the missing partitions of *months*. Returns
+    whether it was created.
+    """
+    if prepare_table(engine, table_name, reload or (months is not None and not is_partitioned(engine, table_name))):
+        with engine.connect() as conn:
+            for col in all_columns:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS \"{col}\" TEXT"))
+            if months is not None:
+                add_partitions(conn, table_name, months, MONTH_COLUMN)
+            conn.commit()
+        return False
+    
+    if months is None:
+        create_raw_table(engine, table_name, all_columns)
+        with engine.connect() as conn:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {SOURCE_COLUMN_SQL}"))
+            conn.commit()
+        return True
     
+    # Partitioned tables cannot be UNLOGGED themselves; their partitions can
+    columns = ", ".join([f"\"{col}\" TEXT" for col in all_columns] + [SOURCE_COLUMN_SQL, MONTH_COLUMN_SQL])
+    with engine.connect() as conn:
+        conn.execute(text(partitioned_table_sql(table_name, columns, MONTH_COLUMN)))
+        add_partitions(conn, table_name, months, MONTH_COLUMN, unlogged=True)
+        conn.commit()
+    return True
+
+
+def is_partitioned(engine, table_name: str) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(text(is_partitioned_sql(table_name))).scalar()
+
+
+def add_partitions(conn, table_name: str, months: list, key: str, timezone: Optional[str] = None,
+                   unlogged: bool = False) -> None:
+    """The missing month partitions of *table_name* (see ``partitions.create_month_partitions``)."""
+    existing = [row[0] for row in conn.execute(text(partitions_sql(table_name)))]
+    create_month_partitions(lambda sql: conn.execute(text(sql)), table_name, months, timezone, unlogged, key, existing)
+
+
+def set_logged(conn, table_name: str) -> None:
+    """Re-enable logging of *table_name*, partition by partition if it is partitioned."""
+    partitions = [row[0] for row in conn.execute(text(partitions_sql(table_name)))]
+    for name in partitions or [table_name]:
+        conn.execute(text(f"ALTER TABLE {name} SET LOGGED"))
+
+
+def run_loads(files: Iterable[Path], load: Callable, workers: int, db_params: dict, desc: str) -> list[LoadResult]:
+    """
+    Run ``load(pool, file)`` for every file on up to *workers* threads
+    sharing a bounded connection pool, largest files first, and print the
+    aggregate summary. Returns the result per file.
+    """
     # Use COPY with appropriate options
-    conn_params = {k: DB_PARAMS[k] for k in ['host', 'port', 'dbname', 'user', 'password']}
+    conn_params = {k: db_params[k] for k in ['host', 'port', 'dbname', 'user', 'password']}
     
-    for file in tqdm(files, desc=f"Loading CSVs to {table_name}"):
-        try:
-            # Try direct COPY first (faster)
-            conn = psycopg2.connect(**conn_params)
-            with conn.cursor() as cursor:
-                # First read the file header to get its column structure
-                file_columns = pd.read_csv(file, nrows=0).columns.tolist()
-                
-                # Check if all file columns are in our schema
-                missing_columns = [col for col in file_columns if col not in all_columns]
-                if missing_columns:
-                    raise ValueError(f"File has columns not in schema: {missing_columns}")
-                
-                # Generate COPY command with columns
-                copy_sql = f"COPY {table_name}("
-                copy_sql += ", ".join([f"\"{col}\"" for col in file_columns])
-                copy_sql += ") FROM STDIN WITH CSV"
-                
-                with open(file, 'r', encoding='utf-8') as f:
-                    # Skip header
-                    header = next(f)
-                    cursor.copy_expert(copy_sql, f)
-                
-                conn.commit()
-            conn.close()
-            tqdm.write(f"Successfully loaded {file} (direct COPY)")
-            
-        except Exception as e:
-            tqdm.write(f"[WARNING] Direct COPY failed for {file}: {e}")
-            tqdm.write(f"Falling back to temp table approach...")
-            
-            try:
-                # Fall back to temp table approach
-                # First read the file header to get its column structure
-                file_columns = pd.read_csv(file, nrows=0).columns.tolist()
-                
-                # Connect for each file
-                conn = psycopg2.connect(**conn_params)
-                
-                with conn.cursor() as cursor:
-                    # Create a temporary table matching this file's schema
-                    temp_table = f"temp_{table_name}"
-                    cursor.execute(f"DROP TABLE IF EXISTS {temp_table}")
-                    
-                    temp_table_sql = f"CREATE TEMPORARY TABLE {temp_table} ("
-                    temp_table_sql += ", ".join([f"\"{col}\" TEXT" for col in file_columns])
-                    temp_table_sql += ")"
-                    cursor.execute(temp_table_sql)
-                    
-                    # Load data into temporary table
-                    with open(file, 'r', encoding='utf-8') as f:
-                        # Skip header
-                        header = next(f)
-                        
-                        cursor.copy_expert(
-                            f"COPY {temp_table} FROM STDIN WITH CSV",
-                            f
-                        )
-                    
-                    # Insert from temp table to main table with column mapping
-                    insert_sql = f"INSERT INTO {table_name} ("
-                    insert_sql += ", ".join([f"\"{col}\"" for col in all_columns])
-                    insert_sql += ") SELECT "
-                    
-                    # For each target column, either select from temp table or NULL
-                    select_parts = []
-                    for col in all_columns:
-                        if col in file_columns:
-                            select_parts.append(f"\"{col}\"")
-                        else:
-                            select_parts.append("NULL")
-                    
-                    insert_sql += ", ".join(select_parts)
-                    insert_sql += f" FROM {temp_table}"
-                    
-                    cursor.execute(insert_sql)
-                    cursor.execute(f"DROP TABLE {temp_table}")
-                    conn.commit()
-                
-                conn.close()
-                tqdm.write(f"Successfully loaded {file} (fallback method)")
-            except Exception as e2:
-                tqdm.write(f"[ERROR] Both methods failed for {file}. Final error: {e2}")
+    # Files are COPYed concurrently through a bounded pool, largest first
+    files = sorted(files, key=lambda f: f.stat().st_size, reverse=True)
+    pool = ThreadedConnectionPool(1, max(1, min(workers, len(files))), **conn_params)
+    results = []
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(load, pool, file): file for file in files}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # No connection could be made
+                    tqdm.write(f"[ERROR] Could not load {futures[future]}: {e}")
+                    result = LoadResult(futures[future], "error", error=str(e))
+                results.append(result)
+                if result.status != "error":
+                    method = "direct COPY" if result.status == "copy" else "fallback method"
+                    tqdm.write(f"Successfully loaded {result.file} ({method})")
+    finally:
+        pool.closeall()
+    report_load(results, time.perf_counter() - start)
+    return results
+
+
+def load_csv_to_postgres_optimized(folder: Path, table_name: str, engine, filter_years: Optional[range] = None,
+                                   month_range: Optional[MonthRange] = None, fmt: str = DEFAULT_STAGE_FORMAT,
+                                   workers: int = LOAD_WORKERS, db_params: dict = DB_PARAMS,
+                                   reload: bool = False, partition_by_month: bool = False) -> list[LoadResult]:
+    """
+    Load the stage files of *folder* into *table_name*, a table of TEXT
+    columns (the union of the files' columns) plus ``_source_file``. Loads
+    are incremental: files the load manifest lists with the same content
+    are skipped and changed ones replace their rows; *reload* starts from
+    an empty table. With *partition_by_month* the table has one partition
+    per stage month (see ``ensure_raw_table``), so every file is loaded
+    into, and replaced within, a single partition. Up to *workers* files are COPYed at once, each on its
+    own pooled connection and in its own transaction (see ``load_file``);
+    *db_params* must point at the database *engine* connects to. Returns
+    the result per loaded file.
+    """
+    # Candidates come from the raw/ archive index (year/month per member);
+    # Parquet stages are pruned by their year=/month= partitions
+    files = select_stage_files(folder, filter_years, month_range, suffix=STAGE_SUFFIX[fmt])
+    
+    tqdm.write(f"Loading {len(files)} files matching filter criteria")
+    
+    # Create a union schema from the file headers alone (CSV first line,
+    # Parquet footer), cached in <folder>/_header_cache.json by content hash
+    file_columns = discover_columns(files, folder)
+    all_columns = set().union(*file_columns.values())
+    
+    # Convert to sorted list for consistent column order
+    all_columns = sorted(list(all_columns))
+    tqdm.write(f"Created unified schema with {len(all_columns)} columns")
+    
+    # A new table is filled UNLOGGED; an existing one is appended to as it is
+    months = file_months(file_columns) if partition_by_month else None
+    created = ensure_raw_table(engine, table_name, all_columns, reload, months)
+    pending, skipped = plan_loads(engine, table_name, folder, file_columns)
+    pending = {item.file: item for item in pending}
+    tqdm.write(f"{skipped} files already loaded, {len(pending)} new or changed")
     
-    # Re-enable logging
+    results = [LoadResult(file, "error", error="unreadable header") for file in files if file not in file_columns]
+    load = lambda pool, file: load_file(pool, table_name, all_columns, file, file_columns[file], pending[file])
+    results += run_loads(pending, load, workers, db_params, f"Loading CSVs to {table_name}")
+    
+    finish_raw_table(engine, table_name, created)
+    return results
+
+
+def finish_raw_table(engine, table_name: str, created: bool) -> None:
+    """After an incremental load: re-enable logging of a *created* table and index the rows' sources."""
     with engine.connect() as conn:
-        conn.execute(text(f"ALTER TABLE {table_name} SET LOGGED"))
+        if created:
+            # Re-enable logging
+            set_logged(conn, table_name)
+        # Changed files delete their old rows by source
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {table_name}_source_idx ON {table_name} (\"{SOURCE_COLUMN}\")"))
+        conn.commit()
+
+
+def stage_batches(file: Path, columns: list) -> Iterator[pa.RecordBatch]:
+    """Record batches of the *columns* a stage file has: typed from Parquet, strings from CSV."""
+    if file.suffix == ".parquet":
+        parquet = pq.ParquetFile(file)
+        present = [c for c in columns if c in parquet.schema_arrow.names]
+        yield from parquet.iter_batches(batch_size=COPY_BATCH_ROWS, columns=present)
+    else:
+        with CsvScanner(file) as scanner:
+            _, batches = scanner.record_batches(columns)
+            yield from batches
+
+
+def clean_status_batch(batch: pa.RecordBatch, parsers: dict) -> tuple[list, np.ndarray, dict]:
+    """
+    Binary COPY fields of a status batch, cleaned the way
+    ``05_clean.clean_bicing_station_status`` cleans the raw table: counts
+    must be plain digits, ids integers and timestamps epochs (or a portal
+    date format, through the per-file *parsers*); anything else, ``NA``
+    included, becomes NULL. Returns the fields of the rows with a valid
+    ``last_updated`` (the others are dropped), the mask of those rows and
+    the number of present values made NULL per column.
+    """
+    names = batch.schema.names
+    converted, invalid = [], {}
+    for column, pg_type, source in STATUS_TYPED_COLUMNS:
+        values = batch.column(names.index(source)) if source in names else pa.nulls(batch.num_rows, pa.string())
+        if pg_type == "text":
+            converted.append((pg_type, text_values(values), None))
+            continue
+        if pg_type == "timestamptz":
+            numbers, valid = epoch_values(values, parsers[column])
+        else:
+            numbers, valid = integer_values(values, pg_type, SIGNED_INTEGER if column == "station_id" else DIGITS)
+        present = values.is_valid().to_numpy(zero_copy_only=False)
+        if not pa.types.is_integer(values.type):
+            present &= ~pc.fill_null(pc.is_in(values.cast(pa.string()), pa.array(["NA", ""])), True).to_numpy(
+                zero_copy_only=False)
+        invalid[column] = int((present & ~valid).sum())
+        converted.append((pg_type, numbers, valid))
+
+    keep = converted[-1][2]
+    fields = []
+    for pg_type, values, valid in converted:
+        if pg_type == "text":
+            fields.append((pg_type, values.filter(pa.array(keep)), None))
+        else:
+            fields.append((pg_type, values[keep], valid[keep]))
+    return fields, keep, invalid
+
+
+def load_typed_file(pool: ThreadedConnectionPool, table_name: str, file: Path, pending: PendingFile) -> LoadResult:
+    """
+    Load one status stage file into the typed *table_name* with binary
+    COPY, cleaning each record batch on the client (``clean_status_batch``)
+    before it is sent, in one transaction per file. As in ``load_file``,
+    the rows replace those of an earlier version of the file and the
+    manifest entry commits with them.
+    """
+    columns = ", ".join(f"\"{column}\"" for column, _, _ in STATUS_TYPED_COLUMNS)
+    copy_sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT binary)"
+    parsers = {column: TimestampParser(f"{file} ({column})")
+               for column, pg_type, _ in STATUS_TYPED_COLUMNS if pg_type == "timestamptz"}
+    rows = sent = dropped = 0
+    invalid = {}
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            begin_file(cursor.execute, table_name, pending)
+            for batch in stage_batches(file, [source for _, _, source in STATUS_TYPED_COLUMNS]):
+                fields, keep, batch_invalid = clean_status_batch(batch, parsers)
+                payload = encode_rows(fields)
+                cursor.copy_expert(copy_sql, io.BytesIO(payload))
+                rows += int(keep.sum())
+                dropped += batch.num_rows - int(keep.sum())
+                sent += len(payload)
+                for column, count in batch_invalid.items():
+                    invalid[column] = invalid.get(column, 0) + count
+            record_file(cursor.execute, table_name, pending, rows)
         conn.commit()
+    except Exception as e:
+        if not conn.closed:
+            conn.rollback()
+        tqdm.write(f"[ERROR] Typed COPY failed for {file}: {e}")
+        return LoadResult(file, "error", error=str(e))
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
 
+    nulled = {column: count for column, count in invalid.items() if count}
+    if dropped or nulled:
+        tqdm.write(f"[WARNING] {file}: dropped {dropped} rows without a valid last_updated; "
+                   f"invalid values loaded as NULL: {nulled}")
+    return LoadResult(file, "copy", rows, sent)
+
+
+def load_station_status_typed(folder: Path, table_name: str, engine, filter_years: Optional[range] = None,
+                              month_range: Optional[MonthRange] = None, fmt: str = DEFAULT_STAGE_FORMAT,
+                              workers: int = LOAD_WORKERS, db_params: dict = DB_PARAMS,
+                              reload: bool = False) -> list[LoadResult]:
+    """
+    Load the status stage files of *folder* straight into the typed
+    *table_name* (INTEGER ids, SMALLINT counts, TIMESTAMPTZ times, plus
+    ``_source_file``), the table ``05_clean.py`` otherwise derives from the
+    TEXT raw table with a full-table rewrite. The table is range-partitioned
+    on ``last_updated``, one partition per (Barcelona) month of the files;
+    missing months are added to an existing table. Loads are incremental
+    as in ``load_csv_to_postgres_optimized``; *reload* starts from an empty
+    table. Returns the result per loaded file.
+    """
+    files = select_stage_files(folder, filter_years, month_range, suffix=STAGE_SUFFIX[fmt])
+    tqdm.write(f"Loading {len(files)} files matching filter criteria")
+
+    # A new table is filled UNLOGGED; an existing one only gains the new months
+    created = not prepare_table(engine, table_name, reload or not is_partitioned(engine, table_name))
+    with engine.connect() as conn:
+        if created:
+            columns = [f"\"{column}\" {SQL_TYPES[pg_type]}" for column, pg_type, _ in STATUS_TYPED_COLUMNS]
+            conn.execute(text(partitioned_table_sql(table_name, ", ".join(columns + [SOURCE_COLUMN_SQL]),
+                                                    "last_updated")))
+        add_partitions(conn, table_name, file_months(files), "last_updated", LOCAL_TIMEZONE, unlogged=created)
+        conn.commit()
+
+    pending, skipped = plan_loads(engine, table_name, folder, files)
+    pending = {item.file: item for item in pending}
+    tqdm.write(f"{skipped} files already loaded, {len(pending)} new or changed")
+
+    load = lambda pool, file: load_typed_file(pool, table_name, file, pending[file])
+    results = run_loads(pending, load, workers, db_params, f"Loading typed status to {table_name}")
+
+    with engine.connect() as conn:
+        if created:
+            set_logged(conn, table_name)
+        # Changed files delete their old rows by source
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {table_name}_source_idx ON {table_name} (\"{SOURCE_COLUMN}\")"))
+        conn.commit()
+        # Rows stamped outside the files' months (e.g. just past a month end)
+        strays = conn.execute(text(f"SELECT COUNT(*) FROM {default_partition(table_name)}")).scalar()
+    if strays:
+        tqdm.write(f"[WARNING] {strays} rows outside the loaded months are in {default_partition(table_name)}")
+
+    return results
 
 if __name__ == "__main__":
     engine = create_engine(get_connection_string())
@@ -221,9 +582,19 @@ if __name__ == "__main__":
 
     # 3. Station Status
     log.info("===== LOADING STATION STATUS =====")
-    load_csv_to_postgres_optimized(
-        folder=BASE_PATH / "bicycle_stations/status/sampled",
-        table_name="bicycle_station_status_raw",
-        engine=engine,
-        filter_years=filter_years
-    )
+    if TYPED_STATUS_LOAD:
+        # Cleaned on the client; 05_clean.py picks this table up instead of _raw
+        load_station_status_typed(
+            folder=BASE_PATH / "bicycle_stations/status/sampled",
+            table_name=STATUS_TYPED_TABLE,
+            engine=engine,
+            filter_years=filter_years
+        )
+    else:
+        load_csv_to_postgres_optimized(
+            folder=BASE_PATH / "bicycle_stations/status/sampled",
+            table_name="bicycle_station_status_raw",
+            engine=engine,
+            filter_years=filter_years,
+            partition_by_month=True
+        )
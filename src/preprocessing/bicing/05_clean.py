@@ -2,6 +2,11 @@ import logging
 import psycopg2
 from typing import List
 
+from src.preprocessing.common.partitions import (create_month_partitions, default_partition, detach_month_sql,
+                                                 month_partition, partition_month, partitioned_table_sql, partitions_sql)
+from src.preprocessing.common.load_manifest import LOAD_MANIFEST_TABLE, SOURCE_COLUMN
+from src.preprocessing.common.pgcopy import LOCAL_TIMEZONE
+
 DB_PARAMS = {
     "host": "dtim.essi.upc.edu",
     "port": 5432,
@@ -10,6 +15,10 @@ DB_PARAMS = {
     "password": "DMT2025!"
 }
 
+# Status loaded already typed and cleaned by 04_load_raw.load_station_status_typed
+TYPED_STATUS_TABLE = "bicycle_station_status_typed"
+RAW_STATUS_TABLE = "bicycle_station_status_raw"
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
@@ -46,6 +55,44 @@ def execute_sql(sql: str, fetch=False):
         conn.close()
 
 
+def table_exists(table_name: str) -> bool:
+    return execute_sql(f"SELECT to_regclass('{table_name}') IS NOT NULL", fetch=True)[0][0]
+
+
+def list_partitions(table_name: str) -> List[str]:
+    """Partitions of *table_name*, months in order; empty if it is not partitioned."""
+    return [row[0] for row in execute_sql(partitions_sql(table_name), fetch=True)]
+
+
+def table_months(table_name: str, column: str = "last_updated"):
+    """The (year, month) pairs of *column*, in Barcelona time (one full scan)."""
+    rows = execute_sql(f"""
+    SET TIME ZONE '{LOCAL_TIMEZONE}';
+    SELECT DISTINCT EXTRACT(YEAR FROM month)::INT, EXTRACT(MONTH FROM month)::INT
+    FROM (SELECT date_trunc('month', {column}) AS month FROM {table_name} WHERE {column} IS NOT NULL) months
+    """, fetch=True)
+    return sorted(tuple(row) for row in rows)
+
+
+def rename_partitioned(table_name: str, new_name: str):
+    """Rename *table_name* and its partitions, which are named after it."""
+    for partition in list_partitions(table_name):
+        month = partition_month(partition)
+        new_partition = month_partition(new_name, month) if month else default_partition(new_name)
+        execute_sql(f"ALTER TABLE {partition} RENAME TO {new_partition}")
+    execute_sql(f"ALTER TABLE {table_name} RENAME TO {new_name}")
+
+
+def retire_status_month(year: int, month: int, drop: bool = False, table_name: str = "bicycle_station_status_clean"):
+    """
+    Detach (and with *drop*, drop) one month of a partitioned status table.
+    Neither rewrites rows, unlike a DELETE; a detached month can still be
+    dumped before it is dropped.
+    """
+    for statement in detach_month_sql(table_name, (year, month), drop):
+        execute_sql(statement)
+
+
 def get_timestamp_format(table_name: str):
     """Determine the format of the timestamp column."""
     log.info(f"Checking timestamp format in {table_name}...")
@@ -294,9 +341,43 @@ def clean_bicing_station_information():
     }
 
 
-def clean_bicing_station_status():
-    """Master function to clean bicycle station status data using CTEs."""
-    source_table = "bicycle_station_status_raw"
+def last_loaded(table_name: str):
+    """When a file was last loaded into *table_name* (``_load_manifest``); None if none was recorded."""
+    if not table_exists(LOAD_MANIFEST_TABLE):
+        return None
+    return execute_sql(f"SELECT max(loaded_at) FROM {LOAD_MANIFEST_TABLE} WHERE table_name = '{table_name}'",
+                       fetch=True)[0][0]
+
+
+def status_source(typed_table: str, raw_table: str = RAW_STATUS_TABLE) -> str:
+    """
+    The status table to clean. Both tables persist across runs, so when both
+    exist (status was loaded once with ``TYPED_STATUS_LOAD`` and once
+    without) the one a file was loaded into last is used, and a warning is
+    logged; a table without manifest entries counts as older.
+    """
+    if not (typed_table and table_exists(typed_table)):
+        return raw_table
+    if not table_exists(raw_table):
+        return typed_table
+    typed_at, raw_at = last_loaded(typed_table), last_loaded(raw_table)
+    chosen = typed_table if typed_at is not None and (raw_at is None or typed_at >= raw_at) else raw_table
+    log.warning(f"Both {typed_table} (last loaded {typed_at}) and {raw_table} (last loaded {raw_at}) exist; "
+                f"cleaning {chosen}. Drop the other one if it is stale")
+    return chosen
+
+
+def clean_bicing_station_status(typed_table: str = TYPED_STATUS_TABLE):
+    """
+    Master function to clean bicycle station status data using CTEs. If
+    04_load_raw loaded *typed_table* (typed and cleaned while copying) more
+    recently than the raw table (see ``status_source``), it replaces Step 1
+    and the raw table is not read; it is read in place and kept, so the next
+    load only adds new files to it. A month-partitioned raw table is converted one
+    partition at a time into a temporary table partitioned by the month of
+    last_updated, and the clean table is partitioned the same way.
+    """
+    source_table = RAW_STATUS_TABLE
     clean_table = "bicycle_station_status_clean"
     
     # Define the columns we need
@@ -304,6 +385,10 @@ def clean_bicing_station_status():
                       "num_bikes_available_types.ebike", "num_docks_available", "last_reported", 
                       "status", "last_updated"]
     
+    if status_source(typed_table, source_table) == typed_table:
+        log.info(f"Step 1: Skipped, {typed_table} was cleaned while loading")
+        return finish_station_status_cleaning(clean_table, typed_table)
+    
     # Step 1: Clean the data with CTEs
     log.info("Step 1: Cleaning status data with CTE approach")
     
@@ -317,17 +402,19 @@ def clean_bicing_station_status():
         # Handle scientific notation (e.g. "1.578e+09") by first casting to numeric
         last_updated_expr = 'TO_TIMESTAMP(CAST(CAST("last_updated" AS NUMERIC) AS BIGINT))'
         last_reported_expr = 'TO_TIMESTAMP(CAST(CAST("last_reported" AS NUMERIC) AS BIGINT))'
+        timestamp_type = "TIMESTAMPTZ"
     else:
         last_updated_expr = 'CAST("last_updated" AS TIMESTAMP)'
         last_reported_expr = 'CAST("last_reported" AS TIMESTAMP)'
+        timestamp_type = "TIMESTAMP"
     
     # Drop existing table if it exists
     execute_sql(f"DROP TABLE IF EXISTS temp_clean_status")
     
     # Comprehensive CTE-based query for status data
     log.info("Building and executing comprehensive cleaning query for status data...")
-    sql_clean = f"""
-    CREATE TABLE temp_clean_status AS
+    def sql_clean(source: str) -> str:
+        return f"""
     WITH 
     -- Step 1: Convert raw data types
     converted AS (
@@ -365,7 +452,7 @@ def clean_bicing_station_status():
                 WHEN "last_updated" = 'NA' THEN NULL
                 ELSE {last_updated_expr}
             END AS last_updated
-        FROM {source_table}
+        FROM {source}
         WHERE "last_updated" IS NOT NULL AND "last_updated" != 'NA'
     )
     
@@ -382,18 +469,42 @@ def clean_bicing_station_status():
     FROM converted
     """
     
-    execute_sql(sql_clean)
+    raw_partitions = list_partitions(source_table)
+    if raw_partitions:
+        # One statement per raw (file month) partition, routed by last_updated
+        execute_sql(partitioned_table_sql("temp_clean_status", f"""
+            station_id INTEGER, num_bikes_available INTEGER, mechanical_bikes INTEGER, ebikes INTEGER,
+            num_docks_available INTEGER, last_reported {timestamp_type}, status TEXT,
+            last_updated {timestamp_type}""", "last_updated"))
+        months = [month for month in map(partition_month, raw_partitions) if month]
+        create_month_partitions(execute_sql, "temp_clean_status", months, LOCAL_TIMEZONE)
+        for partition in raw_partitions:
+            execute_sql(f"INSERT INTO temp_clean_status {sql_clean(partition)}")
+            log.info(f"Cleaned {partition}")
+    else:
+        execute_sql(f"CREATE TABLE temp_clean_status AS {sql_clean(source_table)}")
     
     # Count rows
     row_count = execute_sql(f"SELECT COUNT(*) FROM temp_clean_status", fetch=True)[0][0]
     log.info(f"Created temp clean status table with {row_count:,} rows")
     
+    return finish_station_status_cleaning(clean_table)
+
+
+def finish_station_status_cleaning(clean_table: str, source_table: str = "temp_clean_status"):
+    """
+    Steps 2 and 3 of the status cleaning, from the typed *source_table*
+    (temp_clean_status, or the typed table 04_load_raw loaded, which is
+    kept) into *clean_table* partitioned by month of last_updated. A
+    partitioned source is read partition by partition; a partitioned
+    temp_clean_status is just renamed when nothing is imputed.
+    """
     # Step 2: Analyze missing values
     log.info("Step 2: Analyzing missing values in status data")
     status_columns = ["station_id", "num_bikes_available", "mechanical_bikes", "ebikes", 
                        "num_docks_available", "last_reported", "status", "last_updated"]
     
-    missing_stats = analyze_missing_values("temp_clean_status", status_columns)
+    missing_stats = analyze_missing_values(source_table, status_columns)
     
     # Step 3: Impute if needed
     log.info("Step 3: Handling missing values in status data")
@@ -407,49 +518,70 @@ def clean_bicing_station_status():
             log.warning(f"Column '{column}' has {stats['missing_percentage']}% missing values")
             needs_imputation = True
     
-    if needs_imputation:
-        log.info("Imputing missing values for station status data...")
-        execute_sql(f"DROP TABLE IF EXISTS {clean_table}")
+    temp_partitions = list_partitions(source_table)
+    execute_sql(f"DROP TABLE IF EXISTS {clean_table}")
+    
+    if not needs_imputation and temp_partitions and source_table == "temp_clean_status":
+        # If no imputation needed, just rename the table (and its partitions)
+        rename_partitioned("temp_clean_status", clean_table)
+    else:
+        # The clean table is partitioned by month of last_updated, like the temp one
+        months = [month for month in map(partition_month, temp_partitions) if month] \
+            if temp_partitions else table_months(source_table)
+        execute_sql(partitioned_table_sql(clean_table, f"LIKE {source_table}", "last_updated"))
+        # Load bookkeeping of the typed table is not part of the clean data
+        execute_sql(f"ALTER TABLE {clean_table} DROP COLUMN IF EXISTS \"{SOURCE_COLUMN}\"")
         
-        # Impute missing values with a CTE approach
-        sql_impute = f"""
-        CREATE TABLE {clean_table} AS
-        WITH 
-        -- Calculate median num_bikes_available per station
-        bike_medians AS (
+        if needs_imputation:
+            log.info("Imputing missing values for station status data...")
+            # Medians are per station over all months, so they are computed once
+            execute_sql("DROP TABLE IF EXISTS temp_status_medians")
+            execute_sql(f"""
+            CREATE TABLE temp_status_medians AS
             SELECT 
                 station_id,
                 PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY num_bikes_available) AS median_bikes,
                 PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY mechanical_bikes) AS median_mechanical,
                 PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY ebikes) AS median_ebikes,
                 PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY num_docks_available) AS median_docks
-            FROM temp_clean_status
+            FROM {source_table}
             WHERE num_bikes_available IS NOT NULL 
               OR mechanical_bikes IS NOT NULL 
               OR ebikes IS NOT NULL 
               OR num_docks_available IS NOT NULL
             GROUP BY station_id
-        )
+            """)
+            # Imputed counts are medians, as CREATE TABLE AS typed them
+            execute_sql(f"""
+            ALTER TABLE {clean_table}
+                ALTER COLUMN num_bikes_available TYPE DOUBLE PRECISION,
+                ALTER COLUMN mechanical_bikes TYPE DOUBLE PRECISION,
+                ALTER COLUMN ebikes TYPE DOUBLE PRECISION,
+                ALTER COLUMN num_docks_available TYPE DOUBLE PRECISION
+            """)
+        create_month_partitions(execute_sql, clean_table, months, LOCAL_TIMEZONE)
         
-        -- Join everything together with imputed values
-        SELECT 
-            t.station_id,
-            COALESCE(t.num_bikes_available, b.median_bikes) AS num_bikes_available,
-            COALESCE(t.mechanical_bikes, b.median_mechanical) AS mechanical_bikes,
-            COALESCE(t.ebikes, b.median_ebikes) AS ebikes,
-            COALESCE(t.num_docks_available, b.median_docks) AS num_docks_available,
-            t.last_reported,
-            t.status,
-            t.last_updated
-        FROM temp_clean_status t
-        LEFT JOIN bike_medians b ON t.station_id = b.station_id
-        """
-        
-        execute_sql(sql_impute)
-    else:
-        # If no imputation needed, just rename the table
-        execute_sql(f"DROP TABLE IF EXISTS {clean_table}")
-        execute_sql(f"ALTER TABLE temp_clean_status RENAME TO {clean_table}")
+        # One statement per month keeps each transaction to one partition
+        for source in temp_partitions or [source_table]:
+            if needs_imputation:
+                execute_sql(f"""
+                INSERT INTO {clean_table}
+                SELECT 
+                    t.station_id,
+                    COALESCE(t.num_bikes_available, b.median_bikes) AS num_bikes_available,
+                    COALESCE(t.mechanical_bikes, b.median_mechanical) AS mechanical_bikes,
+                    COALESCE(t.ebikes, b.median_ebikes) AS ebikes,
+                    COALESCE(t.num_docks_available, b.median_docks) AS num_docks_available,
+                    t.last_reported,
+                    t.status,
+                    t.last_updated
+                FROM {source} t
+                LEFT JOIN temp_status_medians b ON t.station_id = b.station_id
+                """)
+            else:
+                execute_sql(f"INSERT INTO {clean_table} SELECT {', '.join(status_columns)} FROM {source}")
+            log.info(f"Filled {clean_table} from {source}")
+        execute_sql("DROP TABLE IF EXISTS temp_status_medians")
     
     # Clean up temporary tables
     execute_sql("DROP TABLE IF EXISTS temp_clean_status")
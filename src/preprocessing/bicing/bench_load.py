@@ -0,0 +1,59 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+from src.preprocessing.bicing.bench_project import write_sample
+from src.preprocessing.common.load_manifest import LOAD_MANIFEST_TABLE
+
+load_raw = importlib.import_module("src.preprocessing.bicing.04_load_raw")
+
+# Local PostgreSQL, from the usual libpq environment variables
+LOCAL_DB = {
+    "host": os.environ.get("PGHOST", "localhost"),
+    "port": int(os.environ.get("PGPORT", 5432)),
+    "dbname": os.environ.get("PGDATABASE", "postgres"),
+    "user": os.environ.get("PGUSER", "postgres"),
+    "password": os.environ.get("PGPASSWORD", ""),
+}
+TABLE = "bench_station_status_raw"
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+if __name__ == "__main__":
+    # python -m src.preprocessing.bicing.bench_load [rows per file] [files]
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    file_count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    engine = create_engine(load_raw.get_connection_string(LOCAL_DB))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / "sampled"
+        for i in range(file_count):
+            name = f"2020_{i % 12 + 1:02d}_{i:03d}_STATIONS"
+            (folder / name).mkdir(parents=True)
+            write_sample(folder / name / f"{name}.csv", rows)
+        mb = sum(f.stat().st_size for f in folder.rglob("*.csv")) / 1024 ** 2
+        print(f"Input: {file_count} files, {file_count * rows:,} rows, {mb:.1f} MB")
+
+        timings = {}
+        for workers in WORKER_COUNTS:
+            # Loads are incremental: every run starts from an empty table and manifest
+            start = time.perf_counter()
+            results = load_raw.load_csv_to_postgres_optimized(folder, TABLE, engine, fmt="csv", workers=workers,
+                                                              db_params=LOCAL_DB, reload=True)
+            timings[workers] = seconds = time.perf_counter() - start
+            loaded = sum(r.rows for r in results)
+            print(f"workers={workers:<3} {loaded:>12,} rows  {seconds:8.2f}s  {loaded / seconds:>12,.0f} rows/s  "
+                  f"{mb / seconds:8.1f} MB/s")
+
+        best = min(timings, key=timings.get)
+        print(f"Speed-up: {timings[1] / timings[best]:.1f}x with {best} workers")
+
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            conn.execute(text(f"DELETE FROM {LOAD_MANIFEST_TABLE} WHERE table_name = :t"), {"t": TABLE})
+            conn.commit()
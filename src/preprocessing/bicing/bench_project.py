@@ -0,0 +1,79 @@
+import importlib
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.preprocessing.common.columnar import project_csv
+from src.preprocessing.common.scanner import CsvScanner
+
+project = importlib.import_module("src.preprocessing.bicing.02_project")
+
+# Header of the 2019-2024 station status dumps
+STATUS_HEADER = [
+    "station_id", "num_bikes_available", "num_bikes_available_types.mechanical",
+    "num_bikes_available_types.ebike", "num_docks_available", "last_reported",
+    "is_charging_station", "status", "is_installed", "is_renting", "is_returning",
+    "traffic", "last_updated", "ttl",
+]
+
+
+def write_sample(path: Path, rows: int, stations: int = 500) -> None:
+    """Synthetic status CSV shaped like the portal files."""
+    rng = random.Random(0)
+    t0 = 1577836800
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        f.write(",".join(STATUS_HEADER) + "\r\n")
+        for i in range(rows):
+            ts = t0 + (i // stations) * 60
+            bikes, mech = rng.randint(0, 30), rng.randint(0, 20)
+            f.write(f"{i % stations + 1},{bikes},{mech},{bikes - mech},{rng.randint(0, 30)},{ts},"
+                    f"TRUE,IN_SERVICE,1,1,1,,{ts + 10},30\r\n")
+
+
+def run(label: str, fn, input_file: Path, output_file: Path) -> float:
+    start = time.perf_counter()
+    rows = fn(input_file, output_file)
+    seconds = time.perf_counter() - start
+    mb = input_file.stat().st_size / 1024 ** 2
+    print(f"{label:<10} {rows:>12,} rows  {seconds:8.2f}s  {rows / seconds:>12,.0f} rows/s  {mb / seconds:8.1f} MB/s")
+    return seconds
+
+
+def row_wise(input_file: Path, output_file: Path) -> int:
+    with open(input_file, "r", newline="", encoding="utf-8") as f:
+        return project.project_stream(f, output_file, project.NEEDED_COLUMNS["status"], str(input_file))
+
+
+def scanned(input_file: Path, output_file: Path) -> int:
+    with CsvScanner(input_file) as scanner:
+        return project.project_rows(scanner, output_file, project.NEEDED_COLUMNS["status"], str(input_file), "csv")
+
+
+def columnar(input_file: Path, output_file: Path) -> int:
+    with open(input_file, "rb") as f:
+        return project_csv(f, output_file, project.NEEDED_COLUMNS["status"], str(input_file))
+
+
+if __name__ == "__main__":
+    # python -m src.preprocessing.bicing.bench_project [rows | path/to/status.csv]
+    arg = sys.argv[1] if len(sys.argv) > 1 else "2000000"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if arg.isdigit():
+            input_file = tmp / "status.csv"
+            write_sample(input_file, int(arg))
+        else:
+            input_file = Path(arg)
+        print(f"Input: {input_file} ({input_file.stat().st_size / 1024 ** 2:.1f} MB)")
+
+        baseline = run("row-wise", row_wise, input_file, tmp / "row_wise.csv")
+        scanner = run("scanner", scanned, input_file, tmp / "scanner.csv")
+        arrow = run("columnar", columnar, input_file, tmp / "columnar.csv")
+        print(f"Speed-up: scanner {baseline / scanner:.1f}x, columnar {baseline / arrow:.1f}x")
+
+        expected = (tmp / "row_wise.csv").read_bytes()
+        same = all((tmp / name).read_bytes() == expected for name in ("scanner.csv", "columnar.csv"))
+        print(f"Outputs identical: {same}")
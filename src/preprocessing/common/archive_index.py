@@ -0,0 +1,198 @@
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Iterable, Optional
+
+from src.preprocessing.common.archives import ARCHIVE_SUFFIXES, list_members
+from src.preprocessing.common.manifest import write_json_atomic
+
+INDEX_NAME = "_archive_index.json"
+
+# Bicing files are named like 2020_01_Gener_BicingNou_ESTACIONS.7z
+PERIOD_PATTERN = re.compile(r"(20\d{2})(?:[_-](0[1-9]|1[0-2])(?!\d))?")
+
+# Inclusive ("YYYY-MM", "YYYY-MM") bounds, e.g. ("2020-01", "2020-03")
+MonthRange = tuple[str, str]
+
+# Partition folder for files without a year/month (Hive convention)
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+log = logging.getLogger(__name__)
+
+
+def parse_period(name: str) -> tuple[Optional[int], Optional[int]]:
+    """(year, month) encoded in a file name; either may be None."""
+    match = PERIOD_PATTERN.search(name)
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+
+def in_period(
+    year: Optional[int],
+    month: Optional[int],
+    filter_years: Optional[Iterable[int]] = None,
+    month_range: Optional[MonthRange] = None,
+) -> bool:
+    """
+    True if (year, month) passes the filters. A file with a year but no month
+    passes a month range that overlaps its year; a file without a year only
+    passes when no filter is given.
+    """
+    if filter_years is None and month_range is None:
+        return True
+    if year is None:
+        return False
+    if filter_years is not None and year not in filter_years:
+        return False
+    if month_range is not None:
+        lo, hi = (tuple(int(x) for x in bound.split("-")) for bound in month_range)
+        if month is None:
+            return lo[0] <= year <= hi[0]
+        return lo <= (year, month) <= hi
+    return True
+
+
+class ArchiveIndex:
+    """
+    Persistent listing of the members of every archive under a ``raw/`` folder:
+    name, uncompressed size and the year/month parsed from the name. Archives
+    are only re-listed when their size or mtime changes.
+    """
+
+    def __init__(self, raw_root: Path):
+        self.raw_root = raw_root
+        self.path = raw_root / INDEX_NAME
+        self.archives: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.archives = json.load(f)
+
+    def refresh(self) -> "ArchiveIndex":
+        """Index new or changed archives and forget deleted ones."""
+        seen = set()
+        changed = False
+        for archive in sorted(self.raw_root.rglob("*")):
+            if archive.suffix not in ARCHIVE_SUFFIXES:
+                continue
+            key = archive.relative_to(self.raw_root).as_posix()
+            seen.add(key)
+            stat = archive.stat()
+            entry = self.archives.get(key)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            try:
+                members = [self._member(archive, name, size) for name, size in list_members(archive)]
+            except Exception as e:
+                print(f"[WARNING] Could not list {key}: {e}")
+                continue
+            self.archives[key] = {"size": stat.st_size, "mtime": stat.st_mtime, "members": members}
+            changed = True
+
+        for key in set(self.archives) - seen:
+            del self.archives[key]
+            changed = True
+        if changed:
+            write_json_atomic(self.path, self.archives)
+        return self
+
+    @staticmethod
+    def _member(archive: Path, name: str, size: int) -> dict:
+        year, month = member_period(archive, name)
+        return {"name": name, "size": size, "year": year, "month": month}
+
+    def select(
+        self,
+        filter_years: Optional[Iterable[int]] = None,
+        month_range: Optional[MonthRange] = None,
+        suffix: str = ".csv",
+    ) -> dict[Path, list[dict]]:
+        """Archive path -> its *suffix* members inside the requested period."""
+        years = set(filter_years) if filter_years is not None else None
+        selected = {}
+        for key, entry in self.archives.items():
+            members = [
+                m for m in entry["members"]
+                if m["name"].endswith(suffix) and in_period(m["year"], m["month"], years, month_range)
+            ]
+            if members:
+                selected[self.raw_root / key] = members
+        return selected
+
+
+def member_period(archive: Path, name: str) -> tuple[Optional[int], Optional[int]]:
+    """Period of an archive member, falling back to the archive name."""
+    year, month = parse_period(Path(name).name)
+    if year is None:
+        year, month = parse_period(archive.name)
+    return year, month
+
+
+def partition_dir(stage_dir: Path, year: Optional[int], month: Optional[int]) -> Path:
+    """``<stage_dir>/year=YYYY/month=MM``, the layout of the Parquet stages."""
+    return (stage_dir
+            / f"year={year if year is not None else NULL_PARTITION}"
+            / f"month={f'{month:02d}' if month is not None else NULL_PARTITION}")
+
+
+def select_stage_files(
+    stage_dir: Path,
+    filter_years: Optional[Iterable[int]] = None,
+    month_range: Optional[MonthRange] = None,
+    suffix: str = ".csv",
+) -> list[Path]:
+    """
+    Files of a bicing stage folder (decompressed/, projected/, sampled/) in the
+    requested period. CSV stages mirror ``<archive>/<member>`` and Parquet
+    stages are partitioned as ``year=/month=/<member>.parquet``, so archive
+    members are selected through the sibling ``raw/`` index; other files are
+    selected by the period parsed from their path. Stage files no archive
+    accounts for (loose CSVs, files staged before the index existed) are
+    still returned, with a warning.
+    """
+    years = set(filter_years) if filter_years is not None else None
+    globbed = [
+        f for f in stage_dir.glob(f"**/*{suffix}")
+        if in_period(*path_period(f), years, month_range)
+    ]
+
+    raw_root = stage_dir.parent / "raw"
+    if raw_root.exists():
+        index = ArchiveIndex(raw_root).refresh()
+        if index.archives:
+            files = []
+            for archive, members in index.select(filter_years, month_range).items():
+                if suffix == ".csv":
+                    folder = stage_dir / archive.relative_to(raw_root).with_suffix("")
+                    files.extend(folder / m["name"] for m in members)
+                else:
+                    files.extend(partition_dir(stage_dir, m["year"], m["month"]) / (Path(m["name"]).stem + suffix)
+                                 for m in members)
+            files = [f for f in files if f.exists()]
+            indexed = set(files)
+            unindexed = [f for f in globbed if f not in indexed]
+            if unindexed:
+                log.warning(f"{len(unindexed)} files in {stage_dir} are not members of an archive in {raw_root}; "
+                            f"selecting them by their path: {[str(f) for f in unindexed[:5]]}")
+            return files + unindexed
+
+    return globbed
+
+
+def path_period(path: Path) -> tuple[Optional[int], Optional[int]]:
+    """
+    Period of a stage file: its ``year=/month=`` partition folders, else the
+    file name, falling back to its folder (the archive name).
+    """
+    keys = dict(part.split("=", 1) for part in path.parent.parts[-2:] if "=" in part)
+    if "year" in keys:
+        def value(key):
+            v = keys.get(key, NULL_PARTITION)
+            return int(v) if v != NULL_PARTITION else None
+        return value("year"), value("month")
+
+    year, month = parse_period(path.name)
+    if year is None:
+        year, month = parse_period(path.parent.name)
+    return year, month
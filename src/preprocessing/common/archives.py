@@ -0,0 +1,265 @@
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TextIO
+
+import py7zr
+from py7zr.io import Py7zIO, WriterFactory
+
+ARCHIVE_SUFFIXES = (".zip", ".7z")
+TMP_SUFFIX = ".tmp"
+STREAM_QUEUE_CHUNKS = 64          # bounded hand-off between the 7z thread and the reader
+
+
+def decompress_archive(file_path: Path, dest_dir: Path) -> None:
+    """Extract *file_path* into *dest_dir* (creates the folder if missing)."""
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    if file_path.suffix == ".zip":
+        with zipfile.ZipFile(file_path, "r") as zip_ref:
+            zip_ref.extractall(dest_dir)
+
+    elif file_path.suffix == ".7z":
+        with py7zr.SevenZipFile(file_path, mode='r') as archive:
+            archive.extractall(path=dest_dir)
+
+    else:
+        raise ValueError(f"Unsupported file type: {file_path.suffix}")
+
+
+def extract_atomic(file_path: Path, out_folder: Path) -> float:
+    """
+    Extract into a sibling ``<out_folder>.tmp`` and rename it to *out_folder*
+    once finished, so *out_folder* only ever exists fully populated.
+    Returns the extraction time in seconds (runs inside pool workers).
+    """
+    start = time.perf_counter()
+    tmp = out_folder.with_name(out_folder.name + TMP_SUFFIX)
+    if tmp.exists():
+        shutil.rmtree(tmp)  # leftover from a crashed run
+
+    try:
+        decompress_archive(file_path, tmp)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if out_folder.exists():
+        out_folder.rmdir()  # only ever an empty folder here; non-empty ones are skipped
+    os.replace(tmp, out_folder)
+    return time.perf_counter() - start
+
+
+def extract_members_atomic(file_path: Path, out_folder: Path, members: list[str]) -> float:
+    """
+    Extract only *members* into *out_folder*. They are decompressed into
+    ``<out_folder>.tmp`` and each file is renamed into place when done, so
+    *out_folder* may be partial but never holds a truncated file.
+    """
+    start = time.perf_counter()
+    tmp = out_folder.with_name(out_folder.name + TMP_SUFFIX)
+    if tmp.exists():
+        shutil.rmtree(tmp)
+
+    try:
+        tmp.mkdir(parents=True)
+        if file_path.suffix == ".zip":
+            with zipfile.ZipFile(file_path, "r") as zip_ref:
+                zip_ref.extractall(tmp, members=members)
+        elif file_path.suffix == ".7z":
+            with py7zr.SevenZipFile(file_path, mode='r') as archive:
+                archive.extract(path=tmp, targets=members)
+        else:
+            raise ValueError(f"Unsupported file type: {file_path.suffix}")
+
+        for name in members:
+            target = out_folder / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp / name, target)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return time.perf_counter() - start
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reading CSV members without extracting to disk
+# ─────────────────────────────────────────────────────────────────────────────
+
+def list_members(file_path: Path) -> list[tuple[str, int]]:
+    """(name, uncompressed size) of the regular files inside an archive, in archive order."""
+    if file_path.suffix == ".zip":
+        with zipfile.ZipFile(file_path, "r") as zip_ref:
+            return [(i.filename, i.file_size) for i in zip_ref.infolist() if not i.is_dir()]
+    elif file_path.suffix == ".7z":
+        with py7zr.SevenZipFile(file_path, mode='r') as archive:
+            return [(i.filename, i.uncompressed) for i in archive.list() if not i.is_directory]
+    raise ValueError(f"Unsupported file type: {file_path.suffix}")
+
+
+def list_csv_members(file_path: Path) -> list[str]:
+    """Names of the CSV files inside an archive, in archive order."""
+    return [name for name, _ in list_members(file_path) if name.endswith(".csv")]
+
+
+def iter_csv_members(file_path: Path, members: Optional[Iterable[str]] = None) -> Iterator[tuple[str, TextIO]]:
+    """
+    Yield ``(member_name, text_stream)`` for the CSV members of an archive
+    (all of them, or only *members*), decompressing on the fly. Each stream is
+    only valid until the next member is requested.
+    """
+    wanted = list(members) if members is not None else list_csv_members(file_path)
+    if not wanted:
+        return
+
+    if file_path.suffix == ".zip":
+        with zipfile.ZipFile(file_path, "r") as zip_ref:
+            for name in wanted:
+                with zip_ref.open(name) as raw:
+                    yield name, _text(raw)
+    elif file_path.suffix == ".7z":
+        yield from _iter_7z_members(file_path, wanted)
+    else:
+        raise ValueError(f"Unsupported file type: {file_path.suffix}")
+
+
+def _text(raw) -> TextIO:
+    return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=1024 * 1024), encoding="utf-8", newline="")
+
+
+_END = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _QueueWriter(Py7zIO):
+    """py7zr output sink that hands decompressed chunks to the reading thread."""
+
+    def __init__(self, feed: "_SevenZipFeed"):
+        self.feed = feed
+        self._size = 0
+
+    def write(self, s) -> int:
+        self.feed.put(bytes(s))
+        self._size += len(s)
+        return len(s)
+
+    def read(self, size=None) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return self._size
+
+
+class _SevenZipFeed(WriterFactory):
+    """
+    Runs one extraction pass over all wanted members in a background thread.
+    Solid 7z blocks are decoded once; member boundaries travel through the
+    queue as ``(name,)`` markers.
+    """
+
+    def __init__(self, file_path: Path, members: list[str]):
+        self.queue = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(file_path, members), daemon=True)
+
+    def create(self, filename: str) -> Py7zIO:
+        self.put((filename,))
+        return _QueueWriter(self)
+
+    def put(self, item) -> None:
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _Cancelled()
+
+    def _run(self, file_path: Path, members: list[str]) -> None:
+        try:
+            # A file object (rather than a path) keeps py7zr single-threaded,
+            # so members are written one after another.
+            with open(file_path, "rb") as fp, py7zr.SevenZipFile(fp, mode='r') as archive:
+                archive.extract(targets=members, factory=self)
+            self.put(_END)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            try:
+                self.put(e)
+            except _Cancelled:
+                pass
+
+
+class _MemberReader(io.RawIOBase):
+    def __init__(self, source: "_MemberSource"):
+        self.source = source
+        self.chunk = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.chunk:
+            item = self.source.next_chunk()
+            if item is None:
+                return 0
+            self.chunk = memoryview(item)
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+
+class _MemberSource:
+    """Splits the feed's queue into per-member byte sequences."""
+
+    def __init__(self, feed: _SevenZipFeed):
+        self.feed = feed
+        self.pending = None        # marker that ended the current member
+
+    def next_item(self):
+        item = self.feed.queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def next_chunk(self) -> Optional[bytes]:
+        if self.pending is not None:
+            return None
+        item = self.next_item()
+        if isinstance(item, bytes):
+            return item
+        self.pending = item
+        return None
+
+
+def _iter_7z_members(file_path: Path, members: list[str]) -> Iterator[tuple[str, TextIO]]:
+    feed = _SevenZipFeed(file_path, members)
+    source = _MemberSource(feed)
+    feed.thread.start()
+    try:
+        marker = source.next_item()
+        while marker is not _END:
+            source.pending = None
+            yield marker[0], _text(_MemberReader(source))
+            # Drain whatever the consumer did not read of this member
+            while source.next_chunk() is not None:
+                pass
+            marker = source.pending
+    finally:
+        feed.cancelled.set()
+        feed.thread.join()
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from src.preprocessing.common.manifest import write_json_atomic
+
+STORE_ROOT = Path("data/_store")
+ETAG_INDEX_NAME = "etags.json"
+
+
+class BlobStore:
+    """
+    Content-addressed store for raw downloads shared by every dataset.
+
+    Blobs live under ``<root>/sha256/ab/abcdef...``; the files under
+    ``data/<dataset>/raw`` are hard links to them (symlinks or copies where
+    hard links are not possible), so the same bytes published under two
+    names are kept once. Strong ETags seen on the portal are remembered so a
+    re-published resource can be recognised from its response headers alone.
+    """
+
+    def __init__(self, root: Path = STORE_ROOT):
+        self.root = root
+        self.etag_path = root / ETAG_INDEX_NAME
+        self.etags: dict[str, str] = {}
+        if self.etag_path.exists():
+            with open(self.etag_path, encoding="utf-8") as f:
+                self.etags = json.load(f)
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / "sha256" / sha256[:2] / sha256
+
+    def has(self, sha256: str) -> bool:
+        return self.blob_path(sha256).exists()
+
+    def lookup_etag(self, etag: Optional[str]) -> Optional[str]:
+        """sha256 of a stored blob previously served with this strong ETag."""
+        if not etag or etag.startswith("W/"):
+            return None
+        sha256 = self.etags.get(etag)
+        return sha256 if sha256 and self.has(sha256) else None
+
+    def remember_etag(self, etag: Optional[str], sha256: str) -> None:
+        if etag and not etag.startswith("W/") and self.etags.get(etag) != sha256:
+            self.etags[etag] = sha256
+            self.root.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.etag_path, self.etags)
+
+    def add(self, path: Path, sha256: str) -> Path:
+        """Move *path* into the store (or drop it if the blob exists) and link it back."""
+        blob = self.blob_path(sha256)
+        if blob.exists():
+            path.unlink()
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.replace(path, blob)
+            except OSError:  # store on another filesystem
+                shutil.move(str(path), str(blob))
+        self.link(sha256, path)
+        return blob
+
+    def link(self, sha256: str, view: Path) -> None:
+        """Atomically make *view* a hard link (or symlink / copy) of the blob."""
+        blob = self.blob_path(sha256)
+        view.parent.mkdir(parents=True, exist_ok=True)
+        tmp = view.with_name(view.name + ".link")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            try:
+                tmp.symlink_to(blob.resolve())
+            except OSError:
+                shutil.copyfile(blob, tmp)
+        os.replace(tmp, view)
+
+    def prune(self) -> int:
+        """Delete blobs no raw/ file links to any more; returns the count."""
+        removed = 0
+        for blob in (self.root / "sha256").glob("*/*"):
+            if blob.stat().st_nlink == 1:
+                blob.unlink()
+                removed += 1
+        return removed
@@ -0,0 +1,159 @@
+import glob
+import logging
+import os
+import pickle
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from src.preprocessing.common.splitting import RANGE_BYTES, concat_parts
+
+log = logging.getLogger(__name__)
+
+# Input consumed between two checkpoints of a file (bytes of a CSV,
+# uncompressed row groups of a Parquet file)
+CHECKPOINT_BYTES = RANGE_BYTES
+
+
+def temp_path(path: Path) -> Path:
+    """Where *path* is written before it is published; the suffix keeps it out of the stage globs."""
+    return path.with_name(f"{path.name}.tmp")
+
+
+def segment_path(output_file: Path, index: int) -> Path:
+    """Output of input segment *index* of a checkpointed file."""
+    return output_file.with_name(f"{output_file.name}.seg-{index:05d}")
+
+
+def source_key(input_file: Path, *settings) -> tuple:
+    """Identity of an input file as it is now, plus the *settings* its output depends on."""
+    stat = input_file.stat()
+    return (str(input_file), stat.st_size, stat.st_mtime_ns) + settings
+
+
+@contextmanager
+def atomic_output(output_file: Path) -> Iterator[Path]:
+    """
+    Temporary path to write *output_file* to; it is renamed into place when
+    the block completes and removed if it raises, so an existing output is
+    always a complete one.
+    """
+    temp = temp_path(output_file)
+    try:
+        yield temp
+        os.replace(temp, output_file)
+    finally:
+        temp.unlink(missing_ok=True)
+
+
+class Checkpoint:
+    """
+    Progress of an output file, pickled next to it as ``<output>.ckpt``:
+    the input *key* it belongs to, the number of input segments done, the
+    rows processed so far, the state carried to the next segment (a
+    sampler or batch filter, or a finished shard's result) and the input
+    *position* the next segment starts at. A checkpoint of another key
+    (the input or the settings changed) is ignored.
+    """
+
+    def __init__(self, output_file: Path, key: tuple):
+        self.path = output_file.with_name(f"{output_file.name}.ckpt")
+        self.key = key
+        self.done = 0
+        self.rows = 0
+        self.state = None
+        self.position = None
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+
+    def saved_key(self) -> Optional[tuple]:
+        """Key of the checkpoint on disk, whatever it is; None if there is none."""
+        saved = self._read()
+        return saved["key"] if saved is not None else None
+
+    def load(self) -> bool:
+        """Restore the saved progress; False if there is none for this key."""
+        saved = self._read()
+        if saved is None:
+            return False
+        if saved["key"] != self.key:
+            log.info(f"Ignoring stale checkpoint {self.path}")
+            return False
+        self.done, self.rows, self.state = saved["done"], saved["rows"], saved["state"]
+        self.position = saved.get("position")
+        return True
+
+    def save(self, done: int, rows: int, state, position: Optional[int] = None) -> None:
+        self.done, self.rows, self.state, self.position = done, rows, state, position
+        with atomic_output(self.path) as temp:
+            with open(temp, "wb") as f:
+                pickle.dump({"key": self.key, "done": done, "rows": rows, "state": state, "position": position}, f)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def discard(output_file: Path, key: Optional[tuple] = None) -> None:
+    """
+    Remove the checkpoint and segment outputs left by an interrupted run of
+    *output_file*. With *key* (as given to ``run_checkpointed``) they are only removed
+    if they belong to that run, so a failed attempt cannot wipe the progress
+    another one saved.
+    """
+    checkpoint = Checkpoint(output_file, ())
+    if key is not None and checkpoint.saved_key() not in (None, key):
+        return
+    checkpoint.clear()
+    for segment in output_file.parent.glob(f"{glob.escape(output_file.name)}.seg-*"):
+        segment.unlink(missing_ok=True)
+
+
+def run_checkpointed(output_file: Path, segments: Callable[[Optional[int]], Iterable[tuple]], process: Callable,
+                     state, key: tuple) -> tuple[int, object]:
+    """
+    Write *output_file* from consecutive input segments, one segment output
+    at a time. ``segments(start)`` yields the (start, end, size) segments
+    from input position *start* on, or from the beginning if it is None
+    (e.g. ``iter_record_ranges``); they are taken one ahead of the segment
+    being processed, so a lazy one is only computed as the work reaches it.
+    ``process(segment, segment_file, state, last)`` writes one segment and
+    returns its rows processed; *state* is carried from segment to segment,
+    and *last* marks the end of the input. After every segment the progress
+    and the end of the segment are checkpointed, so a rerun after a crash
+    resumes there with the state saved. Once all are done the segments
+    are concatenated and atomically published as *output_file*.
+    Returns (rows processed, final state).
+    """
+    checkpoint = Checkpoint(output_file, key)
+    if checkpoint.load():
+        log.info(f"Resuming {output_file.name} at segment {checkpoint.done + 1}, after {checkpoint.rows} rows")
+        state = checkpoint.state
+
+    upcoming = iter(segments(checkpoint.position))
+    segment = next(upcoming)
+    rows, done = checkpoint.rows, checkpoint.done
+    while segment is not None:
+        following = next(upcoming, None)
+        last = following is None
+        rows += process(segment, segment_path(output_file, done), state, last)
+        done += 1
+        if not last:
+            checkpoint.save(done, rows, state, segment[1])
+        segment = following
+
+    files = [segment_path(output_file, i) for i in range(done)]
+    if len(files) == 1:
+        os.replace(files[0], output_file)
+    else:
+        with atomic_output(output_file) as temp:
+            concat_parts(files, temp, fmt=output_file.suffix.lstrip("."))
+    discard(output_file)
+    return rows, state
@@ -0,0 +1,192 @@
+import json
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.parse import urljoin, urlparse
+from urllib.request import url2pathname
+
+import requests
+
+from src.preprocessing.common.downloader import DEFAULT_CONCURRENCY, DownloadJob, DownloadResult, download_all
+from src.preprocessing.common.manifest import DownloadManifest, write_json_atomic
+
+CKAN_API_URL = "https://opendata-ajuntament.barcelona.cat/data/api/3/action"
+SYNC_STATE_NAME = "_ckan_sync.json"
+
+# Point CKAN_MIRROR at a snapshot (folder, file:// or http:// URL, see
+# mirror.py) to run every downloader without touching the portal
+MIRROR_ENV = "CKAN_MIRROR"
+MIRROR = os.environ.get(MIRROR_ENV)
+MIRROR_PACKAGE_DIR = "package"
+MIRROR_RESOURCE_DIR = "resources"
+
+
+def mirror_base_url(mirror: str) -> str:
+    """Mirror location as a URL ending in '/'; plain paths become file:// URLs."""
+    if "://" not in mirror:
+        mirror = Path(mirror).resolve().as_uri()
+    return mirror.rstrip("/") + "/"
+
+
+def read_mirror_metadata(dataset_id: str, mirror: str) -> dict:
+    """Package metadata from a mirror, with resource URLs resolved against it."""
+    base = mirror_base_url(mirror)
+    url = urljoin(base, f"{MIRROR_PACKAGE_DIR}/{dataset_id}.json")
+    if url.startswith("file:"):
+        with open(url2pathname(urlparse(url).path), encoding="utf-8") as f:
+            metadata = json.load(f)
+    else:
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
+        metadata = r.json()
+    for res in metadata.get("resources", []):
+        res["url"] = urljoin(base, res["url"])
+    return metadata
+
+
+def fetch_dataset_metadata(dataset_id: str, api_url: str = CKAN_API_URL, mirror: Optional[str] = MIRROR) -> dict:
+    """Return the CKAN package metadata for a dataset (from *mirror* when set)."""
+    if mirror:
+        return read_mirror_metadata(dataset_id, mirror)
+    r = requests.get(f"{api_url}/package_show", params={"id": dataset_id}, timeout=30)
+    r.raise_for_status()
+    meta = r.json()
+    if not meta.get("success", False):
+        raise RuntimeError("CKAN returned success=false")
+    return meta["result"]
+
+
+def sanitize_filename(name: str) -> str:
+    return name.replace("/", "_").replace(" ", "_")
+
+
+def extract_year_from_name(name: str) -> str:
+    """Extract the first 4-digit year (20xx) found in the resource name."""
+    match = re.search(r"(20\d{2})", name)
+    return match.group(1) if match else "unknown"
+
+
+def filter_resources(
+    resources: list[dict],
+    allowed_extensions: Optional[tuple] = None,
+    allowed_formats: Optional[set[str]] = None,
+    filter_years: Optional[Iterable[int]] = None,
+) -> list[dict]:
+    """Keep resources with a URL whose name/format match the given filters."""
+    years = [str(y) for y in filter_years] if filter_years else None
+    return [
+        res for res in resources
+        if res.get("url")
+        and (not allowed_extensions or res.get("name", "").endswith(tuple(allowed_extensions)))
+        and (not allowed_formats or res.get("format", "").lower() in allowed_formats)
+        and (not years or any(y in res.get("name", "") for y in years))
+    ]
+
+
+def resource_version(res: dict) -> Optional[str]:
+    """CKAN timestamp that changes whenever the resource is re-published."""
+    return res.get("last_modified") or res.get("metadata_modified")
+
+
+def resource_sha256(res: dict) -> Optional[str]:
+    """The resource ``hash`` field when it is a sha256 digest (often left empty)."""
+    value = (res.get("hash") or "").lower().removeprefix("sha256:")
+    return value if re.fullmatch(r"[0-9a-f]{64}", value) else None
+
+
+def load_sync_state(output_dir: Path, dataset_id: str) -> dict:
+    path = output_dir / SYNC_STATE_NAME
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get(dataset_id, {})
+
+
+def save_sync_state(output_dir: Path, dataset_id: str, metadata: dict,
+                    resources: list[dict], results: list[DownloadResult]) -> None:
+    """Remember the package and resource versions that are now on disk."""
+    path = output_dir / SYNC_STATE_NAME
+    state = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    previous = state.get(dataset_id, {}).get("resources", {})
+    failed = {r.job.url for r in results if r.status == "error"}
+    versions = {
+        res["id"]: resource_version(res) if res["url"] not in failed else previous.get(res["id"])
+        for res in resources if res.get("id")
+    }
+    state[dataset_id] = {
+        "metadata_modified": metadata.get("metadata_modified") if not failed else None,
+        "resources": {k: v for k, v in versions.items() if v},
+    }
+    write_json_atomic(path, state)
+
+
+def plan_sync(output_dir: Path, dataset_id: str, metadata: dict,
+              resources: list[dict], jobs: list[DownloadJob]) -> list[DownloadJob]:
+    """
+    Reduce *jobs* to the resources that are new or changed since the last sync.
+
+    If the package ``metadata_modified`` is unchanged and every file is present
+    nothing is requested at all. Otherwise resources whose CKAN version moved
+    are re-checked with a conditional GET (ETag / Last-Modified from the
+    download manifest), so unchanged bytes are never transferred again.
+    """
+    state = load_sync_state(output_dir, dataset_id)
+    manifest = DownloadManifest(output_dir)
+    known = state.get("resources", {})
+
+    def present(job: DownloadJob) -> bool:
+        name = manifest.find_by_url(job.url) if job.resolve_name else job.dest.name
+        return bool(name) and manifest.is_complete(output_dir / name)
+
+    if state.get("metadata_modified") == metadata.get("metadata_modified") and all(map(present, jobs)):
+        return []
+
+    selected = []
+    for res, job in zip(resources, jobs):
+        if not present(job):
+            selected.append(job)
+        elif known.get(res.get("id")) != resource_version(res):
+            job.revalidate = True
+            selected.append(job)
+    return selected
+
+
+def download_resources_from_metadata(
+    dataset_id: str,
+    output_dir: Path,
+    filter_years: Optional[range] = None,
+    allowed_extensions: Optional[tuple] = (".7z", ".zip", ".csv"),
+    concurrency: int = DEFAULT_CONCURRENCY,
+    api_url: str = CKAN_API_URL,
+    sync: bool = False,
+) -> None:
+    """
+    Download every resource of a CKAN package that passes the filters.
+    With *sync* only new or changed resources are requested (see ``plan_sync``).
+    """
+    metadata = fetch_dataset_metadata(dataset_id, api_url=api_url)
+    resources = filter_resources(
+        metadata.get("resources", []),
+        allowed_extensions=allowed_extensions,
+        filter_years=filter_years,
+    )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = [
+        DownloadJob(url=res["url"], dest=output_dir / sanitize_filename(res["name"]), sha256=resource_sha256(res))
+        for res in resources
+    ]
+    if sync:
+        jobs = plan_sync(output_dir, dataset_id, metadata, resources, jobs)
+        if not jobs:
+            print(f"Dataset {dataset_id}: up to date ({metadata.get('metadata_modified')})")
+            return
+    print(f"Dataset {dataset_id}: {len(jobs)} resources selected")
+    results = download_all(jobs, concurrency=concurrency)
+    if sync:
+        save_sync_state(output_dir, dataset_id, metadata, resources, results)
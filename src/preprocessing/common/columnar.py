@@ -0,0 +1,173 @@
+import csv
+import io
+import logging
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+log = logging.getLogger(__name__)
+
+BLOCK_SIZE = 16 * 1024 * 1024     # bytes parsed per record batch
+LOG_EVERY_ROWS = 1_000_000
+
+# Intermediate stage formats (projected/, sampled/)
+DEFAULT_STAGE_FORMAT = "parquet"
+PARQUET_COMPRESSION = "zstd"
+STAGE_SUFFIX = {"parquet": ".parquet", "csv": ".csv"}
+
+_PARSE_OPTIONS = pa_csv.ParseOptions(newlines_in_values=True)
+# csv.writer's line ending, so outputs match the row-wise implementation
+_PLAIN = pa_csv.WriteOptions(include_header=False, quoting_style="none", eol="\r\n")
+_QUOTED = pa_csv.WriteOptions(include_header=False, quoting_style="needed", eol="\r\n")
+
+
+def read_header(stream: BinaryIO) -> list[str]:
+    """Consume the header line of a binary CSV stream and return its column names."""
+    line = stream.readline()
+    if not line:
+        raise ValueError("empty CSV file")
+    return next(csv.reader([line.decode("utf-8").rstrip("\r\n")]))
+
+
+def write_batch(batch: pa.RecordBatch, outfile: BinaryIO) -> None:
+    """Append *batch* as CSV rows, quoting only if some value requires it."""
+    sink = pa.BufferOutputStream()
+    try:
+        pa_csv.write_csv(batch, sink, _PLAIN)
+    except pa.ArrowInvalid:
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(batch, sink, _QUOTED)
+    outfile.write(sink.getvalue())
+
+
+class CsvSink:
+    """Record batch writer producing the same CSV text as ``csv.writer``."""
+
+    def __init__(self, path: Path, schema: pa.Schema):
+        self.file = open(path, "wb")
+        header_line = io.StringIO()
+        csv.writer(header_line).writerow(schema.names)
+        self.file.write(header_line.getvalue().encode("utf-8"))
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        write_batch(batch, self.file)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetSink:
+    """Record batch writer for a zstd-compressed Parquet file."""
+
+    def __init__(self, path: Path, schema: pa.Schema):
+        self.writer = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        self.writer.write(batch)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def open_sink(fmt: str, path: Path, schema: pa.Schema):
+    if fmt == "parquet":
+        return ParquetSink(path, schema)
+    if fmt == "csv":
+        return CsvSink(path, schema)
+    raise ValueError(f"Unsupported stage format: {fmt}")
+
+
+def open_csv_reader(source: BinaryIO, columns_to_keep: list, source_name: str,
+                    column_types: Optional[dict] = None) -> pa.RecordBatchReader:
+    """
+    Record batch reader over the *columns_to_keep* (in that order) of the CSV
+    in *source*. Columns listed in *column_types* are converted, the rest
+    stay strings. Empty fields are null; ``NA`` is null too in converted
+    columns but stays text in string ones, as the text reader leaves it.
+    """
+    header = read_header(source)
+    present = [c for c in columns_to_keep if c in header]
+    missing_columns = set(columns_to_keep) - set(present)
+    if missing_columns:
+        log.warning(f"Missing columns in {source_name}: {missing_columns}")
+
+    types = {c: (column_types or {}).get(c, pa.string()) for c in present}
+    typed = any(t != pa.string() for t in types.values())
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(block_size=BLOCK_SIZE, column_names=header),
+        parse_options=_PARSE_OPTIONS,
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=present,
+            column_types=types,
+            # Null values apply to every column: string columns are read
+            # non-null and only their empty fields are made null below
+            null_values=["", "NA"] if typed else [""],
+            strings_can_be_null=not typed,
+        ),
+    )
+    if not typed:
+        return reader
+    return pa.RecordBatchReader.from_batches(reader.schema, _empty_strings_as_null(reader))
+
+
+def _empty_strings_as_null(batches: Iterable[pa.RecordBatch]) -> Iterable[pa.RecordBatch]:
+    for batch in batches:
+        columns = [pc.if_else(pc.equal(column, ""), pa.scalar(None, pa.string()), column)
+                   if column.type == pa.string() else column for column in batch.columns]
+        yield pa.RecordBatch.from_arrays(columns, schema=batch.schema)
+
+
+def project_csv(source: BinaryIO, output_file: Path, columns_to_keep: list, source_name: str,
+                column_types: Optional[dict] = None, fmt: str = "csv",
+                filter_batch: Optional[Callable] = None, final: bool = True) -> int:
+    """
+    Columnar counterpart of the row-wise projection: parse only the
+    *columns_to_keep* of the CSV in *source* into large record batches and
+    write them, in *columns_to_keep* order, to *output_file* as *fmt*.
+    Columns listed in *column_types* are converted, the rest stay strings.
+    *filter_batch*, if given, maps each batch to the rows that are written;
+    it also provides ``output_schema(schema)`` and ``flush()`` for rows it
+    holds back until the end (see ``03_sample.batch_filter``); with *final*
+    unset they stay held for the next part of the same input.
+    Returns the number of rows read.
+
+    Raises ``pyarrow.ArrowInvalid`` on rows with the wrong number of fields
+    or values that do not convert; callers retry untyped, then row-wise.
+    """
+    reader = open_csv_reader(source, columns_to_keep, source_name, column_types)
+    return write_batches(reader, reader.schema, output_file, source_name, fmt, filter_batch, final)
+
+
+def write_batches(batches: Iterable[pa.RecordBatch], schema: pa.Schema, output_file: Path, source_name: str,
+                  fmt: str = "csv", filter_batch: Optional[Callable] = None, final: bool = True) -> int:
+    """
+    Write record *batches* of *schema* to *output_file* as *fmt*, through
+    *filter_batch* as in ``project_csv``. Returns the number of rows read.
+    """
+    rows_processed = 0
+    if filter_batch:
+        schema = filter_batch.output_schema(schema)
+    sink = open_sink(fmt, output_file, schema)
+    try:
+        for batch in batches:
+            sink.write(filter_batch(batch) if filter_batch else batch)
+            before = rows_processed
+            rows_processed += batch.num_rows
+            if rows_processed // LOG_EVERY_ROWS > before // LOG_EVERY_ROWS:
+                log.info(f"Processed {rows_processed} rows of {source_name}")
+        tail = filter_batch.flush() if filter_batch and final else None
+        if tail is not None:
+            sink.write(tail)
+    except BaseException:
+        # Never leave a partial output behind: it would be skipped next run
+        sink.close()
+        output_file.unlink(missing_ok=True)
+        raise
+    sink.close()
+
+    return rows_processed
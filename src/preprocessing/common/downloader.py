@@ -0,0 +1,375 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from dataclasses import dataclass
+from email.utils import formatdate
+from pathlib import Path
+from typing import Callable, Iterable, Mapping, Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import aiohttp
+from tqdm import tqdm
+
+from src.preprocessing.common.blobstore import BlobStore
+from src.preprocessing.common.manifest import DownloadManifest, sha256_file, sha256_of
+
+DEFAULT_CONCURRENCY = 4
+CHUNK_SIZE = 1024 * 1024          # 1 MiB reads; the portal serves multi-GB archives
+PART_SUFFIX = ".part"
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+
+
+@dataclass
+class DownloadJob:
+    url: str
+    dest: Path
+    # Optional hook to pick the final file name from the response headers
+    # (e.g. Content-Disposition). Receives (headers, default_name).
+    resolve_name: Optional[Callable[[Mapping[str, str], str], str]] = None
+    # Re-check a completed file with a conditional GET instead of skipping it
+    revalidate: bool = False
+    # Expected content hash (e.g. from CKAN metadata); lets the store satisfy
+    # the job without any request
+    sha256: Optional[str] = None
+
+
+@dataclass
+class DownloadResult:
+    job: DownloadJob
+    path: Path
+    status: str                   # "ok" | "skip" | "error"
+    bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def create_session(concurrency: int = DEFAULT_CONCURRENCY) -> aiohttp.ClientSession:
+    """Pooled session: keep-alive connections are reused across resources."""
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, timeout=REQUEST_TIMEOUT, read_bufsize=CHUNK_SIZE)
+
+
+def partial_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + PART_SUFFIX)
+
+
+def _resume_headers(part: Path, entry: Optional[dict]) -> dict:
+    """Range (+ If-Range) headers to continue *part* from its current size."""
+    if not part.exists() or part.stat().st_size == 0:
+        return {}
+    headers = {"Range": f"bytes={part.stat().st_size}-"}
+    validator = entry and (entry.get("etag") or entry.get("last_modified"))
+    if validator:
+        headers["If-Range"] = validator
+    return headers
+
+
+def _conditional_headers(entry: Optional[dict]) -> dict:
+    """If-None-Match / If-Modified-Since headers from a manifest entry."""
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def filename_from_headers(headers: Mapping[str, str], fallback: str) -> str:
+    """File name from Content-Disposition if present, otherwise *fallback*."""
+    cd = headers.get("Content-Disposition", "")
+    m = re.search(r'filename="?([^";]+)"?', cd, flags=re.I)
+    return m.group(1) if m else fallback
+
+
+def _content_range(headers: Mapping[str, str]) -> tuple[Optional[int], Optional[int]]:
+    """Parse ``bytes start-end/total`` (or ``bytes */total``) into (start, total)."""
+    m = re.match(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", headers.get("Content-Range", ""))
+    if not m:
+        return None, None
+    start = int(m.group(1)) if m.group(1) else None
+    total = int(m.group(2)) if m.group(2) != "*" else None
+    return start, total
+
+
+def _link_stored(store: BlobStore, sha256: str, dest: Path, manifest: DownloadManifest,
+                 url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+    """Satisfy a job from a blob already in the store."""
+    store.link(sha256, dest)
+    partial_path(dest).unlink(missing_ok=True)
+    entry = manifest.get(dest.name) or {}
+    manifest.record(
+        dest.name,
+        **{**entry, "url": url, "etag": etag or entry.get("etag"),
+           "last_modified": last_modified or entry.get("last_modified"),
+           "size": dest.stat().st_size, "sha256": sha256, "complete": True},
+    )
+    tqdm.write(f"[LINK] {dest.name} already in the store ({sha256[:12]})")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Local files (file:// mirrors) answer like an HTTP server would
+# ─────────────────────────────────────────────────────────────────────────────
+
+def file_validators(path: Path) -> tuple[str, str]:
+    """
+    (ETag, Last-Modified) for a mirrored file. The ETag is the sha256 from the
+    folder's manifest when it is known, so the blob store can recognise it.
+    """
+    stat = path.stat()
+    entry = DownloadManifest(path.parent).get(path.name) or {}
+    if entry.get("sha256") and entry.get("size") == stat.st_size:
+        etag = f'"{entry["sha256"]}"'
+    else:
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    return etag, formatdate(stat.st_mtime, usegmt=True)
+
+
+def local_response(path: Path, request_headers: Mapping[str, str]) -> tuple[int, dict, int]:
+    """
+    (status, headers, offset) for serving *path* given the request headers:
+    304 for a matching conditional GET, 206/416 for ranges, else 200.
+    """
+    if not path.is_file():
+        return 404, {}, 0
+    size = path.stat().st_size
+    etag, last_modified = file_validators(path)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Content-Disposition": f'attachment; filename="{path.name}"',
+    }
+    if request_headers.get("If-None-Match") == etag or request_headers.get("If-Modified-Since") == last_modified:
+        return 304, headers, 0
+
+    m = re.match(r"bytes=(\d+)-$", request_headers.get("Range", ""))
+    if m and request_headers.get("If-Range") in (None, etag, last_modified):
+        start = int(m.group(1))
+        if start >= size:
+            return 416, {**headers, "Content-Range": f"bytes */{size}"}, 0
+        headers["Content-Range"] = f"bytes {start}-{size - 1}/{size}"
+        return 206, {**headers, "Content-Length": str(size - start)}, start
+    return 200, {**headers, "Content-Length": str(size)}, 0
+
+
+class FileResponse:
+    """The subset of an aiohttp response ``fetch_one`` uses, over a local file."""
+
+    def __init__(self, url: str, request_headers: Mapping[str, str]):
+        self.path = Path(url2pathname(urlparse(url).path))
+        self.status, self.headers, self.offset = local_response(self.path, request_headers)
+        length = self.headers.get("Content-Length")
+        self.content_length = int(length) if length is not None else None
+        self.content = self
+
+    async def __aenter__(self) -> "FileResponse":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise OSError(f"{self.status} for {self.path}")
+
+    async def iter_chunked(self, n: int):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while chunk := await asyncio.to_thread(f.read, n):
+                yield chunk
+
+
+def open_url(session: aiohttp.ClientSession, url: str, headers: Mapping[str, str]):
+    """``session.get`` for http(s) URLs, a ``FileResponse`` for file:// ones."""
+    if url.startswith("file:"):
+        return FileResponse(url, headers)
+    return session.get(url, headers=headers)
+
+
+async def fetch_one(
+    session: aiohttp.ClientSession,
+    job: DownloadJob,
+    semaphore: asyncio.Semaphore,
+    manifest: DownloadManifest,
+    progress: Optional[tqdm] = None,
+    store: Optional[BlobStore] = None,
+) -> DownloadResult:
+    """
+    Stream a single resource into ``<dest>.part`` while holding a concurrency
+    slot, resuming an interrupted transfer with a Range request. The file is
+    renamed to *dest* only once its size matches what the server announced,
+    then moved into the content-addressed *store* and linked back, so
+    identical bytes are kept once across datasets.
+    """
+    async with semaphore:
+        dest = job.dest
+        name_known = job.resolve_name is None
+        if not name_known and manifest.find_by_url(job.url):
+            dest = dest.parent / manifest.find_by_url(job.url)
+            name_known = True
+
+        revalidate = manifest.is_complete(dest)
+        if revalidate and not job.revalidate:
+            tqdm.write(f"[SKIP] Already downloaded: {dest.name}")
+            return DownloadResult(job, dest, "skip")
+
+        if store is not None and name_known and job.sha256 and store.has(job.sha256):
+            _link_stored(store, job.sha256, dest, manifest, job.url)
+            return DownloadResult(job, dest, "skip")
+
+        if name_known and dest.exists() and not revalidate:
+            if manifest.get(dest.name) is None:
+                # Predates the manifest: never trust it as complete, treat it
+                # as a partial transfer and let the server tell us.
+                os.replace(dest, partial_path(dest))
+            else:
+                # Superseded by an in-progress transfer, or changed on disk
+                # since it was recorded.
+                dest.unlink()
+
+        start = time.perf_counter()
+        written = 0
+        try:
+            for _ in range(2):
+                part = partial_path(dest)
+                entry = manifest.get(dest.name)
+                if revalidate:
+                    headers = _conditional_headers(entry)
+                else:
+                    headers = _resume_headers(part, entry) if name_known else {}
+
+                async with open_url(session, job.url, headers) as resp:
+                    if not name_known:
+                        dest = dest.parent / job.resolve_name(resp.headers, dest.name)
+                        part = partial_path(dest)
+                        if manifest.is_complete(dest):
+                            tqdm.write(f"[SKIP] Already downloaded: {dest.name}")
+                            return DownloadResult(job, dest, "skip")
+
+                    if resp.status == 304:
+                        tqdm.write(f"[SKIP] Not modified: {dest.name}")
+                        return DownloadResult(job, dest, "skip")
+
+                    # Same bytes already fetched under another name or dataset
+                    known = store.lookup_etag(resp.headers.get("ETag")) if store is not None else None
+                    if resp.status == 200 and known:
+                        _link_stored(store, known, dest, manifest, job.url,
+                                     resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+                        return DownloadResult(job, dest, "skip")
+
+                    offset = part.stat().st_size if "Range" in headers else 0
+                    if resp.status == 416 and offset:
+                        _, total = _content_range(resp.headers)
+                        if total == offset:
+                            sha256 = await asyncio.to_thread(sha256_file, part)
+                            break
+                        part.unlink()
+                        manifest.discard(dest.name)
+                        continue
+                    resp.raise_for_status()
+
+                    range_start, total = _content_range(resp.headers)
+                    if resp.status == 206 and range_start == offset:
+                        hasher = await asyncio.to_thread(sha256_of, part)
+                        mode = "ab"
+                        tqdm.write(f"[RESUME] {dest.name} from {offset / 1024 ** 2:.1f} MB")
+                    else:
+                        hasher, mode, offset = hashlib.sha256(), "wb", 0
+                        total = resp.content_length
+
+                    manifest.record(
+                        dest.name,
+                        url=job.url,
+                        etag=resp.headers.get("ETag"),
+                        last_modified=resp.headers.get("Last-Modified"),
+                        complete=False,
+                    )
+
+                    with open(part, mode) as f:
+                        def write(chunk: bytes) -> None:
+                            f.write(chunk)
+                            hasher.update(chunk)
+
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            # Off the event loop, so a slow disk does not stall the other transfers
+                            await asyncio.to_thread(write, chunk)
+                            written += len(chunk)
+                            if progress is not None:
+                                progress.update(len(chunk))
+
+                    size = offset + written
+                    if total is not None and size != total:
+                        raise OSError(f"incomplete transfer: got {size} of {total} bytes")
+                    sha256 = hasher.hexdigest()
+                    break
+            else:
+                raise OSError("server rejected the resume request twice")
+
+            os.replace(part, dest)
+            if store is not None:
+                store.add(dest, sha256)
+            entry = manifest.get(dest.name) or {"url": job.url}
+            manifest.record(dest.name, **{**entry, "size": dest.stat().st_size, "sha256": sha256, "complete": True})
+            if store is not None:
+                store.remember_etag(entry.get("etag"), sha256)
+        except Exception as e:
+            tqdm.write(f"[ERROR] Failed to download {job.url} -> {e}")
+            return DownloadResult(job, dest, "error", written, time.perf_counter() - start, str(e))
+
+        elapsed = time.perf_counter() - start
+        tqdm.write(f"[SUCCESS] Saved to: {dest} ({_format_rate(written, elapsed)})")
+        return DownloadResult(job, dest, "ok", written, elapsed)
+
+
+async def download_all_async(
+    jobs: Iterable[DownloadJob],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    session: Optional[aiohttp.ClientSession] = None,
+    store: Optional[BlobStore] = None,
+) -> list[DownloadResult]:
+    """
+    Download *jobs* with at most *concurrency* transfers in flight. Files are
+    kept in *store* (the shared ``data/_store`` by default).
+    """
+    jobs = list(jobs)
+    store = store or BlobStore()
+    manifests = {d: DownloadManifest(d) for d in {job.dest.parent for job in jobs}}
+    semaphore = asyncio.Semaphore(concurrency)
+    own_session = session is None
+    if own_session:
+        session = create_session(concurrency)
+
+    start = time.perf_counter()
+    try:
+        with tqdm(desc="Downloading", unit="B", unit_scale=True, unit_divisor=1024) as progress:
+            results = await asyncio.gather(
+                *(fetch_one(session, job, semaphore, manifests[job.dest.parent], progress, store) for job in jobs)
+            )
+    finally:
+        if own_session:
+            await session.close()
+
+    report_throughput(results, time.perf_counter() - start)
+    return list(results)
+
+
+def download_all(jobs: Iterable[DownloadJob], concurrency: int = DEFAULT_CONCURRENCY) -> list[DownloadResult]:
+    """Blocking entry point for the download scripts."""
+    return asyncio.run(download_all_async(jobs, concurrency=concurrency))
+
+
+def _format_rate(num_bytes: int, seconds: float) -> str:
+    mb = num_bytes / (1024 ** 2)
+    return f"{mb:.1f} MB in {seconds:.1f}s, {mb / seconds if seconds > 0 else 0:.1f} MB/s"
+
+
+def report_throughput(results: list[DownloadResult], elapsed: float) -> None:
+    """Print the aggregate summary for a batch of downloads."""
+    counts = {status: sum(r.status == status for r in results) for status in ("ok", "skip", "error")}
+    total_bytes = sum(r.bytes for r in results if r.status == "ok")
+    tqdm.write(
+        f"Downloaded {counts['ok']} files, skipped {counts['skip']}, failed {counts['error']} "
+        f"- {_format_rate(total_bytes, elapsed)}"
+    )
@@ -0,0 +1,125 @@
+import logging
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+log = logging.getLogger(__name__)
+
+# Rows sorted in memory per run, and rows held across all runs while merging
+SORT_BUFFER_ROWS = 4_000_000
+MERGE_BLOCK_ROWS = 1_000_000
+SPILL_ROW_GROUP_ROWS = 64_000
+SPILL_COMPRESSION = "lz4"
+
+# Input row number, appended to the keys so equal keys keep their input order
+ORDER_KEY = "__order"
+
+
+def _sorted(table: pa.Table, keys: list[str]) -> pa.Table:
+    return table.sort_by([(key, "ascending") for key in keys])
+
+
+def _at_most(table: pa.Table, keys: list[str], bound: tuple) -> np.ndarray:
+    """Mask of the rows of *table* whose *keys* are lexicographically <= *bound*."""
+    mask = pc.less_equal(table.column(keys[-1]), pa.scalar(bound[-1]))
+    for key, value in zip(reversed(keys[:-1]), reversed(bound[:-1])):
+        column = table.column(key)
+        value = pa.scalar(value)
+        mask = pc.or_(pc.less(column, value), pc.and_(pc.equal(column, value), mask))
+    return mask.to_numpy(zero_copy_only=False)
+
+
+class _Run:
+    """A spilled sorted run, read back one block at a time."""
+
+    def __init__(self, path: Path, block_rows: int):
+        self.batches = pq.ParquetFile(path).iter_batches(batch_size=block_rows)
+        self.block = None
+        self.refill()
+
+    def refill(self) -> None:
+        batch = next(self.batches, None)
+        self.block = pa.Table.from_batches([batch]) if batch is not None else None
+
+    def last(self, keys: list[str]) -> tuple:
+        return tuple(self.block.column(key)[-1].as_py() for key in keys)
+
+
+def _merge(paths: list[Path], keys: list[str], block_rows: int) -> Iterator[pa.Table]:
+    """
+    K-way merge of sorted runs in blocks: every row up to the smallest last
+    key of the blocks in memory is in its final place, so those rows are
+    taken from all blocks at once, sorted and emitted. The run that held
+    that key is then empty and is refilled.
+    """
+    runs = [_Run(path, max(1, block_rows // len(paths))) for path in paths]
+    runs = [run for run in runs if run.block is not None]
+    while runs:
+        frontier = min(run.last(keys) for run in runs)
+        taken = []
+        for run in runs:
+            mask = _at_most(run.block, keys, frontier)
+            if mask.any():
+                taken.append(run.block.filter(mask))
+                run.block = run.block.filter(~mask)
+            if run.block.num_rows == 0:
+                run.refill()
+        runs = [run for run in runs if run.block is not None]
+        yield _sorted(pa.concat_tables(taken), keys)
+
+
+def external_sort(batches: Iterable[pa.RecordBatch], keys: list[str], spill_dir: Path,
+                  buffer_rows: int = SORT_BUFFER_ROWS,
+                  merge_rows: int = MERGE_BLOCK_ROWS) -> Iterator[pa.Table]:
+    """
+    Stable sort of a stream of record batches by *keys* (ascending; the key
+    columns must not have nulls) in bounded memory. Up to *buffer_rows* rows
+    are sorted in memory at a time; inputs larger than that are spilled to
+    *spill_dir* as sorted Parquet runs and merged back holding about
+    *merge_rows* rows. Yields tables in sorted order; the spill files are
+    removed as soon as the merge is done.
+    """
+    sort_keys = list(keys) + [ORDER_KEY]
+    run_id = uuid.uuid4().hex
+    spills = []
+    buffer = []
+    buffered = 0
+    offset = 0
+
+    def sorted_buffer() -> pa.Table:
+        return _sorted(pa.Table.from_batches(buffer), sort_keys)
+
+    def spill() -> None:
+        path = spill_dir / f"{run_id}-{len(spills):05d}.parquet"
+        spills.append(path)
+        pq.write_table(sorted_buffer(), path, row_group_size=SPILL_ROW_GROUP_ROWS, compression=SPILL_COMPRESSION)
+
+    try:
+        for batch in batches:
+            order = pa.array(np.arange(offset, offset + batch.num_rows, dtype=np.int64))
+            buffer.append(batch.append_column(ORDER_KEY, order))
+            offset += batch.num_rows
+            buffered += batch.num_rows
+            if buffered >= buffer_rows:
+                spill()
+                buffer, buffered = [], 0
+
+        if not spills:
+            if buffer:
+                yield sorted_buffer().drop_columns([ORDER_KEY])
+            return
+
+        if buffer:
+            spill()
+            buffer = []
+        log.info(f"Merging {len(spills)} sorted runs of {offset} rows")
+        for table in _merge(spills, sort_keys, merge_rows):
+            yield table.drop_columns([ORDER_KEY])
+    finally:
+        for path in spills:
+            path.unlink(missing_ok=True)
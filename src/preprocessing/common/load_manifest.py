@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+from sqlalchemy import text
+
+from src.preprocessing.common.manifest import sha256_file
+
+LOAD_MANIFEST_TABLE = "_load_manifest"
+# Column of every incrementally loaded table naming the file a row came from.
+# COPY fills it from a per-transaction setting, so concurrent loads of
+# different files into one table never mix up their rows.
+SOURCE_COLUMN = "_source_file"
+SOURCE_SETTING = "bicing.source_file"
+SOURCE_COLUMN_SQL = f"\"{SOURCE_COLUMN}\" TEXT DEFAULT current_setting('{SOURCE_SETTING}', true)"
+
+MANIFEST_DDL = f"""
+CREATE TABLE IF NOT EXISTS {LOAD_MANIFEST_TABLE} (
+    table_name TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    row_count BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (table_name, source_file)
+)
+"""
+
+
+@dataclass
+class PendingFile:
+    """A file to load: new (``replace`` unset) or changed since it was loaded."""
+    file: Path
+    source: str                    # SOURCE_COLUMN value, the path relative to the loaded folder
+    content_hash: str
+    size: int
+    mtime_ns: int
+    replace: bool
+
+
+def table_exists(conn, table_name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": table_name}).scalar()
+
+
+def has_source_column(conn, table_name: str) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = :t AND column_name = :c)"
+    ), {"t": table_name, "c": SOURCE_COLUMN}).scalar()
+
+
+def prepare_table(engine, table_name: str, reload: bool = False) -> bool:
+    """
+    Create the load manifest if needed and check *table_name* against it.
+    With *reload*, or if the table predates incremental loads (no
+    ``SOURCE_COLUMN``), the table is dropped; the manifest entries of a
+    table that does not exist are forgotten, so everything is loaded again.
+    Returns whether the table exists.
+    """
+    with engine.connect() as conn:
+        conn.execute(text(MANIFEST_DDL))
+        exists = table_exists(conn, table_name)
+        if exists and (reload or not has_source_column(conn, table_name)):
+            conn.execute(text(f"DROP TABLE {table_name}"))
+            exists = False
+        if not exists:
+            conn.execute(text(f"DELETE FROM {LOAD_MANIFEST_TABLE} WHERE table_name = :t"), {"t": table_name})
+        conn.commit()
+    return exists
+
+
+def plan_loads(engine, table_name: str, folder: Path, files: Iterable[Path],
+               variant: str = "") -> tuple[list[PendingFile], int]:
+    """
+    The *files* that still have to be loaded into *table_name*: those the
+    manifest does not list, or lists with another content hash. A file
+    whose size and mtime match its entry is not re-hashed. *variant* names
+    settings the loaded rows depend on besides the file (e.g. a sampling
+    policy) and is recorded with the hash, so changing it reloads the file.
+    Returns the pending files and the number of files skipped as already
+    loaded.
+    """
+    files = list(files)
+    with engine.connect() as conn:
+        loaded = {
+            row.source_file: row for row in conn.execute(text(
+                f"SELECT source_file, content_hash, size, mtime_ns FROM {LOAD_MANIFEST_TABLE} WHERE table_name = :t"
+            ), {"t": table_name})
+        }
+
+        pending, touched = [], []
+        for file in files:
+            source = file.relative_to(folder).as_posix()
+            stat = file.stat()
+            entry = loaded.get(source)
+            if (entry is not None and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns
+                    and entry.content_hash.partition(" ")[2] == variant):
+                continue
+            content_hash = f"{sha256_file(file)} {variant}".rstrip()
+            if entry is not None and entry.content_hash == content_hash:
+                # Same content, new mtime: remember it so the file is not hashed again
+                touched.append({"t": table_name, "s": source, "size": stat.st_size, "mtime": stat.st_mtime_ns})
+                continue
+            pending.append(PendingFile(file, source, content_hash, stat.st_size, stat.st_mtime_ns,
+                                       replace=entry is not None))
+
+        if touched:
+            conn.execute(text(f"UPDATE {LOAD_MANIFEST_TABLE} SET size = :size, mtime_ns = :mtime "
+                              f"WHERE table_name = :t AND source_file = :s"), touched)
+            conn.commit()
+    return pending, len(files) - len(pending)
+
+
+def begin_file(execute: Callable, table_name: str, pending: PendingFile) -> None:
+    """
+    First statements of a file's load transaction (*execute* is
+    ``cursor.execute`` or ``Connection.exec_driver_sql``): tag the rows it
+    inserts with its source and, for a changed file, delete its old rows.
+    """
+    execute("SELECT set_config(%s, %s, true)", (SOURCE_SETTING, pending.source))
+    if pending.replace:
+        execute(f"DELETE FROM {table_name} WHERE \"{SOURCE_COLUMN}\" = %s", (pending.source,))
+
+
+def record_file(execute: Callable, table_name: str, pending: PendingFile, rows: int) -> None:
+    """Last statement of a file's load transaction: its manifest entry, committed with its rows."""
+    execute(
+        f"INSERT INTO {LOAD_MANIFEST_TABLE} (table_name, source_file, content_hash, size, mtime_ns, row_count, loaded_at) "
+        f"VALUES (%s, %s, %s, %s, %s, %s, now()) "
+        f"ON CONFLICT (table_name, source_file) DO UPDATE SET content_hash = EXCLUDED.content_hash, "
+        f"size = EXCLUDED.size, mtime_ns = EXCLUDED.mtime_ns, row_count = EXCLUDED.row_count, "
+        f"loaded_at = EXCLUDED.loaded_at",
+        (table_name, pending.source, pending.content_hash, pending.size, pending.mtime_ns, rows),
+    )
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+MANIFEST_NAME = "_manifest.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def sha256_of(path: Path):
+    """Return a sha256 object fed with the current contents of *path*."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h
+
+
+def sha256_file(path: Path) -> str:
+    return sha256_of(path).hexdigest()
+
+
+def write_json_atomic(path: Path, payload) -> None:
+    """Write JSON next to *path* and rename it into place."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class DownloadManifest:
+    """
+    Per-directory record of downloaded files: url, size, sha256 and the
+    ETag / Last-Modified validators the server sent. Entries with
+    ``complete=False`` describe a ``.part`` file that can be resumed.
+    """
+
+    def __init__(self, directory: Path):
+        self.path = directory / MANIFEST_NAME
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, name: str) -> Optional[dict]:
+        return self.entries.get(name)
+
+    def find_by_url(self, url: str) -> Optional[str]:
+        """Return the file name previously stored for *url*, if any."""
+        for name, entry in self.entries.items():
+            if entry.get("url") == url:
+                return name
+        return None
+
+    def is_complete(self, path: Path) -> bool:
+        """True only if *path* exists and matches the recorded final size."""
+        entry = self.entries.get(path.name)
+        return bool(
+            entry and entry.get("complete")
+            and path.exists() and path.stat().st_size == entry.get("size")
+        )
+
+    def record(self, name: str, **fields) -> None:
+        self.entries[name] = fields
+        self.save()
+
+    def discard(self, name: str) -> None:
+        if self.entries.pop(name, None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, self.entries)
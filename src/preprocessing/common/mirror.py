@@ -0,0 +1,140 @@
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.parse import quote, unquote, urlparse
+
+from src.preprocessing.common.ckan import (CKAN_API_URL, MIRROR_PACKAGE_DIR, MIRROR_RESOURCE_DIR,
+                                           fetch_dataset_metadata, filter_resources, sanitize_filename)
+from src.preprocessing.common.downloader import (CHUNK_SIZE, DEFAULT_CONCURRENCY, DownloadJob, download_all,
+                                                 filename_from_headers, local_response)
+from src.preprocessing.common.manifest import DownloadManifest, write_json_atomic
+
+# Mirror layout (CKAN_MIRROR points at its root):
+#   package/<dataset_id>.json                      package_show result, resource URLs relative
+#   resources/<dataset_id>/<resource_id>/<file>    the resource as the portal served it
+DEFAULT_MIRROR_DIR = Path("data/_mirror")
+DEFAULT_PORT = 8080
+
+# What the ingest scripts download, with the same filters
+PIPELINE_DATASETS = [
+    {"id": "6aa3416d-ce1a-494d-861b-7bd07f069600", "filter_years": range(2019, 2026),   # Bicing status
+     "allowed_extensions": (".7z", ".csv", ".zip", ".xls", ".xlsx", ".geojson")},
+    {"id": "bd2462df-6e1e-4e37-8205-a4b8e7313b84", "filter_years": range(2019, 2026),   # Bicing info
+     "allowed_extensions": (".7z", ".csv", ".zip", ".xls", ".xlsx", ".geojson")},
+    {"id": "e3497ea4-0bae-4093-94a7-119df50a8a74", "filter_years": range(2019, 2026),   # Bicycle lanes
+     "allowed_extensions": (".7z", ".csv", ".zip", ".xls", ".xlsx", ".geojson")},
+    {"id": "pad_mdbas", "filter_years": range(2019, 2022), "allowed_extensions": (".csv",)},
+    {"id": "renda-disponible-llars-bcn", "filter_years": range(2019, 2022), "allowed_formats": {"csv"}},
+    {"id": "20170706-districtes-barris", "allowed_formats": {"shp"}},
+]
+
+
+def snapshot_dataset(
+    dataset_id: str,
+    mirror_dir: Path = DEFAULT_MIRROR_DIR,
+    allowed_extensions: Optional[tuple] = None,
+    allowed_formats: Optional[set[str]] = None,
+    filter_years: Optional[Iterable[int]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    api_url: str = CKAN_API_URL,
+) -> None:
+    """
+    Copy a package's metadata and its matching resources from the portal into
+    *mirror_dir*. Re-running only re-fetches resources whose ETag changed.
+    """
+    metadata = fetch_dataset_metadata(dataset_id, api_url=api_url, mirror=None)
+    resources = filter_resources(
+        metadata.get("resources", []),
+        allowed_extensions=allowed_extensions,
+        allowed_formats=allowed_formats,
+        filter_years=filter_years,
+    )
+
+    resource_root = mirror_dir / MIRROR_RESOURCE_DIR / dataset_id
+    # Keep the served file name so name hooks see the same Content-Disposition
+    jobs = [
+        DownloadJob(url=res["url"], dest=resource_root / res["id"] / sanitize_filename(res["name"]),
+                    resolve_name=filename_from_headers, revalidate=True)
+        for res in resources
+    ]
+    print(f"Mirroring {dataset_id}: {len(jobs)} resources")
+    results = download_all(jobs, concurrency=concurrency)
+
+    mirrored = []
+    for res, result in zip(resources, results):
+        if result.status == "error":
+            print(f"[WARNING] {res['name']} not mirrored: {result.error}")
+            continue
+        entry = DownloadManifest(result.path.parent).get(result.path.name) or {}
+        mirrored.append({
+            **res,
+            "url": quote(result.path.relative_to(mirror_dir).as_posix()),
+            "source_url": res["url"],
+            "hash": entry.get("sha256", ""),
+        })
+
+    package = mirror_dir / MIRROR_PACKAGE_DIR / f"{dataset_id}.json"
+    package.parent.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(package, {**metadata, "resources": mirrored, "mirrored_from": api_url})
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """Static server for a mirror folder with the validators and ranges the downloader uses."""
+
+    root = DEFAULT_MIRROR_DIR
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        root = self.root.resolve()
+        path = (root / unquote(urlparse(self.path).path).lstrip("/")).resolve()
+        if not path.is_relative_to(root):
+            self.send_error(404)
+            return
+        status, headers, offset = local_response(path, self.headers)
+        if status == 404:
+            self.send_error(404)
+            return
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if status == 416:
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+        if status not in (200, 206):
+            return
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while chunk := f.read(CHUNK_SIZE):
+                self.wfile.write(chunk)
+
+
+def serve(mirror_dir: Path = DEFAULT_MIRROR_DIR, port: int = DEFAULT_PORT) -> None:
+    """Serve *mirror_dir* over HTTP for other nodes (CKAN_MIRROR=http://<host>:<port>)."""
+    handler = type("Handler", (MirrorHandler,), {"root": mirror_dir})
+    print(f"Serving {mirror_dir} on port {port}")
+    ThreadingHTTPServer(("", port), handler).serve_forever()
+
+
+if __name__ == "__main__":
+    # python -m src.preprocessing.common.mirror snapshot [dir]
+    # python -m src.preprocessing.common.mirror serve [dir] [port]
+    command = sys.argv[1] if len(sys.argv) > 1 else "snapshot"
+    mirror_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MIRROR_DIR
+
+    if command == "serve":
+        serve(mirror_dir, int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PORT)
+    else:
+        for dataset in PIPELINE_DATASETS:
+            print(f"\n=== Mirroring dataset: {dataset['id']} ===")
+            snapshot_dataset(
+                dataset_id=dataset["id"],
+                mirror_dir=mirror_dir,
+                allowed_extensions=dataset.get("allowed_extensions"),
+                allowed_formats=dataset.get("allowed_formats"),
+                filter_years=dataset.get("filter_years"),
+            )
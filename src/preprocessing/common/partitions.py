@@ -0,0 +1,143 @@
+import re
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from src.preprocessing.common.archive_index import path_period
+
+Month = tuple[int, int]
+
+# Key of the month-partitioned raw (TEXT) tables: the month of the stage
+# file a row came from, filled by COPY from a per-transaction setting like
+# load_manifest.SOURCE_COLUMN. Typed tables are partitioned on last_updated
+MONTH_COLUMN = "_month"
+MONTH_SETTING = "bicing.load_month"
+MONTH_COLUMN_SQL = f"\"{MONTH_COLUMN}\" DATE DEFAULT NULLIF(current_setting('{MONTH_SETTING}', true), '')::date"
+
+_MONTH_SUFFIX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_partition(table_name: str, month: Month) -> str:
+    """Name of the partition of *table_name* holding *month*: ``<table>_pYYYYMM``."""
+    year, number = month
+    return f"{table_name}_p{year:04d}{number:02d}"
+
+
+def default_partition(table_name: str) -> str:
+    """Partition of the rows no month partition takes (NULL keys, months that were not loaded)."""
+    return f"{table_name}_default"
+
+
+def partition_month(partition: str) -> Optional[Month]:
+    """The month of a partition named by ``month_partition``; ``None`` for the default one."""
+    match = _MONTH_SUFFIX.search(partition)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def file_months(files: Iterable[Path]) -> list[Month]:
+    """The months of stage files (their ``year=/month=`` partition or name), in order."""
+    return sorted({period for period in map(path_period, files) if None not in period})
+
+
+def _bound(month: Month, timezone: Optional[str]) -> str:
+    year, number = month
+    return f"'{year:04d}-{number:02d}-01" + (f" 00:00:00 {timezone}'" if timezone else "'")
+
+
+def _following(month: Month) -> Month:
+    year, number = month
+    return year + number // 12, number % 12 + 1
+
+
+def month_range_sql(column: str, month: Month, timezone: Optional[str] = None) -> str:
+    """
+    Condition selecting *month* of *column* (an SQL expression) as a half-open
+    range with the partition bounds, so the planner prunes the other months;
+    a function of the key (``TO_CHAR``, ``date_trunc``) prevents pruning.
+    """
+    return f"{column} >= {_bound(month, timezone)} AND {column} < {_bound(_following(month), timezone)}"
+
+
+def partitioned_table_sql(table_name: str, columns_sql: str, key: str) -> str:
+    """``CREATE TABLE`` of *table_name* (*columns_sql*) range-partitioned on the column *key*."""
+    return f"CREATE TABLE {table_name} ({columns_sql}) PARTITION BY RANGE (\"{key}\")"
+
+
+def month_partition_sql(table_name: str, month: Month, timezone: Optional[str] = None,
+                        unlogged: bool = False) -> str:
+    """
+    ``CREATE TABLE IF NOT EXISTS`` of the partition of *month*. Bounds are
+    dates for a DATE key and midnight in *timezone* for a TIMESTAMPTZ one.
+    """
+    return (f"CREATE {'UNLOGGED ' if unlogged else ''}TABLE IF NOT EXISTS {month_partition(table_name, month)} "
+            f"PARTITION OF {table_name} FOR VALUES FROM ({_bound(month, timezone)}) "
+            f"TO ({_bound(_following(month), timezone)})")
+
+
+def default_partition_sql(table_name: str, unlogged: bool = False) -> str:
+    return (f"CREATE {'UNLOGGED ' if unlogged else ''}TABLE IF NOT EXISTS {default_partition(table_name)} "
+            f"PARTITION OF {table_name} DEFAULT")
+
+
+def create_month_partitions(execute: Callable[[str], object], table_name: str, months: Iterable[Month],
+                            timezone: Optional[str] = None, unlogged: bool = False,
+                            key: Optional[str] = None, existing: Iterable[str] = ()) -> None:
+    """
+    Create the partitions of *months* not among the *existing* ones, and the
+    default partition. PostgreSQL refuses a new partition whose range the
+    default already holds, so when the default exists it is detached while
+    the months are created, its rows in their ranges (of the partition
+    column *key*) are moved into them, and it is attached back.
+    """
+    existing = set(existing)
+    missing = [month for month in months if month_partition(table_name, month) not in existing]
+    default = default_partition(table_name)
+    if default not in existing:
+        for month in missing:
+            execute(month_partition_sql(table_name, month, timezone, unlogged))
+        execute(default_partition_sql(table_name, unlogged))
+        return
+    if not missing:
+        return
+
+    execute(f"ALTER TABLE {table_name} DETACH PARTITION {default}")
+    for month in missing:
+        execute(month_partition_sql(table_name, month, timezone, unlogged))
+    column = f"\"{key}\""
+    ranges = " OR ".join(f"({month_range_sql(column, month, timezone)})" for month in missing)
+    execute(f"WITH moved AS (DELETE FROM {default} WHERE {ranges} RETURNING *) "
+            f"INSERT INTO {table_name} SELECT * FROM moved")
+    execute(f"ALTER TABLE {table_name} ATTACH PARTITION {default} DEFAULT")
+
+
+def is_partitioned_sql(table_name: str) -> str:
+    return f"SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('{table_name}'))"
+
+
+def partitions_sql(table_name: str) -> str:
+    """Query of the partition names of *table_name*, in name (so month) order."""
+    return (f"SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            f"WHERE i.inhparent = to_regclass('{table_name}') ORDER BY c.relname")
+
+
+def set_load_month(execute: Callable, file: Path) -> None:
+    """
+    Point ``MONTH_COLUMN`` at *file*'s month for the rest of the transaction
+    (*execute* as in ``load_manifest.begin_file``); files without a month
+    go to the default partition.
+    """
+    year, month = path_period(file)
+    value = f"{year:04d}-{month:02d}-01" if year is not None and month is not None else ""
+    execute("SELECT set_config(%s, %s, true)", (MONTH_SETTING, value))
+
+
+def detach_month_sql(table_name: str, month: Month, drop: bool = False) -> list[str]:
+    """
+    Statements retiring *month* from *table_name*: the partition is detached
+    (a catalog change, no rows are moved) and becomes an ordinary table that
+    can be dumped or moved elsewhere; with *drop* it is then dropped.
+    """
+    partition = month_partition(table_name, month)
+    statements = [f"ALTER TABLE {table_name} DETACH PARTITION {partition}"]
+    if drop:
+        statements.append(f"DROP TABLE {partition}")
+    return statements
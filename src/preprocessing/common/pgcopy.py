@@ -0,0 +1,170 @@
+import struct
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.preprocessing.common.timestamps import DETECT_SAMPLE, EPOCH, TimestampParser, detect_format
+
+# PostgreSQL binary COPY framing: signature, flags, header extension length
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+PG_EPOCH = 946_684_800             # 2000-01-01 UTC, the origin of binary timestamps
+
+# Binary field encodings and the column types they are sent to
+FIXED_WIDTH = {"int2": ">i2", "int4": ">i4", "int8": ">i8", "float8": ">f8", "timestamptz": ">i8"}
+SQL_TYPES = {"int2": "SMALLINT", "int4": "INTEGER", "int8": "BIGINT", "float8": "DOUBLE PRECISION",
+             "timestamptz": "TIMESTAMPTZ", "text": "TEXT"}
+INTEGER_RANGE = {"int2": (-2 ** 15, 2 ** 15 - 1), "int4": (-2 ** 31, 2 ** 31 - 1), "int8": (-2 ** 63, 2 ** 63 - 1)}
+
+# Naive date strings of the portal are Barcelona wall-clock time
+LOCAL_TIMEZONE = "Europe/Madrid"
+
+# Accepted spellings, as the cleaning SQL accepted them: counts are plain
+# digits, ids what CAST(... AS INTEGER) takes, epochs what NUMERIC takes
+DIGITS = r"^[0-9]{1,18}$"
+SIGNED_INTEGER = r"^\s*[+-]?[0-9]{1,18}\s*$"
+NUMBER = r"^\s*[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?\s*$"
+
+
+def _matches(column: pa.Array, pattern: str) -> np.ndarray:
+    return pc.fill_null(pc.match_substring_regex(column, pattern), False).to_numpy(zero_copy_only=False)
+
+
+def integer_values(column: pa.Array, pg_type: str, pattern: str = DIGITS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    int64 values of an integer or text column and the mask of valid ones:
+    text must match *pattern* and every value must fit *pg_type*; anything
+    else (``NA``, empty, out of range) is invalid.
+    """
+    if pa.types.is_integer(column.type):
+        values = pc.fill_null(column, 0).to_numpy(zero_copy_only=False).astype(np.int64)
+        valid = column.is_valid().to_numpy(zero_copy_only=False)
+    else:
+        column = column.cast(pa.string())
+        valid = _matches(column, pattern)
+        text = pc.utf8_trim_whitespace(pc.if_else(pa.array(valid), column, "0"))
+        values = pc.cast(text, pa.int64()).to_numpy(zero_copy_only=False)
+    low, high = INTEGER_RANGE[pg_type]
+    valid &= (values >= low) & (values <= high)
+    return values, valid
+
+
+def _epoch_numbers(column: pa.StringArray, numbers: np.ndarray) -> np.ndarray:
+    """Unix seconds of the epoch numbers of a text *column* (rows where *numbers*), 0 elsewhere."""
+    values = pc.cast(pc.if_else(pa.array(numbers), pc.utf8_trim_whitespace(column), "0"), pa.float64())
+    values = values.to_numpy(zero_copy_only=False)
+    # Half away from zero, like NUMERIC -> BIGINT
+    return (np.sign(values) * np.floor(np.abs(values) + 0.5)).astype(np.int64)
+
+
+def epoch_values(column: pa.Array, parser: TimestampParser) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Unix seconds (the instant, as ``timestamptz`` stores it) of a timestamp
+    column and the mask of parsed values. Epoch numbers are taken as they
+    are, also among date strings; in text they may be in scientific
+    notation and are rounded as ``CAST(... AS NUMERIC)`` then ``BIGINT``
+    rounds them. Date strings go through *parser* and are UTC when they end
+    in ``Z``, else ``LOCAL_TIMEZONE`` wall-clock time. ``NA`` and empty
+    values are invalid.
+    """
+    if pa.types.is_integer(column.type):
+        return integer_values(column, "int8")
+    column = column.cast(pa.string())
+    if parser.format is None:
+        parser.format = detect_format(column.drop_null().slice(0, DETECT_SAMPLE * 10).to_pylist())
+
+    numbers = _matches(column, NUMBER)
+    if parser.format in (None, EPOCH):
+        return _epoch_numbers(column, numbers), numbers
+
+    # Only date strings reach the parser: its fallback would read an epoch
+    # number as wall-clock time of the host, and NA and empty values would
+    # be reported
+    seconds = _epoch_numbers(column, numbers)
+    valid = numbers.copy()
+    present = pc.and_(pc.fill_null(pc.not_equal(column, "NA"), False), pa.array(~numbers))
+    rows = np.flatnonzero(present.to_numpy(zero_copy_only=False))
+    wall, parsed = parser.parse(column.filter(present))
+    rows, wall = rows[parsed], wall[parsed]
+    if parser.format.endswith("Z"):
+        seconds[rows], valid[rows] = wall, True
+        return seconds, valid
+    # Ambiguous autumn times are read as standard time, spring-gap times
+    # are moved to the end of the gap
+    local = pd.DatetimeIndex(wall.astype("datetime64[s]")).tz_localize(
+        LOCAL_TIMEZONE, ambiguous=np.zeros(len(wall), dtype=bool), nonexistent="shift_forward")
+    seconds[rows] = local.tz_convert("UTC").tz_localize(None).to_numpy().astype("datetime64[s]").astype(np.int64)
+    valid[rows] = True
+    return seconds, valid
+
+
+def text_values(column: pa.Array, missing: Sequence[str] = ("NA", "")) -> pa.StringArray:
+    """A column as text, null where it is one of the *missing* markers."""
+    column = column.cast(pa.string())
+    return pc.if_else(pc.is_in(column, pa.array(list(missing))), pa.scalar(None, pa.string()), column)
+
+
+def encode_rows(fields: Sequence[tuple[str, object, Optional[np.ndarray]]]) -> bytes:
+    """
+    One binary ``COPY ... FROM STDIN WITH (FORMAT binary)`` stream (header,
+    tuples, trailer) of the columns *fields*: ``(pg_type, values, valid)``
+    with NumPy values and a validity mask for fixed-width types, or a
+    string array (nulls as nulls, *valid* unused) for ``text``. Every row
+    is laid out with a few vectorized scatters; no Python object is made
+    per value.
+    """
+    num_rows = len(fields[0][1]) if fields else 0
+    encoded = []
+    sizes = np.full(num_rows, 2, dtype=np.int64)
+    for pg_type, values, valid in fields:
+        if pg_type == "text":
+            values = values.combine_chunks() if isinstance(values, pa.ChunkedArray) else values
+            valid = values.is_valid().to_numpy(zero_copy_only=False)
+            offsets = np.frombuffer(values.buffers()[1], dtype=np.int32)[values.offset:values.offset + num_rows + 1]
+            data = values.buffers()[2]
+            data = np.frombuffer(data, dtype=np.uint8) if data is not None else np.empty(0, dtype=np.uint8)
+            lengths = np.where(valid, np.diff(offsets), 0).astype(np.int64)
+            encoded.append((lengths, valid, ("text", data, offsets[:-1].astype(np.int64))))
+        else:
+            width = np.dtype(FIXED_WIDTH[pg_type]).itemsize
+            if pg_type == "timestamptz":
+                values = (values - PG_EPOCH) * 1_000_000
+            data = np.ascontiguousarray(values.astype(FIXED_WIDTH[pg_type])).view(np.uint8).reshape(num_rows, width)
+            lengths = np.where(valid, width, 0).astype(np.int64)
+            encoded.append((lengths, valid, ("fixed", data, None)))
+        sizes += 4 + lengths
+
+    row_starts = np.zeros(num_rows, dtype=np.int64)
+    np.cumsum(sizes[:-1], out=row_starts[1:])
+    row_starts += len(PGCOPY_HEADER)
+    total = len(PGCOPY_HEADER) + int(sizes.sum()) + len(PGCOPY_TRAILER)
+
+    out = np.empty(total, dtype=np.uint8)
+    out[:len(PGCOPY_HEADER)] = np.frombuffer(PGCOPY_HEADER, dtype=np.uint8)
+    out[total - len(PGCOPY_TRAILER):] = np.frombuffer(PGCOPY_TRAILER, dtype=np.uint8)
+    _scatter(out, row_starts, np.full(num_rows, len(fields), dtype=">i2"))
+
+    cursor = row_starts + 2
+    for lengths, valid, (kind, data, starts) in encoded:
+        _scatter(out, cursor, np.where(valid, lengths, -1).astype(">i4"))
+        cursor += 4
+        if kind == "fixed":
+            rows = np.flatnonzero(valid)
+            out[cursor[rows, None] + np.arange(data.shape[1])] = data[rows]
+        elif lengths.any():
+            # Variable-length bytes: one gather from the string data, one scatter into the rows
+            count = int(lengths.sum())
+            ends = np.cumsum(lengths)
+            step = np.arange(count) - np.repeat(ends - lengths, lengths)
+            out[np.repeat(cursor, lengths) + step] = data[np.repeat(starts, lengths) + step]
+        cursor += lengths
+    return out.tobytes()
+
+
+def _scatter(out: np.ndarray, positions: np.ndarray, values: np.ndarray) -> None:
+    """Write the big-endian bytes of each of *values* at the matching *positions* of *out*."""
+    width = values.dtype.itemsize
+    out[positions[:, None] + np.arange(width)] = np.ascontiguousarray(values).view(np.uint8).reshape(-1, width)
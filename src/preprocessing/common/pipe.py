@@ -0,0 +1,82 @@
+import queue
+import threading
+from typing import Iterable
+
+PIPE_CHUNKS = 8                    # chunks a producer may run ahead of the reader
+PIPE_READ_BYTES = 1024 * 1024      # read size to ask of copy_expert
+
+_END = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class BoundedPipe:
+    """
+    In-memory pipe from a producer thread to a reader such as
+    ``cursor.copy_expert``: ``write`` blocks while ``PIPE_CHUNKS`` chunks are
+    waiting, so the producer never runs far ahead, and ``read`` blocks until
+    data arrives. An exception in the producer is raised to the reader;
+    ``cancel`` (e.g. after the COPY failed) stops the producer at its next
+    write.
+    """
+
+    def __init__(self, max_chunks: int = PIPE_CHUNKS):
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.cancelled = threading.Event()
+        self.chunk = memoryview(b"")
+        self.done = False
+        self.bytes_read = 0
+
+    def _put(self, item) -> None:
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _Cancelled()
+
+    def write(self, data: bytes) -> None:
+        if data:
+            self._put(data)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(PIPE_READ_BYTES), b""))
+        while not self.chunk and not self.done:
+            item = self.queue.get()
+            if item is _END:
+                self.done = True
+            elif isinstance(item, BaseException):
+                self.done = True
+                raise item
+            else:
+                self.chunk = memoryview(item)
+        data = self.chunk[:size].tobytes()
+        self.chunk = self.chunk[len(data):]
+        self.bytes_read += len(data)
+        return data
+
+    def feed(self, chunks: Iterable[bytes]) -> threading.Thread:
+        """Write *chunks* on a daemon thread, then end the stream (with the error, if producing failed)."""
+        def produce() -> None:
+            try:
+                for chunk in chunks:
+                    self.write(chunk)
+                self._put(_END)
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                try:
+                    self._put(e)
+                except _Cancelled:
+                    pass
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        return thread
+
+    def cancel(self) -> None:
+        self.cancelled.set()
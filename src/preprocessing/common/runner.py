@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional, Sequence
+
+import pyarrow as pa
+from tqdm import tqdm
+
+# Projection and sampling are CPU bound: one file per core by default
+WORKERS = os.cpu_count()
+
+
+def _init_worker() -> None:
+    # Parallelism comes from the pool; Arrow threads would oversubscribe the cores
+    pa.set_cpu_count(1)
+
+
+def invoke(func: Callable, *args):
+    """Task function for mixing callables in one pool: tasks are ``(func, *args)``."""
+    return func(*args)
+
+
+def run_sharded(
+    func: Callable,
+    tasks: Sequence[tuple],
+    sizes: Sequence[int],
+    workers: Optional[int] = WORKERS,
+    desc: Optional[str] = None,
+) -> Iterator[tuple[tuple, object]]:
+    """
+    Run ``func(*args)`` for every *args* tuple in *tasks* on a process pool and
+    yield ``(args, result)`` as they finish; a task that raised yields the
+    exception as its result. Tasks are submitted largest *sizes* first
+    (longest-processing-time order) so a big file never starts last on an
+    otherwise idle pool. With ``workers=1`` everything runs in-process.
+    """
+    order = sorted(range(len(tasks)), key=lambda i: sizes[i], reverse=True)
+
+    if workers == 1 or len(tasks) <= 1:
+        for i in tqdm(order, desc=desc, unit="file"):
+            try:
+                result = func(*tasks[i])
+            except Exception as e:
+                result = e
+            yield tasks[i], result
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(func, *tasks[i]): tasks[i] for i in order}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc, unit="file"):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield futures[future], result
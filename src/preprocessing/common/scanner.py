@@ -0,0 +1,203 @@
+import csv
+import mmap
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+SCAN_BLOCK_BYTES = 16 * 1024 * 1024    # bytes scanned per block, like the Arrow reader's batches
+
+_QUOTE, _COMMA, _NEWLINE, _RETURN = b'"'[0], b","[0], b"\n"[0], b"\r"[0]
+
+
+def _gather(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Bytes [starts[i], ends[i]) of *data* concatenated, and their int32 offsets."""
+    lengths = ends - starts
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if offsets[-1] == 0:
+        return np.empty(0, dtype=np.uint8), offsets.astype(np.int32)
+    index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return data[index], offsets.astype(np.int32)
+
+
+class CsvBlock:
+    """
+    Whole records of one block of a CSV buffer, located without copying:
+    the byte span of every row and the positions of its delimiters. Fields
+    become Python-free Arrow arrays on request (``column``) and kept rows can
+    be copied out verbatim (``raw_rows``).
+    """
+
+    def __init__(self, data: np.ndarray, final: bool):
+        quotes = data == _QUOTE
+        if quotes.any():
+            # A delimiter counts only outside quotes: after an even number of them
+            outside = (np.cumsum(quotes, dtype=np.uint8) & 1) == 0
+            newlines = np.flatnonzero((data == _NEWLINE) & outside)
+            commas = np.flatnonzero((data == _COMMA) & outside)
+        else:
+            outside = None
+            newlines = np.flatnonzero(data == _NEWLINE)
+            commas = np.flatnonzero(data == _COMMA)
+
+        # A last row without a newline is complete only at the end of the input
+        self.size = int(newlines[-1]) + 1 if len(newlines) else 0
+        if final and self.size < len(data):
+            newlines = np.append(newlines, len(data))
+            self.size = len(data)
+        self.data = data
+        self.has_quotes = outside is not None
+
+        starts = np.concatenate([[0], newlines[:-1] + 1]).astype(np.int64) if len(newlines) else newlines
+        ends = np.minimum(newlines, len(data))
+        carriage = (ends > starts) & (data[np.maximum(ends - 1, 0)] == _RETURN)
+        ends = ends - carriage
+
+        # Empty lines are skipped, as the Arrow reader does
+        rows = ends > starts
+        self.row_starts = starts[rows]
+        self.row_ends = ends[rows]
+        self.line_ends = np.minimum(newlines[rows] + 1, len(data))
+        self.num_rows = len(self.row_starts)
+
+        commas = commas[commas < self.size]
+        self.commas = commas
+        self.first_comma = np.searchsorted(commas, self.row_starts)
+        self.field_counts = np.searchsorted(commas, self.row_ends) - self.first_comma + 1
+
+    def field_spans(self, index: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(starts, ends, present) of field *index* of every row; absent in rows with fewer fields."""
+        present = self.field_counts > index
+        rows = np.flatnonzero(present)
+        first = self.first_comma[rows]
+        commas = np.append(self.commas, 0)    # the last field of the block has no comma after it
+        starts = self.row_starts.copy()
+        ends = self.row_starts.copy()
+        if index > 0:
+            starts[rows] = commas[first + index - 1] + 1
+        last = self.field_counts[rows] == index + 1
+        ends[rows] = np.where(last, self.row_ends[rows], commas[first + index])
+        return starts, ends, present
+
+    def column(self, index: int) -> pa.StringArray:
+        """
+        Field *index* of every row as a string array, built from one gather of
+        the field bytes. Surrounding quotes are removed and doubled quotes
+        unescaped; empty and absent fields are null.
+        """
+        starts, ends, _ = self.field_spans(index)
+        quoted = np.zeros(len(starts), dtype=bool)
+        if self.has_quotes:
+            nonempty = ends - starts >= 2
+            quoted[nonempty] = (self.data[starts[nonempty]] == _QUOTE) & (self.data[ends[nonempty] - 1] == _QUOTE)
+            starts = starts + quoted
+            ends = ends - quoted
+        values, offsets = _gather(self.data, starts, ends)
+        valid = ends > starts
+        array = pa.StringArray.from_buffers(len(starts), pa.py_buffer(offsets), pa.py_buffer(values),
+                                            pa.array(valid).buffers()[1], null_count=int((~valid).sum()))
+        array.validate(full=True)
+        if quoted.any():
+            array = pc.if_else(pa.array(quoted), pc.replace_substring(array, '""', '"'), array)
+        return array
+
+    def raw_rows(self, keep: Optional[np.ndarray] = None) -> bytes:
+        """The text of the (kept) rows as in the input, each ending with a newline."""
+        rows = np.arange(self.num_rows) if keep is None else np.flatnonzero(keep)
+        text, _ = _gather(self.data, self.row_starts[rows], self.line_ends[rows])
+        text = text.tobytes()
+        if len(rows) and self.line_ends[rows[-1]] == len(self.data) and not text.endswith(b"\n"):
+            text += b"\r\n"
+        return text
+
+
+class CsvScanner:
+    """
+    Block scanner over the records of a CSV file, for the row-wise paths of
+    the bicing stages: memory-mapped for files (optionally only the bytes
+    [start, end) after the header, e.g. a shard or a checkpoint segment),
+    read in blocks for streams such as archive members. Each ``CsvBlock``
+    holds whole records (quoted fields may span lines); rows may have any
+    number of fields.
+    """
+
+    def __init__(self, source: Union[Path, BinaryIO], start: Optional[int] = None, end: Optional[int] = None,
+                 block_bytes: int = SCAN_BLOCK_BYTES):
+        self.block_bytes = block_bytes
+        self.file = self.map = self.stream = None
+        if isinstance(source, Path):
+            self.file = open(source, "rb")
+            header = self.file.readline()
+            size = self.file.seek(0, 2)
+            if size:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.position = len(header) if start is None else start
+            self.end = size if end is None else end
+        else:
+            self.stream = source
+            header = source.readline()
+        self.header = next(csv.reader([header.decode("utf-8")]), [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass    # a block still refers to it; unmapped once that is gone
+        if self.file is not None:
+            self.file.close()
+
+    def _mapped_blocks(self) -> Iterator[CsvBlock]:
+        block_bytes = self.block_bytes
+        while self.position < self.end:
+            size = min(block_bytes, self.end - self.position)
+            final = self.position + size == self.end
+            data = np.frombuffer(self.map, dtype=np.uint8, count=size, offset=self.position)
+            block = CsvBlock(data, final)
+            if block.size == 0:
+                # A record longer than the block
+                block_bytes *= 2
+                continue
+            self.position += block.size
+            yield block
+
+    def _read_blocks(self) -> Iterator[CsvBlock]:
+        rest = b""
+        while True:
+            chunk = self.stream.read(self.block_bytes)
+            data = rest + chunk if rest else chunk
+            if not data:
+                return
+            block = CsvBlock(np.frombuffer(data, dtype=np.uint8), final=not chunk)
+            rest = data[block.size:]
+            if block.num_rows:
+                yield block
+
+    def blocks(self) -> Iterator[CsvBlock]:
+        if self.stream is not None:
+            return self._read_blocks()
+        return self._mapped_blocks() if self.map is not None else iter(())
+
+    def record_batches(self, columns: list) -> tuple[pa.Schema, Iterator[pa.RecordBatch]]:
+        """
+        Schema and record batches of the *columns* present in the header (in
+        *columns* order, as strings); only those fields are copied.
+        """
+        indices = {name: i for i, name in enumerate(self.header)}
+        present = [c for c in columns if c in indices]
+        schema = pa.schema([(c, pa.string()) for c in present])
+
+        def batches() -> Iterator[pa.RecordBatch]:
+            for block in self.blocks():
+                yield pa.RecordBatch.from_arrays([block.column(indices[c]) for c in present], schema=schema)
+
+        return schema, batches()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pyarrow.parquet as pq
+
+from src.preprocessing.common.archives import iter_csv_members
+from src.preprocessing.common.columnar import read_header
+from src.preprocessing.common.manifest import sha256_file, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+HEADER_CACHE_NAME = "_header_cache.json"
+# Bytes hashed at each end of a file: the CSV header sits in the first
+# block, the Parquet schema in the footer at the end. Archives are hashed
+# whole, as their members' headers sit anywhere in the compressed middle
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def fingerprint(path: Path) -> str:
+    """sha256 of the size, first and last ``FINGERPRINT_BYTES`` of *path*; pins its header or footer."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        h.update(str(size).encode())
+        f.seek(0)
+        h.update(f.read(FINGERPRINT_BYTES))
+        f.seek(max(size - FINGERPRINT_BYTES, 0))
+        h.update(f.read(FINGERPRINT_BYTES))
+    return h.hexdigest()
+
+
+def read_file_columns(path: Path) -> list[str]:
+    """Column names of a stage file: the Parquet footer schema or the first line of a CSV."""
+    if path.suffix == ".parquet":
+        return pq.read_schema(path).names
+    with open(path, "rb") as f:
+        return read_header(f)
+
+
+class HeaderCache:
+    """
+    Column names of the files (and archive members) of a folder, kept in
+    ``<folder>/_header_cache.json`` keyed by content hash (``fingerprint``
+    for stage files, the sha256 of the whole file for archives), so a file
+    is only opened again when it changes. Files whose size and mtime are
+    unchanged are not even re-hashed, as in the archive index.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.path = directory / HEADER_CACHE_NAME
+        self.headers: dict[str, list[str]] = {}
+        self.files: dict[str, dict] = {}
+        self.changed = False
+        if self.path.exists():
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    saved = json.load(f)
+                self.headers, self.files = saved["headers"], saved["files"]
+            except Exception as e:
+                log.warning(f"Ignoring unreadable header cache {self.path}: {e}")
+
+    def _key(self, path: Path) -> str:
+        try:
+            return path.resolve().relative_to(self.directory.resolve()).as_posix()
+        except ValueError:
+            return str(path.resolve())
+
+    def file_hash(self, path: Path, whole: bool = False) -> str:
+        """
+        Content hash of *path* (``fingerprint``, or the sha256 of the *whole*
+        file), recomputed only when its size or mtime changed.
+        """
+        key = self._key(path)
+        stat = path.stat()
+        entry = self.files.get(key)
+        if (entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+                and entry.get("whole", False) == whole):
+            return entry["hash"]
+        digest = sha256_file(path) if whole else fingerprint(path)
+        self.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest, "whole": whole}
+        self.changed = True
+        return digest
+
+    def columns(self, path: Path) -> list[str]:
+        """Column names of a CSV or Parquet file."""
+        digest = self.file_hash(path)
+        if digest not in self.headers:
+            self.headers[digest] = read_file_columns(path)
+            self.changed = True
+        return self.headers[digest]
+
+    def member_columns(self, archive: Path, members: Optional[Iterable[str]] = None) -> dict[str, list[str]]:
+        """
+        Column names of the CSV members of *archive* (all of them, or only
+        *members*). Uncached members are streamed once, up to their first line.
+        """
+        digest = self.file_hash(archive, whole=True)
+        names = list(members) if members is not None else [
+            key.split("/", 1)[1] for key in self.headers if key.startswith(f"{digest}/")]
+        # Without *members* and nothing cached for this archive, every CSV member is read
+        missing = [m for m in names if f"{digest}/{m}" not in self.headers] if members is not None or names else None
+        if missing is None or missing:
+            for name, stream in iter_csv_members(archive, missing):
+                self.headers[f"{digest}/{name}"] = read_header(stream.buffer)
+                self.changed = True
+                if missing is None:
+                    names.append(name)
+        return {name: self.headers[f"{digest}/{name}"] for name in names}
+
+    def save(self) -> None:
+        if self.changed:
+            write_json_atomic(self.path, {"headers": self.headers, "files": self.files})
+            self.changed = False
+
+
+def discover_columns(files: Iterable[Path], directory: Path) -> dict[Path, list[str]]:
+    """
+    Column names of each of *files* from their header alone (the first line
+    of a CSV, the footer of a Parquet file), through the header cache of
+    *directory*. Files whose header cannot be read are left out and logged.
+    """
+    cache = HeaderCache(directory)
+    mapping = {}
+    try:
+        for file in files:
+            try:
+                mapping[file] = cache.columns(file)
+            except Exception as e:
+                log.warning(f"Could not read the header of {file}: {e}")
+    finally:
+        cache.save()
+    return mapping
@@ -0,0 +1,227 @@
+import io
+import shutil
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.preprocessing.common.columnar import PARQUET_COMPRESSION
+
+# Files larger than this are split into shards of about this many bytes
+# (on disk for CSV, uncompressed row groups for Parquet)
+RANGE_BYTES = 256 * 1024 * 1024
+COPY_CHUNK = 16 * 1024 * 1024
+
+
+class RangeReader(io.RawIOBase):
+    """Header line of a CSV file followed by its bytes [start, end)."""
+
+    def __init__(self, path: Path, start: int, end: int):
+        self.file = open(path, "rb")
+        self.header = self.file.readline()
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.header:
+            n = min(len(buffer), len(self.header))
+            buffer[:n] = self.header[:n]
+            self.header = self.header[n:]
+            return n
+        n = min(len(buffer), self.remaining)
+        if n <= 0:
+            return 0
+        n = self.file.readinto(memoryview(buffer)[:n])
+        self.remaining -= n
+        return n
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
+
+
+def open_range(path: Path, start: int, end: int) -> BinaryIO:
+    """Binary stream of one byte range of *path* that reads like a whole CSV file."""
+    return io.BufferedReader(RangeReader(path, start, end), buffer_size=1024 * 1024)
+
+
+def byte_ranges(path: Path, range_bytes: int = RANGE_BYTES) -> list[tuple[int, int, int]]:
+    """
+    Split the rows of a CSV file into (start, end, size) byte ranges of about
+    *range_bytes*, each ending on a newline. A quoted field spanning a range
+    boundary makes the shards unparseable; callers then process the file whole.
+    """
+    size = path.stat().st_size
+    ranges = []
+    with open(path, "rb") as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            if start + range_bytes >= size:
+                end = size
+            else:
+                # Back one byte so a range already ending on a newline stays put
+                f.seek(start + range_bytes - 1)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end, end - start))
+            start = end
+    return ranges
+
+
+def _record_end(f: BinaryIO, start: int, range_bytes: int, size: int) -> int:
+    """
+    End of the range of about *range_bytes* starting at the record boundary
+    *start*: the first newline outside quotes from ``start + range_bytes - 1``
+    on, or the end of the file. Quotes are counted from *start*, where their
+    parity is even, with a running count.
+    """
+    f.seek(start)
+    offset = start
+    quotes = 0    # quotes between *start* and *offset*
+    while True:
+        block = f.read(COPY_CHUNK)
+        if not block:
+            return size
+        pos = max(0, start + range_bytes - 1 - offset)
+        before, counted = quotes, 0    # quotes before block[counted]
+        while pos < len(block):
+            newline = block.find(b"\n", pos)
+            if newline < 0:
+                break
+            before += block.count(b'"', counted, newline)
+            counted = newline
+            if before % 2 == 0:
+                return offset + newline + 1
+            pos = newline + 1    # inside a quoted field
+        quotes += block.count(b'"')
+        offset += len(block)
+
+
+def iter_record_ranges(path: Path, range_bytes: int = RANGE_BYTES,
+                       start: Optional[int] = None) -> Iterator[tuple[int, int, int]]:
+    """
+    The ranges of ``record_ranges`` from the record boundary *start* on (the
+    first row by default). Each range is only scanned when it is requested,
+    so a consumer processing them in turn reads the bytes it is about to
+    process; a file no larger than *range_bytes* is not scanned at all.
+    """
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        if start is None:
+            f.readline()
+            start = f.tell()
+            if start >= size:
+                yield start, size, 0
+                return
+        while start < size:
+            end = size if start + range_bytes >= size else _record_end(f, start, range_bytes, size)
+            yield start, end, end - start
+            start = end
+
+
+def record_ranges(path: Path, range_bytes: int = RANGE_BYTES) -> list[tuple[int, int, int]]:
+    """
+    Like ``byte_ranges``, but a range never ends inside a quoted field: the
+    parity of the quotes before each candidate newline is tracked, so every
+    range parses on its own. A file with no rows is one empty range.
+    """
+    return list(iter_record_ranges(path, range_bytes))
+
+
+def row_group_ranges(path: Path, range_bytes: int = RANGE_BYTES) -> list[tuple[int, int, int]]:
+    """Group the row groups of a Parquet file into (first, stop, size) ranges of about *range_bytes*."""
+    metadata = pq.ParquetFile(path).metadata
+    ranges = []
+    start = size = 0
+    for i in range(metadata.num_row_groups):
+        size += metadata.row_group(i).total_byte_size
+        if size >= range_bytes or i == metadata.num_row_groups - 1:
+            ranges.append((start, i + 1, size))
+            start, size = i + 1, 0
+    return ranges
+
+
+def shard_ranges(path: Path, range_bytes: int = RANGE_BYTES) -> list[tuple[int, int, int]]:
+    """Shards of a stage file: byte ranges of a CSV, row group ranges of a Parquet file."""
+    if path.suffix == ".parquet":
+        return row_group_ranges(path, range_bytes)
+    return byte_ranges(path, range_bytes)
+
+
+def part_path(output_file: Path, index: int) -> Path:
+    """Output of shard *index*; the suffix keeps it out of the stage globs."""
+    return output_file.with_name(f"{output_file.name}.part-{index:05d}")
+
+
+def iter_records(f: BinaryIO) -> Iterator[bytes]:
+    """Raw CSV records of a binary stream; a record spans lines while a quoted field is open."""
+    record = b""
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        record += line
+        if record.count(b'"') % 2 == 0:
+            yield record
+            record = b""
+    if record:
+        yield record
+
+
+def _concat_csv(parts: list[Path], output_file: Path, drops: list[set]) -> None:
+    with open(output_file, "wb") as out:
+        for i, part in enumerate(parts):
+            with open(part, "rb") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                if drops[i]:
+                    last = max(drops[i])
+                    for index, record in enumerate(iter_records(f)):
+                        if index not in drops[i]:
+                            out.write(record)
+                        if index == last:
+                            break
+                shutil.copyfileobj(f, out, COPY_CHUNK)
+
+
+def _concat_parquet(parts: list[Path], output_file: Path, drops: list[set]) -> None:
+    writer = None
+    try:
+        for i, part in enumerate(parts):
+            parquet_file = pq.ParquetFile(part)
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, parquet_file.schema_arrow, compression=PARQUET_COMPRESSION)
+            offset = 0
+            for group in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(group)
+                dropped = [d - offset for d in drops[i] if offset <= d < offset + table.num_rows]
+                offset += table.num_rows
+                if dropped:
+                    keep = np.ones(table.num_rows, dtype=bool)
+                    keep[dropped] = False
+                    table = table.filter(pa.array(keep))
+                writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def concat_parts(parts: list[Path], output_file: Path, drops: Optional[list[set]] = None,
+                 fmt: Optional[str] = None) -> None:
+    """
+    Write the shard outputs *parts* to *output_file* in order (*fmt* "csv" or
+    "parquet", by default from the suffix), leaving out the rows whose index
+    is in ``drops[i]`` for part i.
+    """
+    drops = drops or [set()] * len(parts)
+    if (fmt or output_file.suffix.lstrip(".")) == "parquet":
+        _concat_parquet(parts, output_file, drops)
+    else:
+        _concat_csv(parts, output_file, drops)
@@ -0,0 +1,155 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+log = logging.getLogger(__name__)
+
+EPOCH = "epoch"  # Unix seconds, read as local time like datetime.fromtimestamp
+
+# Formats of the portal dumps, in the order they are tried; any value
+# matches at most one of them
+TIMESTAMP_FORMATS = [
+    EPOCH,
+    "%Y-%m-%dT%H:%M:%S.%fZ",  # ISO format with microseconds
+    "%Y-%m-%dT%H:%M:%SZ",     # ISO format without microseconds
+    "%Y-%m-%d %H:%M:%S",      # Standard format
+    "%Y-%m-%d %H:%M:%S.%f",   # Standard format with microseconds
+    "%d/%m/%Y %H:%M",         # European format dd/mm/yyyy HH:MM
+]
+
+DETECT_SAMPLE = 1000
+MAX_EXAMPLES = 10
+# UTC offsets only change on 15-minute boundaries
+_OFFSET_STEP = 900
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_value(value: str, fmt: str) -> Optional[datetime]:
+    """*value* parsed with one format, or None."""
+    try:
+        if fmt == EPOCH:
+            return datetime.fromtimestamp(int(value))
+        return datetime.strptime(value, fmt)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def wall_seconds(timestamp: datetime) -> int:
+    """Seconds since 1970-01-01 of a naive wall-clock time."""
+    return (timestamp - _NAIVE_EPOCH) // timedelta(seconds=1)
+
+
+def detect_format(values: Iterable[str]) -> Optional[str]:
+    """Format parsing most of the first non-empty *values* (the earlier one on ties), or None."""
+    sample = []
+    for value in values:
+        if value:
+            sample.append(value)
+            if len(sample) == DETECT_SAMPLE:
+                break
+    counts = {fmt: sum(parse_value(v, fmt) is not None for v in sample) for fmt in TIMESTAMP_FORMATS}
+    best = max(TIMESTAMP_FORMATS, key=counts.get)
+    return best if counts[best] else None
+
+
+def _utc_offset(epoch: int) -> Optional[int]:
+    try:
+        local = datetime.fromtimestamp(epoch)
+        utc = datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        return None
+    return int((local - utc).total_seconds())
+
+
+def local_seconds(epochs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Wall-clock seconds of Unix *epochs* in the local time zone, as
+    ``datetime.fromtimestamp`` sees them, and a mask of the convertible ones.
+    The offset is looked up once per distinct 15-minute step.
+    """
+    steps, inverse = np.unique(epochs // _OFFSET_STEP, return_inverse=True)
+    offsets = [_utc_offset(int(step) * _OFFSET_STEP) for step in steps]
+    valid = np.array([offset is not None for offset in offsets], dtype=bool)[inverse]
+    offsets = np.array([offset or 0 for offset in offsets], dtype=np.int64)[inverse]
+    return epochs + offsets, valid
+
+
+class TimestampParser:
+    """
+    Per-file timestamp parsing. The format is detected once from the first
+    values and whole columns are converted with one vectorized parse; values
+    it misses go through every format one by one. Values nothing parses are
+    counted, with a few examples, instead of raising.
+    """
+
+    def __init__(self, source_name: str):
+        self.source_name = source_name
+        self.format = None
+        self.invalid = 0
+        self.examples = []
+
+    def _unparseable(self, value) -> None:
+        self.invalid += 1
+        if len(self.examples) < MAX_EXAMPLES:
+            self.examples.append(value)
+            log.warning(f"Could not parse timestamp: '{value}' in {self.source_name}")
+
+    def parse_one(self, value: str) -> Optional[int]:
+        """Wall-clock seconds of one value, or None."""
+        if self.format is None and value:
+            self.format = detect_format([value])
+        formats = TIMESTAMP_FORMATS
+        if self.format is not None:
+            formats = [self.format] + [fmt for fmt in TIMESTAMP_FORMATS if fmt != self.format]
+        for fmt in formats:
+            timestamp = parse_value(value, fmt)
+            if timestamp is not None:
+                return wall_seconds(timestamp)
+        self._unparseable(value)
+        return None
+
+    def parse(self, column: pa.Array) -> tuple[np.ndarray, np.ndarray]:
+        """Wall-clock seconds of a column (int64) and the mask of parsed values."""
+        if pa.types.is_integer(column.type):
+            epochs = pc.fill_null(column, 0).to_numpy(zero_copy_only=False).astype(np.int64)
+            seconds, valid = local_seconds(epochs)
+            valid &= column.is_valid().to_numpy(zero_copy_only=False)
+        else:
+            column = column.cast(pa.string())
+            if self.format is None:
+                self.format = detect_format(column.drop_null().slice(0, DETECT_SAMPLE * 10).to_pylist())
+            seconds, valid = self._parse_strings(column)
+
+        # Values outside the detected format, one at a time
+        missed = np.flatnonzero(~valid)
+        if len(missed):
+            values = column.take(pa.array(missed)).to_pylist()
+            for i, value in zip(missed, values):
+                parsed = self.parse_one(str(value) if value is not None else "")
+                if parsed is not None:
+                    seconds[i] = parsed
+                    valid[i] = True
+        return seconds, valid
+
+    def _parse_strings(self, column: pa.Array) -> tuple[np.ndarray, np.ndarray]:
+        if self.format == EPOCH:
+            digits = pc.fill_null(pc.match_substring_regex(column, r"^-?[0-9]{1,18}$"), False)
+            epochs = pc.cast(pc.if_else(digits, column, "0"), pa.int64()).to_numpy(zero_copy_only=False)
+            seconds, valid = local_seconds(epochs)
+            return seconds, valid & digits.to_numpy(zero_copy_only=False)
+        if self.format is not None:
+            parsed = pd.to_datetime(column.to_numpy(zero_copy_only=False), format=self.format, errors="coerce")
+            valid = ~np.asarray(parsed.isna())
+            seconds = np.zeros(len(column), dtype=np.int64)
+            seconds[valid] = np.asarray(parsed[valid]).astype("datetime64[s]").astype(np.int64)
+            return seconds, valid
+        return np.zeros(len(column), dtype=np.int64), np.zeros(len(column), dtype=bool)
+
+    def report(self) -> None:
+        if self.invalid:
+            log.warning(f"{self.invalid} unparseable timestamps in {self.source_name}, e.g. {self.examples[:3]}")
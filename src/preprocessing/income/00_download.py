@@ -1,44 +1,33 @@
 import os
-import re
-import requests
 from pathlib import Path
 from typing import Optional, Iterable
 from tqdm import tqdm
 import pandas as pd
 
+from src.preprocessing.common.ckan import (
+    extract_year_from_name, fetch_dataset_metadata, filter_resources, plan_sync, resource_sha256,
+    save_sync_state,
+)
+from src.preprocessing.common.downloader import DEFAULT_CONCURRENCY, DownloadJob, download_all
+
 # ─────────── Config ───────────
 DATASET_ID       = "renda-disponible-llars-bcn"
 OUTPUT_DIR       = Path("data/income/raw")
 ALLOWED_FORMATS  = {"csv"}          # file formats to accept
 FILTER_YEARS     = range(2019, 2022)  
+SOURCE_SUBDIR    = "source"         # unmodified portal downloads
 # ──────────────────────────────
 
 
-def fetch_dataset_metadata(dataset_id: str) -> dict:
-    """Return the CKAN package metadata for a dataset."""
-    url = (
-        "https://opendata-ajuntament.barcelona.cat/data/api/3/action/"
-        f"package_show?id={dataset_id}"
-    )
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    meta = r.json()
-    if not meta.get("success", False):
-        raise RuntimeError("CKAN returned success=false")
-    return meta["result"]
-
-
-def extract_year_from_name(name: str) -> str:
-    """Extract the first 4-digit year (20xx) found in the resource name."""
-    match = re.search(r"(20\d{2})", name)
-    return match.group(1) if match else "unknown"
-
-
-def year_filter(name: str, filter_years: Optional[Iterable[int]]) -> bool:
-    """Return True if the resource name matches the allowed years (or if no filter)."""
-    if not filter_years:
-        return True
-    return any(str(y) in name for y in filter_years)
+def normalize_income_csv(source: Path, out_path: Path) -> None:
+    """Write *source* to *out_path* with the ``Any`` column as ISO dates."""
+    df = pd.read_csv(source, sep=",", encoding="utf-8")
+    if "Any" in df.columns:
+        df["Any"] = (
+            pd.to_datetime(df["Any"].astype(str) + "-01-01")
+            .dt.strftime("%Y-%m-%d")
+        )
+    df.to_csv(out_path, sep=",", index=False, encoding="utf-8")
 
 
 def download_all_csv_resources(
@@ -46,48 +35,44 @@ def download_all_csv_resources(
     output_dir: Path,
     allowed_formats: set[str],
     filter_years: Optional[Iterable[int]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    sync: bool = False,
 ) -> None:
     """Download every CSV resource matching the optional year filter."""
     meta = fetch_dataset_metadata(dataset_id)
-    resources = meta.get("resources", [])
+    eligible = filter_resources(
+        meta.get("resources", []),
+        allowed_formats=allowed_formats,
+        filter_years=filter_years,
+    )
 
-    os.makedirs(output_dir, exist_ok=True)
+    # The portal files are kept untouched under source/ (so the download
+    # manifest stays valid); the normalised copies live next to it.
+    source_dir = output_dir / SOURCE_SUBDIR
+    os.makedirs(source_dir, exist_ok=True)
 
-    # Pre-filter once so tqdm shows the correct length
-    eligible = [
-        res for res in resources
-        if (
-            res.get("url")
-            and res.get("format", "").lower() in allowed_formats
-            and year_filter(res.get("name", ""), filter_years)
-        )
+    jobs = [
+        DownloadJob(url=res["url"], dest=source_dir / f"income_{extract_year_from_name(res.get('name', ''))}.csv",
+                    sha256=resource_sha256(res))
+        for res in eligible
     ]
+    if sync:
+        jobs = plan_sync(source_dir, dataset_id, meta, eligible, jobs)
 
-    for res in tqdm(eligible, desc="Downloading resources", unit="file"):
-        name = res.get("name", "")
-        url = res["url"]
-        year = extract_year_from_name(name)
-        out_path = output_dir / f"income_{year}.csv"
+    results = download_all(jobs, concurrency=concurrency)
+    if sync:
+        save_sync_state(source_dir, dataset_id, meta, eligible, results)
 
-        try:
-            resp = requests.get(url, stream=True, timeout=60)
-            resp.raise_for_status()
-        except Exception as exc:
-            tqdm.write(f"[FAIL] {url} — {exc}")
+    fresh = {r.path for r in results if r.status == "ok"}
+    for source in sorted(source_dir.glob("income_*.csv")):
+        out_path = output_dir / source.name
+        if source not in fresh and out_path.exists():
             continue
-
         try:
-            df = pd.read_csv(resp.raw, sep=",", encoding="utf-8")
-            if "Any" in df.columns:
-                df["Any"] = (
-                    pd.to_datetime(df["Any"].astype(str) + "-01-01")
-                    .dt.strftime("%Y-%m-%d")
-                )
-            df.to_csv(out_path, sep=",", index=False, encoding="utf-8")
+            normalize_income_csv(source, out_path)
             tqdm.write(f"[ OK ] Saved to {out_path}")
         except Exception as e:
-            tqdm.write(f"[FAIL] Error reading CSV from {url}: {e}")
-            continue
+            tqdm.write(f"[FAIL] Error reading CSV from {source}: {e}")
 
 
 if __name__ == "__main__":
@@ -96,4 +81,5 @@ if __name__ == "__main__":
         output_dir     = OUTPUT_DIR,
         allowed_formats= ALLOWED_FORMATS,
         filter_years   = FILTER_YEARS,   # ← pass None to disable filtering
+        sync           = True,
     )
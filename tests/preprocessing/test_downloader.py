@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+import pytest
+from aiohttp import web
+
+from src.preprocessing.common.blobstore import BlobStore
+from src.preprocessing.common.downloader import (DownloadJob, download_all_async, file_validators, local_response,
+                                                 partial_path)
+from src.preprocessing.common.manifest import DownloadManifest
+
+SIZE = 300 * 1024
+
+
+class StandInServer:
+    """Serves the files of a folder like the portal: validators, Range and If-Range, slowly."""
+
+    def __init__(self, root, dest):
+        self.root, self.dest = root, dest
+        self.in_flight = self.max_in_flight = 0
+        self.requests = []
+        self.part_seen = []
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        path = self.root / request.match_info["name"]
+        self.requests.append((path.name, request.headers.get("Range"), request.headers.get("If-Range")))
+        status, headers, offset = local_response(path, request.headers)
+        if status != 200 and status != 206:
+            return web.Response(status=status, headers=headers)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            response = web.StreamResponse(status=status, headers=headers)
+            await response.prepare(request)
+            data = path.read_bytes()[offset:]
+            half = len(data) // 2
+            await response.write(data[:half])
+            await asyncio.sleep(0.05)
+            # Mid-transfer the bytes are in <dest>.part only
+            target = self.dest / path.name
+            self.part_seen.append(partial_path(target).exists() and not target.exists())
+            await response.write(data[half:])
+            await response.write_eof()
+            return response
+        finally:
+            self.in_flight -= 1
+
+
+def run_download(tmp_path, server, jobs, concurrency):
+    async def main():
+        app = web.Application()
+        app.router.add_get("/{name}", server.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            return await download_all_async(
+                [DownloadJob(f"http://127.0.0.1:{port}/{name}", server.dest / name) for name in jobs],
+                concurrency=concurrency, store=BlobStore(tmp_path / "store"))
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def server(tmp_path):
+    root, dest = tmp_path / "portal", tmp_path / "raw"
+    root.mkdir()
+    dest.mkdir()
+    for i in range(6):
+        (root / f"2020_{i + 1:02d}_STATUS.7z").write_bytes(os.urandom(SIZE))
+    return StandInServer(root, dest)
+
+
+def test_bounded_concurrency_and_rename(tmp_path, server):
+    names = sorted(p.name for p in server.root.iterdir())
+    results = run_download(tmp_path, server, names, concurrency=2)
+
+    assert [r.status for r in results] == ["ok"] * len(names)
+    assert server.max_in_flight == 2
+    assert all(server.part_seen)
+    for name in names:
+        assert (server.dest / name).read_bytes() == (server.root / name).read_bytes()
+        assert not partial_path(server.dest / name).exists()
+        assert DownloadManifest(server.dest).is_complete(server.dest / name)
+
+
+def test_resume_with_range_and_if_range(tmp_path, server):
+    name = "2020_01_STATUS.7z"
+    source = server.root / name
+    etag, last_modified = file_validators(source)
+    partial_path(server.dest / name).write_bytes(source.read_bytes()[:100_000])
+    DownloadManifest(server.dest).record(name, url="", etag=etag, last_modified=last_modified, complete=False)
+
+    [result] = run_download(tmp_path, server, [name], concurrency=1)
+
+    assert server.requests == [(name, "bytes=100000-", etag)]
+    assert result.status == "ok" and result.bytes == SIZE - 100_000
+    assert (server.dest / name).read_bytes() == source.read_bytes()
+
+
+def test_stale_partial_is_replaced(tmp_path, server):
+    name = "2020_02_STATUS.7z"
+    source = server.root / name
+    partial_path(server.dest / name).write_bytes(b"x" * 100_000)
+    DownloadManifest(server.dest).record(name, url="", etag='"an-older-version"', complete=False)
+
+    [result] = run_download(tmp_path, server, [name], concurrency=1)
+
+    # If-Range does not match: the server sends the whole file and the part is rewritten
+    assert server.requests == [(name, "bytes=100000-", '"an-older-version"')]
+    assert result.status == "ok" and result.bytes == SIZE
+    assert (server.dest / name).read_bytes() == source.read_bytes()
@@ -0,0 +1,104 @@
+import struct
+import time
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from src.preprocessing.common.pgcopy import (PG_EPOCH, PGCOPY_HEADER, PGCOPY_TRAILER, encode_rows, epoch_values,
+                                             integer_values, text_values)
+from src.preprocessing.common.timestamps import TimestampParser
+
+DECODE = {"int2": "!h", "int4": "!i", "int8": "!q", "float8": "!d", "timestamptz": "!q"}
+
+
+def decode_rows(data: bytes, pg_types: list) -> list:
+    """Tuples of a binary COPY stream, None for NULL fields."""
+    assert data.startswith(PGCOPY_HEADER) and data.endswith(PGCOPY_TRAILER)
+    position, end, rows = len(PGCOPY_HEADER), len(data) - len(PGCOPY_TRAILER), []
+    while position < end:
+        (count,), position = struct.unpack_from("!h", data, position), position + 2
+        assert count == len(pg_types)
+        row = []
+        for pg_type in pg_types:
+            (length,), position = struct.unpack_from("!i", data, position), position + 4
+            if length == -1:
+                row.append(None)
+                continue
+            field = data[position:position + length]
+            position += length
+            row.append(field.decode() if pg_type == "text" else struct.unpack(DECODE[pg_type], field)[0])
+        rows.append(tuple(row))
+    assert position == end
+    return rows
+
+
+def test_empty_stream_is_header_and_trailer():
+    assert encode_rows([("int4", np.empty(0, dtype=np.int64), np.empty(0, dtype=bool))]) == \
+        PGCOPY_HEADER + PGCOPY_TRAILER
+
+
+def test_nulls_and_text():
+    counts = np.array([3, 0, 7], dtype=np.int64)
+    names = text_values(pa.array(["Sants", "NA", ""]))
+    data = encode_rows([("int4", counts, np.array([True, False, True])),
+                        ("text", names, None),
+                        ("float8", np.array([41.5, 2.25, -0.5]), np.array([False, True, True]))])
+    assert decode_rows(data, ["int4", "text", "float8"]) == [(3, "Sants", None), (None, None, 2.25),
+                                                             (7, None, -0.5)]
+
+
+def test_sliced_text_and_multibyte_values():
+    names = pa.array(["skip", "Plaça d'Espanya", None, "Gràcia"]).slice(1)
+    data = encode_rows([("text", names, None), ("int2", np.array([1, 2, 3]), np.ones(3, dtype=bool))])
+    assert decode_rows(data, ["text", "int2"]) == [("Plaça d'Espanya", 1), (None, 2), ("Gràcia", 3)]
+
+
+@pytest.mark.parametrize("pg_type, low, high", [("int2", -32768, 32767), ("int4", -2 ** 31, 2 ** 31 - 1)])
+def test_integer_range(pg_type, low, high):
+    column = pa.array([low - 1, low, 0, high, high + 1, None], pa.int64())
+    values, valid = integer_values(column, pg_type)
+    assert valid.tolist() == [False, True, True, True, False, False]
+
+    rows = decode_rows(encode_rows([(pg_type, values, valid)]), [pg_type])
+    assert rows == [(None,), (low,), (0,), (high,), (None,), (None,)]
+
+
+def test_text_integers():
+    values, valid = integer_values(pa.array(["12", "32767", "32768", "NA", "", "-1", "1.5", None]), "int2")
+    assert valid.tolist() == [True, True, False, False, False, False, False, False]
+    assert values[valid].tolist() == [12, 32767]
+
+
+def test_timestamptz_epoch_offset():
+    seconds = np.array([PG_EPOCH, 0, 1_600_000_000], dtype=np.int64)
+    data = encode_rows([("timestamptz", seconds, np.ones(3, dtype=bool))])
+    # Microseconds since 2000-01-01 UTC
+    assert decode_rows(data, ["timestamptz"]) == [(0,), (-PG_EPOCH * 1_000_000,),
+                                                  ((1_600_000_000 - PG_EPOCH) * 1_000_000,)]
+    first = len(PGCOPY_HEADER) + 2 + 4
+    assert data[first:first + 8] == bytes(8)
+
+
+@pytest.fixture
+def host_timezone(monkeypatch):
+    """A host time zone other than Barcelona's, which epoch fallbacks must not depend on."""
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_epoch_numbers_among_date_strings(host_timezone):
+    column = pa.array(["2020-01-15 10:00:00", "1579082400", "NA", None, "2020-07-01 12:00:00", "1.5790824e9"])
+    seconds, valid = epoch_values(column, TimestampParser("test.csv"))
+    assert valid.tolist() == [True, True, False, False, True, True]
+    # Date strings are Barcelona wall-clock time (CET, then CEST); numbers are instants
+    assert seconds[valid].tolist() == [1579078800, 1579082400, 1593597600, 1579082400]
+
+
+def test_epoch_column(host_timezone):
+    seconds, valid = epoch_values(pa.array(["1579082400", " 1.5790824E9 ", "NA", ""]), TimestampParser("test.csv"))
+    assert valid.tolist() == [True, True, False, False]
+    assert seconds[valid].tolist() == [1579082400, 1579082400]
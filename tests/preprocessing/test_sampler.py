@@ -0,0 +1,75 @@
+import importlib
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+sample = importlib.import_module("src.preprocessing.bicing.03_sample")
+
+
+def reference_keep(data_type, stations, seconds, parsed):
+    """The per-row sampler ``keep_chunk`` replaced: keep mask and openings."""
+    last_seen, openings, keep, kept = {}, {}, [], 0
+    for station, second, timed in zip(stations, seconds, parsed):
+        bucket = second // sample.BUCKET_SECONDS[data_type]
+        if not timed:
+            keep.append(True)
+        elif last_seen.get(station) == bucket:
+            keep.append(False)
+        else:
+            if station not in last_seen:
+                openings[station] = (bucket, kept)
+            last_seen[station] = bucket
+            keep.append(True)
+        kept += keep[-1]
+    return np.array(keep), openings, last_seen
+
+
+def random_rows(rng, n):
+    stations = rng.integers(0, 40, n)
+    # Mostly increasing with some disorder, so buckets both repeat and change back
+    seconds = np.sort(rng.integers(1_600_000_000, 1_600_000_000 + 6 * 3600, n)) + rng.integers(-900, 900, n)
+    parsed = rng.random(n) > 0.05
+    return stations, seconds, parsed
+
+
+@pytest.mark.parametrize("data_type", ["status", "information"])
+@pytest.mark.parametrize("chunk_rows", [1, 7, 1000, 5000])
+def test_keep_chunk_matches_per_row_sampler(data_type, chunk_rows):
+    stations, seconds, parsed = random_rows(np.random.default_rng(chunk_rows), 5000)
+    sampler = sample.StationSampler(data_type)
+    dense = np.array([sampler.station(str(s)) for s in stations])
+
+    keep = np.concatenate([sampler.keep_chunk(dense[i:i + chunk_rows], seconds[i:i + chunk_rows],
+                                              parsed[i:i + chunk_rows])
+                           for i in range(0, len(dense), chunk_rows)])
+
+    expected, openings, last_seen = reference_keep(data_type, [str(s) for s in stations], seconds, parsed)
+    np.testing.assert_array_equal(keep, expected)
+    assert sampler.openings == openings
+    assert sampler.state() == last_seen
+
+
+def test_station_index_grows_past_initial_array():
+    sampler = sample.StationSampler("status")
+    stations = np.array([sampler.station(str(s)) for s in range(3000)])
+    keep = sampler.keep_chunk(stations, np.zeros(3000, dtype=np.int64), np.ones(3000, dtype=bool))
+    assert keep.all()
+    assert not sampler.keep_chunk(stations, np.zeros(3000, dtype=np.int64), np.ones(3000, dtype=bool)).any()
+
+
+def test_batch_sampler_matches_per_row_sampler():
+    rng = np.random.default_rng(0)
+    stations, seconds, parsed = random_rows(rng, 3000)
+    station_ids = [None if s == 0 else str(s) for s in stations]
+    times = [str(s) if timed else "NA" for s, timed in zip(seconds, parsed)]
+    batch = pa.record_batch({"station_id": pa.array(station_ids, pa.string()), "last_updated": pa.array(times)})
+
+    batch_sampler = sample.BatchSampler("status", "test.csv")
+    kept = pa.concat_tables(pa.Table.from_batches([batch_sampler(batch.slice(i, 700))])
+                            for i in range(0, batch.num_rows, 700))
+
+    # Missing station IDs compare as ""
+    expected, _, _ = reference_keep("status", [s or "" for s in station_ids], seconds, parsed)
+    assert kept.to_pylist() == pa.Table.from_batches([batch]).filter(pa.array(expected)).to_pylist()
+    assert batch_sampler.rows_kept == int(expected.sum())
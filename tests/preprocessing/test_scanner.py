@@ -0,0 +1,71 @@
+import csv
+import io
+
+import pytest
+
+from src.preprocessing.common.scanner import CsvScanner
+
+HEADER = "station_id,name,last_updated,status\r\n"
+ROWS = [
+    ["1", "Plain", "1600000000", "IN_SERVICE"],
+    ["2", '"Comma, inside"', "1600000001", "IN_SERVICE"],
+    ["3", '"Line\nbreak"', "1600000002", '"CLOSED"'],
+    ["4", '"Doubled ""quotes"", and, commas"', "1600000003", "IN_SERVICE"],
+    ["5", '""', "", "NA"],
+    ["6", '"' + '""' * 200 + '"', "1600000005", "IN_SERVICE"],
+    ["7", "Short row"],
+]
+
+
+def csv_text(repeat: int = 20) -> str:
+    return HEADER + "".join(",".join(row) + ("\n" if i % 2 else "\r\n")
+                            for _ in range(repeat) for i, row in enumerate(ROWS))
+
+
+def expected_columns(text: str, columns: list) -> dict:
+    """The columns as csv.reader parses them, empty and absent fields as None."""
+    reader = csv.reader(io.StringIO(text, newline=""))
+    header = next(reader)
+    rows = list(reader)
+    return {c: [row[header.index(c)] or None if len(row) > header.index(c) else None for row in rows]
+            for c in columns}
+
+
+def scanned_columns(scanner: CsvScanner, columns: list) -> dict:
+    schema, batches = scanner.record_batches(columns)
+    values = {c: [] for c in schema.names}
+    for batch in batches:
+        for c in schema.names:
+            values[c] += batch.column(c).to_pylist()
+    return values
+
+
+# Small blocks put quoted fields (and the >255 quotes of row 6) across block boundaries
+@pytest.mark.parametrize("block_bytes", [5, 16, 61, 1 << 20])
+def test_mapped_file_matches_csv_reader(tmp_path, block_bytes):
+    text = csv_text()
+    path = tmp_path / "status.csv"
+    path.write_bytes(text.encode())
+    columns = ["station_id", "name", "status"]
+    with CsvScanner(path, block_bytes=block_bytes) as scanner:
+        assert scanner.header == ["station_id", "name", "last_updated", "status"]
+        assert scanned_columns(scanner, columns) == expected_columns(text, columns)
+
+
+@pytest.mark.parametrize("block_bytes", [5, 16, 61, 1 << 20])
+def test_stream_matches_csv_reader(block_bytes):
+    text = csv_text()
+    columns = ["name", "last_updated", "missing"]
+    with CsvScanner(io.BytesIO(text.encode()), block_bytes=block_bytes) as scanner:
+        assert scanned_columns(scanner, columns) == expected_columns(text, ["name", "last_updated"])
+
+
+@pytest.mark.parametrize("block_bytes", [5, 61])
+def test_raw_rows_round_trip(tmp_path, block_bytes):
+    # The last row has no newline
+    text = csv_text(5) + "8,\"Last\nrow\",1600000008,IN_SERVICE"
+    path = tmp_path / "status.csv"
+    path.write_bytes(text.encode())
+    with CsvScanner(path, block_bytes=block_bytes) as scanner:
+        body = b"".join(block.raw_rows() for block in scanner.blocks())
+    assert body == text[len(HEADER):].encode() + b"\r\n"
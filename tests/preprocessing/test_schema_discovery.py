@@ -0,0 +1,44 @@
+import os
+import zipfile
+
+from src.preprocessing.common.schema_discovery import HeaderCache
+
+
+def write_archive(path, column):
+    # The member of interest, its data and its central directory entry (with
+    # its CRC) sit far from both ends of the archive
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as z:
+        def add(name, data):
+            z.writestr(zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0)), data)
+
+        add("first.csv", "a\n" + "0" * 200_000)
+        add("middle.csv", f"{column},b\n1,2\n")
+        for i in range(2000):
+            add(f"filler/{i:05d}_{'x' * 40}.csv", "c\n")
+
+
+def test_changed_middle_member_is_read_again(tmp_path):
+    archive = tmp_path / "2020_01_STATUS.zip"
+    write_archive(archive, "x")
+    cache = HeaderCache(tmp_path)
+    assert cache.member_columns(archive)["middle.csv"] == ["x", "b"]
+    cache.save()
+
+    # Same size, same first and last bytes, later mtime
+    stat = archive.stat()
+    write_archive(archive, "y")
+    os.utime(archive, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert archive.stat().st_size == stat.st_size
+    assert HeaderCache(tmp_path).member_columns(archive, ["middle.csv"])["middle.csv"] == ["y", "b"]
+
+
+def test_unchanged_archive_is_not_reopened(tmp_path, monkeypatch):
+    archive = tmp_path / "2020_01_STATUS.zip"
+    write_archive(archive, "x")
+    cache = HeaderCache(tmp_path)
+    cache.member_columns(archive)
+    cache.save()
+
+    monkeypatch.setattr("src.preprocessing.common.schema_discovery.sha256_file", None)
+    monkeypatch.setattr("src.preprocessing.common.schema_discovery.iter_csv_members", None)
+    assert HeaderCache(tmp_path).member_columns(archive, ["middle.csv"]) == {"middle.csv": ["x", "b"]}
@@ -0,0 +1,51 @@
+import csv
+import io
+
+import pytest
+
+from src.preprocessing.common import splitting
+from src.preprocessing.common.splitting import iter_record_ranges, record_ranges
+
+HEADER = "id,name\n"
+ROWS = ["1,plain\n", '2,"two\nlines"\n', '3,"comma, and ""quotes"""\n', '4,"\n\n\n"\n', "5,last\n"]
+
+
+def write(tmp_path, rows):
+    path = tmp_path / "rows.csv"
+    path.write_text(HEADER + "".join(rows))
+    return path
+
+
+def test_small_file_is_one_range_without_scanning(tmp_path, monkeypatch):
+    path = write(tmp_path, ROWS)
+    monkeypatch.setattr(splitting, "_record_end", None)
+    assert record_ranges(path, 1 << 20) == [(len(HEADER), path.stat().st_size, path.stat().st_size - len(HEADER))]
+
+
+def test_empty_file_is_one_empty_range(tmp_path):
+    path = write(tmp_path, [])
+    assert record_ranges(path, 4) == [(len(HEADER), len(HEADER), 0)]
+
+
+@pytest.mark.parametrize("range_bytes", [1, 5, 13, 40])
+@pytest.mark.parametrize("chunk", [2, 7, 1 << 20])
+def test_ranges_end_on_record_boundaries(tmp_path, monkeypatch, range_bytes, chunk):
+    monkeypatch.setattr(splitting, "COPY_CHUNK", chunk)
+    rows = ROWS * 20
+    path = write(tmp_path, rows)
+    data = path.read_bytes()
+
+    ranges = record_ranges(path, range_bytes)
+    assert ranges[0][0] == len(HEADER) and ranges[-1][1] == len(data)
+    assert all(end == following for (_, end, _), (following, _, _) in zip(ranges, ranges[1:]))
+    # Each range parses on its own into whole rows
+    parsed = []
+    for start, end, size in ranges:
+        text = data[start:end].decode()
+        assert text.count('"') % 2 == 0
+        parsed += list(csv.reader(io.StringIO(text, newline="")))
+    assert parsed == list(csv.reader(io.StringIO("".join(rows), newline="")))
+
+    # Resuming at any boundary gives the rest of the ranges
+    for i, (start, _, _) in enumerate(ranges):
+        assert list(iter_record_ranges(path, range_bytes, start)) == ranges[i:]